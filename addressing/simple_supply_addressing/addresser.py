@@ -1,50 +1,231 @@
 import enum
+import functools
 import hashlib
+import itertools
 
 FAMILY_NAME = 'bev'
-FAMILY_VERSION = '0.1'
+
+# Version 0.2 identifies ballots with 16-byte binary IDs and records the
+# choice as the index of the voting option within its election. Addresses
+# are still derived from the hex form of the IDs, so both versions of a
+# transaction touch the same resources.
+FAMILY_VERSION = '0.2'
+LEGACY_FAMILY_VERSION = '0.1'
+FAMILY_VERSIONS = [LEGACY_FAMILY_VERSION, FAMILY_VERSION]
+
+# Length in bytes of a binary ID, the UUID hex strings packed
+ID_LENGTH = 16
 NAMESPACE = hashlib.sha512(FAMILY_NAME.encode('utf-8')).hexdigest()[:6]
+ADDRESS_LENGTH = 70
 ELECTION_PREFIX = '02'
 VOTING_OPTION_PREFIX = '03'
-POLL_REGISTRATION_PREFIX = '04'
+LEGACY_POLL_REGISTRATION_PREFIX = '04'
 VOTER_PREFIX = '05'
-VOTE_PREFIX = '06'
+LEGACY_VOTE_PREFIX = '06'
+POLL_REGISTRATION_PREFIX = '07'
+VOTE_PREFIX = '08'
+VOTE_TALLY_PREFIX = '09'
+BALLOT_INDEX_PREFIX = '10'
+ELECTION_RESULT_PREFIX = '11'
+
+# Number of addresses the vote counters of an election are split over.
+# Ballots in different shards do not conflict on the tally, so the parallel
+# scheduler can apply them together. Changing it moves every tally address.
+VOTE_TALLY_SHARDS = 16
+
+# Upper bound on the number of memoized addresses per address space. Each
+# entry costs a few hundred bytes, so the caches stay within a few megabytes.
+ADDRESS_CACHE_SIZE = 16384
 
 
 @enum.unique
 class AddressSpace(enum.IntEnum):
     ELECTION = 2
     VOTING_OPTION = 3
-    POLL_REGISTRATION = 4
+    LEGACY_POLL_REGISTRATION = 4
     VOTER = 5
-    VOTE = 6
+    LEGACY_VOTE = 6
+    POLL_REGISTRATION = 7
+    VOTE = 8
+    VOTE_TALLY = 9
+    BALLOT_INDEX = 10
+    ELECTION_RESULT = 11
 
     OTHER_FAMILY = 100
 
 
+def _make_address(prefix, identifier):
+    return NAMESPACE + prefix + hashlib.sha512(
+        identifier.encode('utf-8')).hexdigest()[:62]
+
+
+def _make_scoped_address(prefix, scope_id, identifier):
+    return _make_scope_prefix(prefix, scope_id) + hashlib.sha512(
+        identifier.encode('utf-8')).hexdigest()[:32]
+
+
+def _make_scope_prefix(prefix, scope_id):
+    return NAMESPACE + prefix + hashlib.sha512(
+        scope_id.encode('utf-8')).hexdigest()[:30]
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
 def get_election_address(election_id):
-    return NAMESPACE + ELECTION_PREFIX + hashlib.sha512(
-        election_id.encode('utf-8')).hexdigest()[:62]
+    return _make_address(ELECTION_PREFIX, election_id)
 
 
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
 def get_voting_option_address(voting_option_id):
-    return NAMESPACE + VOTING_OPTION_PREFIX + hashlib.sha512(
-        voting_option_id.encode('utf-8')).hexdigest()[:62]
+    return _make_address(VOTING_OPTION_PREFIX, voting_option_id)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_poll_registration_address(election_id, voter_id):
+    """Addresses the registration of a voter in the poll book of an
+    election. All the registrations of an election share the prefix returned
+    by get_poll_book_prefix.
+    """
+    return _make_scoped_address(
+        POLL_REGISTRATION_PREFIX, election_id, voter_id)
 
 
-def get_poll_registration_address(voter_id):
-    return NAMESPACE + POLL_REGISTRATION_PREFIX + hashlib.sha512(
-        voter_id.encode('utf-8')).hexdigest()[:62]
+def get_poll_book_prefix(election_id):
+    return _make_scope_prefix(POLL_REGISTRATION_PREFIX, election_id)
 
 
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_legacy_poll_registration_address(voter_id):
+    """Addresses the version 1 poll registration container, which holds the
+    registrations of a voter in every election. It is only read to migrate
+    its entries to the per-election addresses.
+    """
+    return _make_address(LEGACY_POLL_REGISTRATION_PREFIX, voter_id)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
 def get_voter_address(public_key):
-    return NAMESPACE + VOTER_PREFIX + hashlib.sha512(
-        public_key.encode('utf-8')).hexdigest()[:62]
+    return _make_address(VOTER_PREFIX, public_key)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_vote_address(election_id, vote_id):
+    """Addresses a ballot of an election. All the ballots of an election
+    share the prefix returned by get_election_votes_prefix, so they can be
+    listed with a single state query.
+    """
+    return _make_scoped_address(VOTE_PREFIX, election_id, vote_id)
+
+
+def get_election_votes_prefix(election_id):
+    return _make_scope_prefix(VOTE_PREFIX, election_id)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_vote_tally_address(election_id, shard):
+    """Addresses one shard of the vote counters of an election. A ballot is
+    always counted in the shard returned by get_vote_tally_shard.
+    """
+    return _make_scoped_address(
+        VOTE_TALLY_PREFIX, election_id, '{:d}'.format(shard))
+
+
+def get_vote_tally_addresses(election_id):
+    return [get_vote_tally_address(election_id, shard)
+            for shard in range(VOTE_TALLY_SHARDS)]
+
 
+def get_vote_tally_shard(vote_id):
+    return int(hashlib.sha512(
+        vote_id.encode('utf-8')).hexdigest()[:8], 16) % VOTE_TALLY_SHARDS
 
-def get_vote_address(vote_id):
-    return NAMESPACE + VOTE_PREFIX + hashlib.sha512(
-        vote_id.encode('utf-8')).hexdigest()[:62]
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_ballot_index_address(election_id, voter_id):
+    """Addresses the pointer from a voter to their ballot in an election,
+    which allows one ballot per voter to be enforced with a single read.
+    """
+    return _make_scoped_address(BALLOT_INDEX_PREFIX, election_id, voter_id)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_election_result_address(election_id):
+    """Addresses the final result of an election, written once when the
+    election is finalized and never changed afterwards.
+    """
+    return _make_address(ELECTION_RESULT_PREFIX, election_id)
+
+
+@functools.lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def get_legacy_vote_address(vote_id):
+    """Addresses the version 1 vote container, keyed by vote only. It is
+    only read to migrate its entries to the election-scoped addresses.
+    """
+    return _make_address(LEGACY_VOTE_PREFIX, vote_id)
+
+
+_GETTERS = {
+    AddressSpace.ELECTION: get_election_address,
+    AddressSpace.VOTING_OPTION: get_voting_option_address,
+    AddressSpace.POLL_REGISTRATION: get_poll_registration_address,
+    AddressSpace.LEGACY_POLL_REGISTRATION:
+        get_legacy_poll_registration_address,
+    AddressSpace.VOTER: get_voter_address,
+    AddressSpace.VOTE: get_vote_address,
+    AddressSpace.LEGACY_VOTE: get_legacy_vote_address,
+    AddressSpace.VOTE_TALLY: get_vote_tally_address,
+    AddressSpace.BALLOT_INDEX: get_ballot_index_address,
+    AddressSpace.ELECTION_RESULT: get_election_result_address,
+}
+
+# Address spaces whose addresses are derived from a (scope ID, ID) pair
+_SCOPED_SPACES = frozenset([AddressSpace.POLL_REGISTRATION,
+                            AddressSpace.VOTE,
+                            AddressSpace.VOTE_TALLY,
+                            AddressSpace.BALLOT_INDEX])
+
+_ADDRESS_SPACES = {
+    '{:02d}'.format(space): space
+    for space in AddressSpace if space != AddressSpace.OTHER_FAMILY
+}
+
+
+def get_addresses(address_space, identifiers):
+    """Derives the state addresses of many identifiers of the same type
+
+    Args:
+        address_space (AddressSpace): The type of the identifiers
+        identifiers (iterable): The IDs (or public keys) to address, as
+            tuples of IDs for the address spaces keyed by several IDs
+
+    Returns:
+        list of str: The addresses, in the same order as the identifiers
+    """
+    try:
+        getter = _GETTERS[address_space]
+    except KeyError as err:
+        raise ValueError(
+            'Unknown address space: {}'.format(address_space)) from err
+
+    if address_space in _SCOPED_SPACES:
+        return list(itertools.starmap(getter, identifiers))
+    return list(map(getter, identifiers))
+
+
+def clear_address_cache():
+    """Empties the memoized addresses of every address space
+    """
+    for getter in _GETTERS.values():
+        getter.cache_clear()
+
+
+def address_cache_info():
+    """Returns the hit/miss statistics of the memoized addresses
+
+    Returns:
+        dict: The functools cache info of each AddressSpace
+    """
+    return {space: getter.cache_info()
+            for space, getter in _GETTERS.items()}
 
 
 def get_address_type(address):
@@ -53,15 +234,23 @@ def get_address_type(address):
 
     infix = address[6:8]
 
-    if infix == '02':
-        return AddressSpace.ELECTION
-    if infix == '03':
-        return AddressSpace.VOTING_OPTION
-    if infix == '04':
-        return AddressSpace.POLL_REGISTRATION
-    if infix == '05':
-        return AddressSpace.VOTER
-    if infix == '06':
-        return AddressSpace.VOTE
-
-    return AddressSpace.OTHER_FAMILY
+    return _ADDRESS_SPACES.get(infix, AddressSpace.OTHER_FAMILY)
+
+
+def pack_id(identifier):
+    """Converts a 32 character hex ID into its 16-byte binary form
+    """
+    data = bytes.fromhex(identifier)
+    if len(data) != ID_LENGTH:
+        raise ValueError('Not a {}-byte hex ID: {}'.format(
+            ID_LENGTH, identifier))
+    return data
+
+
+def unpack_id(data):
+    """Converts a 16-byte binary ID back into its hex form
+    """
+    if len(data) != ID_LENGTH:
+        raise ValueError('Not a {}-byte binary ID: {!r}'.format(
+            ID_LENGTH, data))
+    return data.hex()
@@ -0,0 +1,144 @@
+"""Micro-benchmark of state address derivation.
+
+Replays the address lookups made for a run of transactions the way the code
+makes them today: the REST API derives every input and output address of a
+transaction, and the processor derives the signer and target addresses again
+when applying it. A handful of admins sign the poll book transactions while
+each voter signs about one ballot.
+"""
+import argparse
+import random
+import timeit
+import uuid
+
+from simple_supply_addressing import addresser
+from simple_supply_addressing.addresser import AddressSpace
+
+
+def make_workload(transactions, voters, elections, admins, seed=0):
+    """Generates the (address space, identifier) lookups of a transaction run
+
+    Args:
+        transactions (int): Number of transactions to simulate
+        voters (int): Size of the electorate
+        elections (int): Number of elections the voters are registered in
+        admins (int): Number of admins signing poll book transactions
+        seed (int): Seed of the random generator, for repeatable runs
+
+    Returns:
+        list of (AddressSpace, str): The address lookups, in request order
+    """
+    rand = random.Random(seed)
+
+    def new_id():
+        return uuid.UUID(int=rand.getrandbits(128)).hex
+
+    voters = [(new_id() * 2, new_id()) for _ in range(voters)]
+    admin_keys = [new_id() * 2 for _ in range(admins)]
+    election_ids = [new_id() for _ in range(elections)]
+
+    lookups = []
+    for _ in range(transactions):
+        if rand.random() < 0.1:
+            signer = rand.choice(admin_keys)
+            target = (AddressSpace.POLL_REGISTRATION,
+                      (rand.choice(election_ids), rand.choice(voters)[1]))
+        else:
+            signer = rand.choice(voters)[0]
+            target = (AddressSpace.VOTE,
+                      (rand.choice(election_ids), new_id()))
+
+        # REST API: transaction inputs and outputs
+        lookups.extend([(AddressSpace.VOTER, signer), target, target])
+        # Processor: signer check, then the state update
+        lookups.extend([(AddressSpace.VOTER, signer), target])
+    return lookups
+
+
+def run(lookups, repeat):
+    getters = {
+        AddressSpace.POLL_REGISTRATION:
+            addresser.get_poll_registration_address,
+        AddressSpace.VOTER: addresser.get_voter_address,
+        AddressSpace.VOTE: addresser.get_vote_address,
+    }
+    # The undecorated functions derive the address on every call
+    uncached_getters = {
+        space: getter.__wrapped__ for space, getter in getters.items()}
+    by_space = {}
+    for space, identifier in lookups:
+        by_space.setdefault(space, []).append(identifier)
+
+    def uncached():
+        for space, identifier in lookups:
+            if isinstance(identifier, tuple):
+                uncached_getters[space](*identifier)
+            else:
+                uncached_getters[space](identifier)
+
+    def cached():
+        for space, identifier in lookups:
+            if isinstance(identifier, tuple):
+                getters[space](*identifier)
+            else:
+                getters[space](identifier)
+
+    def batched():
+        for space, identifiers in by_space.items():
+            addresser.get_addresses(space, identifiers)
+
+    results = []
+    for name, func in (('uncached', uncached),
+                       ('cached', cached),
+                       ('batched', batched)):
+        best = min(timeit.repeat(
+            func,
+            setup=addresser.clear_address_cache,
+            number=1,
+            repeat=repeat))
+        infos = addresser.address_cache_info().values()
+        results.append((name,
+                        best,
+                        sum(info.hits for info in infos),
+                        sum(info.misses for info in infos)))
+    return results
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks memoized address derivation')
+    parser.add_argument(
+        '--transactions', type=int, default=100000,
+        help='number of simulated transactions')
+    parser.add_argument(
+        '--voters', type=int, default=20000,
+        help='size of the electorate')
+    parser.add_argument(
+        '--elections', type=int, default=20,
+        help='number of elections the voters are registered in')
+    parser.add_argument(
+        '--admins', type=int, default=10,
+        help='number of admins signing poll book transactions')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='runs per variant, the fastest is reported')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+    lookups = make_workload(
+        opts.transactions, opts.voters, opts.elections, opts.admins)
+    results = run(lookups, opts.repeat)
+
+    baseline = results[0][1]
+    print('{} address lookups'.format(len(lookups)))
+    for name, seconds, hits, misses in results:
+        print('{:>10}: {:8.1f} ms  {:10.0f} lookups/s  x{:.2f}  '
+              '(hits={}, misses={})'.format(
+                  name,
+                  seconds * 1000,
+                  len(lookups) / seconds,
+                  baseline / seconds,
+                  hits,
+                  misses))
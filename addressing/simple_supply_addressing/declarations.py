@@ -0,0 +1,213 @@
+"""Addresses read and written by each action of the family.
+
+The REST API declares them as the inputs and outputs of the transactions it
+builds, so that the validator scheduler only serializes transactions that
+actually touch the same state, and the processor prefetches them. Inputs
+hold every address the processor reads, including the ones it writes after
+reading the container stored there; outputs hold the addresses it may write.
+
+The declarations are those of the current family version. They also cover
+what a version 0.1 transaction of the same action touches.
+"""
+import collections
+
+from simple_supply_addressing import addresser
+from simple_supply_addressing.addresser import AddressSpace
+
+
+Declaration = collections.namedtuple('Declaration', ['inputs', 'outputs'])
+
+
+def _declare(reads, writes):
+    outputs = _unique(writes)
+    return Declaration(inputs=_unique(reads + outputs), outputs=outputs)
+
+
+def _unique(addresses):
+    seen = set()
+    return [address for address in addresses
+            if not (address in seen or seen.add(address))]
+
+
+def create_election(signer, election_id):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_election_address(election_id)])
+
+
+def create_voting_option(signer, voting_option_id, election_id):
+    # The option is appended to the ones of the election that compact
+    # ballots refer to by index
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_voting_option_address(voting_option_id),
+         addresser.get_election_address(election_id)])
+
+
+def create_poll_registration(signer, election_id, voter_id):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_poll_registration_address(election_id, voter_id)])
+
+
+def create_election_bundle(signer,
+                           election_id,
+                           voting_option_ids,
+                           voter_ids):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_election_address(election_id)] +
+        addresser.get_addresses(
+            AddressSpace.VOTING_OPTION, voting_option_ids) +
+        _poll_registration_addresses(election_id, voter_ids))
+
+
+def bulk_create_poll_registrations(signer, election_id, voter_ids):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        _poll_registration_addresses(election_id, voter_ids))
+
+
+def create_voter(signer, public_key):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_voter_address(public_key)])
+
+
+def update_voter(signer, public_key):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_voter_address(public_key)])
+
+
+def create_vote(signer,
+                election_id,
+                voter_id,
+                vote_id,
+                voting_option_ids=None):
+    """Declares a ballot. The voting options, election, poll book
+    registration and election result are read to check that the voter may
+    cast it.
+
+    Args:
+        voting_option_ids (list of str): Unique IDs of the voting options
+            picked, or None when they are only known from the election, as
+            for a compact ballot in the processor
+    """
+    reads = [
+        addresser.get_voter_address(signer),
+        addresser.get_election_address(election_id),
+        addresser.get_poll_registration_address(election_id, voter_id),
+        addresser.get_legacy_poll_registration_address(voter_id),
+        addresser.get_election_result_address(election_id),
+    ]
+    if voting_option_ids is not None:
+        reads.extend(addresser.get_addresses(
+            AddressSpace.VOTING_OPTION, voting_option_ids))
+
+    return _declare(
+        reads,
+        [addresser.get_ballot_index_address(election_id, voter_id),
+         addresser.get_vote_address(election_id, vote_id),
+         _vote_tally_address(election_id, vote_id)])
+
+
+def update_vote(signer,
+                election_id,
+                voter_id,
+                vote_id,
+                voting_option_ids=None):
+    """Declares a changed ballot. The voting options and election are read
+    to check the new choices as those of a new ballot, the election result
+    is read to check that the election was not finalized, and the legacy
+    vote address is written when a vote which has not been migrated yet
+    moves to its election-scoped address.
+
+    Args:
+        voting_option_ids (list of str): Unique IDs of the voting options
+            picked, or None when they are only known from the election, as
+            for a compact ballot in the processor
+    """
+    reads = [
+        addresser.get_voter_address(signer),
+        addresser.get_election_address(election_id),
+        addresser.get_election_result_address(election_id),
+    ]
+    if voting_option_ids is not None:
+        reads.extend(addresser.get_addresses(
+            AddressSpace.VOTING_OPTION, voting_option_ids))
+
+    return _declare(
+        reads,
+        [addresser.get_ballot_index_address(election_id, voter_id),
+         addresser.get_vote_address(election_id, vote_id),
+         addresser.get_legacy_vote_address(vote_id),
+         _vote_tally_address(election_id, vote_id)])
+
+
+def update_election(signer, election_id):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_election_address(election_id)])
+
+
+def update_voting_option(signer, voting_option_id):
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_voting_option_address(voting_option_id)])
+
+
+def update_poll_registration(signer, election_id, voter_id):
+    """Declares a poll book change. The legacy address is written when a
+    registration which has not been migrated yet moves to its per-election
+    address.
+    """
+    return _declare(
+        [addresser.get_voter_address(signer)],
+        [addresser.get_poll_registration_address(election_id, voter_id),
+         addresser.get_legacy_poll_registration_address(voter_id)])
+
+
+def finalize_election(signer, election_id):
+    """Declares the finalization of an election, which sums every shard of
+    its vote tally into the election result.
+    """
+    return _declare(
+        [addresser.get_voter_address(signer),
+         addresser.get_election_address(election_id)] +
+        addresser.get_vote_tally_addresses(election_id),
+        [addresser.get_election_result_address(election_id)])
+
+
+def count_legacy_ballots(signer, election_id, ballots):
+    """Declares the counting of ballots cast before the vote tallies
+    existed. Each vote is read at both its addresses, as it may not have
+    been migrated, and indexed so that it is never counted again.
+
+    Args:
+        ballots (list of (str, str)): The vote and voter IDs of each ballot
+    """
+    reads = [
+        addresser.get_voter_address(signer),
+        addresser.get_election_address(election_id),
+        addresser.get_election_result_address(election_id),
+    ]
+    writes = []
+    for vote_id, voter_id in ballots:
+        reads.extend([addresser.get_vote_address(election_id, vote_id),
+                      addresser.get_legacy_vote_address(vote_id)])
+        writes.extend([
+            addresser.get_ballot_index_address(election_id, voter_id),
+            _vote_tally_address(election_id, vote_id)])
+    return _declare(reads, writes)
+
+
+def _poll_registration_addresses(election_id, voter_ids):
+    return addresser.get_addresses(
+        AddressSpace.POLL_REGISTRATION,
+        [(election_id, voter_id) for voter_id in voter_ids])
+
+
+def _vote_tally_address(election_id, vote_id):
+    return addresser.get_vote_tally_address(
+        election_id, addresser.get_vote_tally_shard(vote_id))
@@ -0,0 +1,98 @@
+"""Size benchmark of the family versions.
+
+Generates the same election day with family version 0.1, where ballots
+carry 32 character hex IDs, and with version 0.2, where they carry 16-byte
+binary IDs and the index of the voting option, then applies both through
+SimpleSupplyHandler and compares the payloads sent and the state stored.
+"""
+import argparse
+import collections
+
+from simple_supply_addressing import addresser
+from simple_supply_addressing.addresser import AddressSpace
+
+from simple_supply_protobuf import payload_pb2
+
+from simple_supply_tp import throughput
+
+
+# The actions and address types the ballots are measured on
+BALLOT_ACTIONS = [
+    payload_pb2.BevPayload.CREATE_VOTE,
+    payload_pb2.BevPayload.UPDATE_VOTE,
+]
+BALLOT_SPACES = [
+    AddressSpace.VOTE,
+    AddressSpace.BALLOT_INDEX,
+    AddressSpace.ELECTION,
+]
+
+
+def measure(transactions):
+    """Applies the transactions and sums the sizes of their payloads and of
+    the state they leave behind
+
+    Returns:
+        OrderedDict: Total bytes by measurement name
+    """
+    sizes = collections.OrderedDict()
+    for action in BALLOT_ACTIONS:
+        sizes['{} payload'.format(throughput.ACTION_NAMES[action])] = sum(
+            len(transaction.payload)
+            for transaction_action, transaction in transactions
+            if transaction_action == action)
+
+    stats, context = throughput.run(transactions, latency=0)
+    for action in BALLOT_ACTIONS:
+        sizes['{} state written'.format(
+            throughput.ACTION_NAMES[action])] = stats[action][1]
+
+    for space in BALLOT_SPACES:
+        sizes['{} state'.format(space.name)] = sum(
+            len(data) for address, data in context.state.items()
+            if addresser.get_address_type(address) == space)
+    return sizes
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Compares the payload and state size of the family '
+                    'versions')
+    parser.add_argument(
+        '--voters', type=int, default=5000,
+        help='size of the electorate')
+    parser.add_argument(
+        '--elections', type=int, default=2,
+        help='number of elections every voter takes part in')
+    parser.add_argument(
+        '--options', type=int, default=4,
+        help='number of voting options of each election')
+    parser.add_argument(
+        '--change-rate', type=float, default=0.1,
+        help='share of the ballots that are changed')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+
+    results = []
+    for family_version in addresser.FAMILY_VERSIONS:
+        transactions = throughput.make_workload(
+            opts.voters,
+            opts.elections,
+            opts.options,
+            opts.change_rate,
+            family_version=family_version)
+        results.append(measure(transactions))
+
+    legacy, compact = results
+    print('{:>28} {:>12} {:>12} {:>8}'.format(
+        'bytes', addresser.LEGACY_FAMILY_VERSION,
+        addresser.FAMILY_VERSION, 'change'))
+    for name, size in legacy.items():
+        print('{:>28} {:>12} {:>12} {:>+7.1f}%'.format(
+            name,
+            size,
+            compact[name],
+            (compact[name] - size) * 100 / size if size else 0))
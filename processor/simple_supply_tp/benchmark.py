@@ -0,0 +1,158 @@
+"""Micro-benchmark of payload decoding and action dispatch.
+
+Measures what the transaction processor spends on a transaction before any
+state access: parsing the payload, finding the function that applies the
+action, and reading the action data the way the handlers do. The legacy
+variant reproduces the HasField chain of BevPayload.data and the if/elif
+chain of SimpleSupplyHandler.apply that the dispatch table replaced.
+"""
+import argparse
+import random
+import timeit
+import uuid
+
+from simple_supply_protobuf import payload_pb2
+
+from simple_supply_tp import handler
+from simple_supply_tp.payload import BevPayload
+from simple_supply_tp.payload import DATA_FIELDS
+
+
+# The branches of the legacy if/elif chains, in their original order
+_LEGACY_BRANCHES = [
+    (action, DATA_FIELDS[action], handler.ACTION_HANDLERS[action])
+    for action in (
+        payload_pb2.BevPayload.CREATE_ELECTION,
+        payload_pb2.BevPayload.CREATE_VOTING_OPTION,
+        payload_pb2.BevPayload.CREATE_POLL_REGISTRATION,
+        payload_pb2.BevPayload.CREATE_VOTER,
+        payload_pb2.BevPayload.CREATE_VOTE,
+        payload_pb2.BevPayload.UPDATE_VOTE,
+        payload_pb2.BevPayload.UPDATE_ELECTION,
+        payload_pb2.BevPayload.UPDATE_VOTER,
+        payload_pb2.BevPayload.UPDATE_VOTING_OPTION,
+        payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION,
+        payload_pb2.BevPayload.CREATE_ELECTION_BUNDLE,
+        payload_pb2.BevPayload.BULK_CREATE_POLL_REGISTRATIONS,
+    )
+]
+
+# Number of payload.data reads made by the handler of a ballot
+DATA_READS = 5
+
+
+def make_workload(transactions, seed=0):
+    """Generates serialized payloads: mostly ballots, with some ballot
+    changes and poll book updates
+
+    Args:
+        transactions (int): Number of payloads to generate
+        seed (int): Seed of the random generator, for repeatable runs
+
+    Returns:
+        list of bytes: The serialized BevPayload messages
+    """
+    rand = random.Random(seed)
+
+    def new_id():
+        return uuid.UUID(int=rand.getrandbits(128)).hex
+
+    payloads = []
+    for _ in range(transactions):
+        draw = rand.random()
+        if draw < 0.8:
+            payload = payload_pb2.BevPayload(
+                action=payload_pb2.BevPayload.CREATE_VOTE,
+                create_vote=payload_pb2.CreateVoteAction(
+                    vote_id=new_id(),
+                    timestamp=1,
+                    voter_id=new_id(),
+                    election_id=new_id(),
+                    voting_option_id=new_id()),
+                timestamp=1)
+        elif draw < 0.9:
+            payload = payload_pb2.BevPayload(
+                action=payload_pb2.BevPayload.UPDATE_VOTE,
+                update_vote=payload_pb2.UpdateVoteAction(
+                    vote_id=new_id(),
+                    timestamp=1,
+                    voting_option_id=new_id(),
+                    election_id=new_id()),
+                timestamp=1)
+        else:
+            payload = payload_pb2.BevPayload(
+                action=payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION,
+                update_poll_registration=payload_pb2.
+                UpdatePollRegistrationAction(
+                    voter_id=new_id(),
+                    name=new_id(),
+                    election_id=new_id(),
+                    status=True),
+                timestamp=1)
+        payloads.append(payload.SerializeToString())
+    return payloads
+
+
+def _legacy_data(transaction):
+    for action, field, _ in _LEGACY_BRANCHES:
+        if transaction.HasField(field) and transaction.action == action:
+            return getattr(transaction, field)
+    raise ValueError('Action does not match payload data')
+
+
+def _legacy_handler(action):
+    for branch_action, _, handle_action in _LEGACY_BRANCHES:
+        if action == branch_action:
+            return handle_action
+    raise ValueError('Unhandled action')
+
+
+def run(payloads, repeat):
+    def legacy():
+        for data in payloads:
+            transaction = payload_pb2.BevPayload()
+            transaction.ParseFromString(data)
+            _ = _legacy_handler(transaction.action)
+            for _ in range(DATA_READS):
+                _ = _legacy_data(transaction)
+
+    def table():
+        handlers = handler.ACTION_HANDLERS
+        for data in payloads:
+            payload = BevPayload(data)
+            _ = handlers[payload.action]
+            for _ in range(DATA_READS):
+                _ = payload.data
+
+    results = []
+    for name, func in (('legacy', legacy), ('table', table)):
+        best = min(timeit.repeat(func, number=1, repeat=repeat))
+        results.append((name, best))
+    return results
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks payload decoding and action dispatch')
+    parser.add_argument(
+        '--transactions', type=int, default=100000,
+        help='number of simulated transactions')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='runs per variant, the fastest is reported')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+    payloads = make_workload(opts.transactions)
+    results = run(payloads, opts.repeat)
+
+    baseline = results[0][1]
+    print('{} transactions'.format(len(payloads)))
+    for name, seconds in results:
+        print('{:>10}: {:8.1f} ms  {:6.2f} us/transaction  x{:.2f}'.format(
+            name,
+            seconds * 1000,
+            seconds * 1e6 / len(payloads),
+            baseline / seconds))
@@ -0,0 +1,241 @@
+"""Conflict analysis of the declared transaction inputs and outputs.
+
+Schedules a transaction stream the way the validator's parallel scheduler
+may: a transaction must wait for every earlier one that writes an address
+it reads or writes, or that reads an address it writes, and can otherwise
+run alongside them. The stream is split into waves of transactions that
+could run in parallel, and the address types that hold transactions back
+are reported. Namespace prefixes conflict with everything.
+
+With --check, every transaction is also applied through SimpleSupplyHandler
+with its inputs and outputs widened to the namespace, and the addresses it
+actually reads and writes are compared with the ones it declared.
+
+    simple-supply-bench conflicts [--voters N ...] [--check]
+    simple-supply-bench conflicts --log LOG [--check]
+"""
+import argparse
+import collections
+import itertools
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from simple_supply_addressing import addresser
+
+from simple_supply_tp import replay
+from simple_supply_tp import throughput
+from simple_supply_tp.handler import SimpleSupplyHandler
+from simple_supply_tp.in_memory import InMemoryContext
+from simple_supply_tp.in_memory import Transaction
+from simple_supply_tp.in_memory import TransactionHeader
+
+
+def schedule(headers):
+    """Assigns every transaction to the earliest wave it can run in without
+    reordering it with a conflicting transaction
+
+    Args:
+        headers (list): The transaction headers, in submission order
+
+    Returns:
+        list of (int, str): The wave of each transaction, counted from 0,
+            and the address that held it back, or None
+    """
+    last_read = {}
+    last_write = {}
+    # Wave that every later transaction has to follow, set by transactions
+    # declaring namespace prefixes
+    barrier = -1
+    latest = -1
+    waves = []
+
+    for header in headers:
+        prefixes = [
+            address for address in itertools.chain(
+                header.inputs, header.outputs)
+            if len(address) != addresser.ADDRESS_LENGTH]
+        if prefixes:
+            barrier = latest + 1
+            latest = barrier
+            waves.append((barrier, prefixes[0]))
+            continue
+
+        wave, blocker = barrier + 1, None
+        for address in header.inputs:
+            after = last_write.get(address, -1) + 1
+            if after > wave:
+                wave, blocker = after, address
+        for address in header.outputs:
+            after = max(last_write.get(address, -1),
+                        last_read.get(address, -1)) + 1
+            if after > wave:
+                wave, blocker = after, address
+
+        for address in header.inputs:
+            last_read[address] = max(last_read.get(address, -1), wave)
+        for address in header.outputs:
+            last_write[address] = max(last_write.get(address, -1), wave)
+        latest = max(latest, wave)
+        waves.append((wave, blocker))
+
+    return waves
+
+
+def address_type_name(address):
+    if len(address) != addresser.ADDRESS_LENGTH:
+        return 'NAMESPACE'
+    return addresser.get_address_type(address).name
+
+
+class TracingContext(InMemoryContext):
+    """InMemoryContext recording the addresses read and written"""
+
+    def __init__(self, latency=0, state=None):
+        super().__init__(latency=latency, state=state)
+        self.reads = set()
+        self.writes = set()
+
+    def get_state(self, addresses, timeout=None):
+        self.reads.update(addresses)
+        return super().get_state(addresses, timeout=timeout)
+
+    def set_state(self, entries, timeout=None):
+        self.writes.update(entries)
+        return super().set_state(entries, timeout=timeout)
+
+
+def check_declarations(transactions):
+    """Applies the transactions in order, each one allowed to touch the
+    whole namespace, and compares what they touch with their declarations
+
+    Returns:
+        OrderedDict: The number of transactions, transactions rejected,
+            undeclared reads, undeclared writes, unused inputs and unused
+            outputs of each action
+    """
+    handler = SimpleSupplyHandler()
+    context = TracingContext()
+    stats = collections.OrderedDict()
+
+    for action, transaction in transactions:
+        header = transaction.header
+        widened = Transaction(
+            header=TransactionHeader(
+                signer_public_key=header.signer_public_key,
+                family_version=header.family_version,
+                inputs=[addresser.NAMESPACE],
+                outputs=[addresser.NAMESPACE]),
+            payload=transaction.payload)
+
+        context.reads.clear()
+        context.writes.clear()
+        rejected = 0
+        try:
+            handler.apply(widened, context)
+        except InvalidTransaction:
+            rejected = 1
+
+        inputs = set(header.inputs)
+        outputs = set(header.outputs)
+        counts = (
+            1,
+            rejected,
+            len(_undeclared(context.reads, inputs)),
+            len(_undeclared(context.writes, outputs)),
+            len(inputs - context.reads),
+            len(outputs - context.writes),
+        )
+        stats[action] = [
+            total + count
+            for total, count in zip(stats.get(action, [0] * 6), counts)]
+
+    return stats
+
+
+def _undeclared(addresses, declared):
+    prefixes = [address for address in declared
+                if len(address) != addresser.ADDRESS_LENGTH]
+    return [address for address in addresses
+            if address not in declared
+            and not any(address.startswith(prefix) for prefix in prefixes)]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Reports which transactions of a stream could be '
+                    'scheduled in parallel')
+    parser.add_argument(
+        '--log',
+        help='analyse the transactions of a log written by --record or '
+             'replay import instead of a generated election day')
+    parser.add_argument(
+        '--voters', type=int, default=5000,
+        help='size of the electorate')
+    parser.add_argument(
+        '--elections', type=int, default=2,
+        help='number of elections every voter takes part in')
+    parser.add_argument(
+        '--options', type=int, default=4,
+        help='number of voting options of each election')
+    parser.add_argument(
+        '--change-rate', type=float, default=0.1,
+        help='share of the ballots that are changed')
+    parser.add_argument(
+        '--choices', type=int, default=1,
+        help='number of voting options every ballot picks')
+    parser.add_argument(
+        '--check', action='store_true',
+        help='check the declarations against the addresses the handler '
+             'touches, and fail on undeclared ones')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+    if opts.log:
+        transactions = replay.load(opts.log)
+    else:
+        transactions = throughput.make_workload(
+            opts.voters,
+            opts.elections,
+            opts.options,
+            opts.change_rate,
+            choices=opts.choices)
+
+    waves = schedule(transaction.header for _, transaction in transactions)
+    widths = collections.Counter(wave for wave, _ in waves)
+    print('{} transactions in {} waves, {} in the widest, {:.1f} on '
+          'average'.format(
+              len(transactions),
+              len(widths),
+              max(widths.values()) if widths else 0,
+              len(transactions) / len(widths) if widths else 0))
+
+    held_back = collections.Counter(
+        (throughput.ACTION_NAMES.get(action, 'UNDECODABLE'),
+         address_type_name(blocker))
+        for (action, _), (_, blocker) in zip(transactions, waves)
+        if blocker is not None)
+    print('{:>30} {:>18} {:>8}'.format(
+        'held back', 'by address type', 'count'))
+    for (action_name, type_name), count in held_back.most_common():
+        print('{:>30} {:>18} {:>8}'.format(action_name, type_name, count))
+
+    if not opts.check:
+        return 0
+
+    stats = check_declarations(transactions)
+    print()
+    print('{:>30} {:>7} {:>8} {:>11} {:>11} {:>9} {:>9}'.format(
+        'action', 'count', 'rejected', 'undeclared', 'undeclared',
+        'unused', 'unused'))
+    print('{:>30} {:>7} {:>8} {:>11} {:>11} {:>9} {:>9}'.format(
+        '', '', '', 'reads', 'writes', 'inputs', 'outputs'))
+    for action, counts in stats.items():
+        print('{:>30} {:>7} {:>8} {:>11} {:>11} {:>9} {:>9}'.format(
+            throughput.ACTION_NAMES.get(action, 'UNDECODABLE'), *counts))
+
+    if any(counts[2] or counts[3] for counts in stats.values()):
+        print('Transactions touch addresses they do not declare')
+        return 1
+    return 0
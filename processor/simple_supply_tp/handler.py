@@ -1,17 +1,23 @@
-import datetime
+import logging
 import time
 
 from sawtooth_sdk.processor.handler import TransactionHandler
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
 from simple_supply_addressing import addresser
+from simple_supply_addressing import declarations
 
+from simple_supply_protobuf import election_pb2
 from simple_supply_protobuf import payload_pb2
 
+from simple_supply_validation import validator
+
+from simple_supply_tp import metrics
 from simple_supply_tp.payload import BevPayload
 from simple_supply_tp.state import SimpleSupplyState
 
-SYNC_TOLERANCE = 60 * 5
+LOGGER = logging.getLogger(__name__)
+
 MAX_LAT = 90 * 1e6
 MIN_LAT = -90 * 1e6
 MAX_LNG = 180 * 1e6
@@ -26,71 +32,50 @@ class SimpleSupplyHandler(TransactionHandler):
 
     @property
     def family_versions(self):
-        return [addresser.FAMILY_VERSION]
+        return addresser.FAMILY_VERSIONS
 
     @property
     def namespaces(self):
         return [addresser.NAMESPACE]
 
     def apply(self, transaction, context):
-        header = transaction.header
-        payload = BevPayload(transaction.payload)
+        start = time.perf_counter()
+        payload = BevPayload(
+            transaction.payload, transaction.header.family_version)
+        action = _ACTION_NAMES.get(payload.action, 'unknown')
+
+        try:
+            self._apply(transaction.header, payload, context)
+        except InvalidTransaction as err:
+            metrics.TRANSACTIONS.inc(action, 'invalid')
+            metrics.INVALID_TRANSACTIONS.inc(
+                action, metrics.rejection_reason(err))
+            raise
+        finally:
+            metrics.APPLY_LATENCY.observe(time.perf_counter() - start, action)
+
+        metrics.TRANSACTIONS.inc(action, 'ok')
+
+    def _apply(self, header, payload, context):
         state = SimpleSupplyState(context)
 
-        _validate_timestamp(payload.timestamp)
-
-        if payload.action == payload_pb2.BevPayload.CREATE_ELECTION:
-            _create_election(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.CREATE_VOTING_OPTION:
-            _create_voting_option(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.CREATE_POLL_REGISTRATION:
-            _create_poll_registration(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.CREATE_VOTER:
-            _create_voter(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.CREATE_VOTE:
-            _create_vote(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.UPDATE_VOTE:
-            _update_vote(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.UPDATE_ELECTION:
-            _update_election(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.UPDATE_VOTER:
-            _update_voter(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.UPDATE_VOTING_OPTION:
-            _update_voting_option(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        elif payload.action == payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION:
-            _update_poll_registration(
-                state=state,
-                public_key=header.signer_public_key,
-                payload=payload)
-        else:
-            raise InvalidTransaction('Unhandled action')
+        # The same checks as the REST API runs before signing, for payloads
+        # sent by any other client
+        try:
+            validator.validate_payload(payload.message, payload.family_version)
+        except validator.ValidationError as err:
+            raise InvalidTransaction(str(err)) from err
+
+        # Every address the transaction may read is fetched at once, and the
+        # writes are sent back together once the action has been applied
+        state.prefetch(header.inputs)
+
+        ACTION_HANDLERS[payload.action](
+            state=state,
+            public_key=header.signer_public_key,
+            payload=payload)
+
+        state.flush()
 
 
 def _create_election(state, public_key, payload):
@@ -109,7 +94,10 @@ def _create_election(state, public_key, payload):
         can_show_realtime=payload.data.can_show_realtime,
         admin_id=payload.data.admin_id,
         status=payload.data.status,
-        timestamp=payload.timestamp
+        timestamp=payload.timestamp,
+        multiple_options_criteria=payload.data.multiple_options_criteria,
+        multiple_options_value_min=payload.data.multiple_options_value_min,
+        multiple_options_value_max=payload.data.multiple_options_value_max
     )
 
 
@@ -126,6 +114,13 @@ def _create_voting_option(state, public_key, payload):
         status=payload.data.status
     )
 
+    # Ballots of version 0.2 refer to the option by its index in the election
+    if payload.compact:
+        state.add_election_voting_option(
+            election_id=payload.data.election_id,
+            voting_option_uuid=addresser.pack_id(
+                payload.data.voting_option_id))
+
 
 def _create_poll_registration(state, public_key, payload):
     if state.get_voter(public_key) is None:
@@ -140,6 +135,63 @@ def _create_poll_registration(state, public_key, payload):
     )
 
 
+def _create_election_bundle(state, public_key, payload):
+    if state.get_voter(public_key) is None:
+        raise InvalidTransaction('Voter with the public key {} does '
+                                 'not exist'.format(public_key))
+
+    election = payload.data.election
+    state.set_election(
+        election_id=election.election_id,
+        name=election.name,
+        description=election.description,
+        start_timestamp=election.start_timestamp,
+        end_timestamp=election.end_timestamp,
+        results_permission=election.results_permission,
+        can_change_vote=election.can_change_vote,
+        can_show_realtime=election.can_show_realtime,
+        admin_id=election.admin_id,
+        status=election.status,
+        timestamp=payload.timestamp,
+        voting_option_uuids=[
+            addresser.pack_id(voting_option.voting_option_id)
+            for voting_option in payload.data.voting_options
+        ] if payload.compact else (),
+        multiple_options_criteria=election.multiple_options_criteria,
+        multiple_options_value_min=election.multiple_options_value_min,
+        multiple_options_value_max=election.multiple_options_value_max
+    )
+
+    for voting_option in payload.data.voting_options:
+        state.set_voting_option(
+            voting_option_id=voting_option.voting_option_id,
+            name=voting_option.name,
+            description=voting_option.description,
+            election_id=voting_option.election_id,
+            status=voting_option.status
+        )
+
+    _set_poll_registrations(state, payload.data.poll_registrations)
+
+
+def _bulk_create_poll_registrations(state, public_key, payload):
+    if state.get_voter(public_key) is None:
+        raise InvalidTransaction('Voter with the public key {} does '
+                                 'not exist'.format(public_key))
+
+    _set_poll_registrations(state, payload.data.poll_registrations)
+
+
+def _set_poll_registrations(state, poll_registrations):
+    for poll_registration in poll_registrations:
+        state.set_poll_registration(
+            voter_id=poll_registration.voter_id,
+            name=poll_registration.name,
+            election_id=poll_registration.election_id,
+            status=poll_registration.status
+        )
+
+
 def _create_voter(state, public_key, payload):
     if state.get_voter(public_key):
         raise InvalidTransaction('Voter with the public key {} already '
@@ -165,30 +217,314 @@ def _update_voter(state, public_key, payload):
 
 
 def _create_vote(state, public_key, payload):
-    if state.get_voter(public_key) is None:
+    vote_id, election_id = _get_ballot_ids(payload)
+    voter_id = payload.data.voter_id
+
+    # Everything the eligibility checks and the ballot touch is read in a
+    # single request, even when the transaction inputs are namespaces. The
+    # voting options of a version 0.2 ballot are only known from the election.
+    state.prefetch(declarations.create_vote(
+        public_key,
+        election_id,
+        voter_id,
+        vote_id,
+        None if payload.compact else _get_ballot_voting_option_ids(
+            payload, None)).inputs)
+
+    voter = state.get_voter(public_key)
+    if voter is None:
         raise InvalidTransaction('Voter with the public key {} does '
                                  'not exist'.format(public_key))
 
+    if voter.voter_id != voter_id:
+        raise InvalidTransaction('Voter with the public key {} cannot '
+                                 'vote as {}'.format(public_key, voter_id))
+
+    election = state.get_election(election_id)
+    if election is None or not election.status:
+        raise InvalidTransaction('Election with the election id {} does '
+                                 'not exist or is cancelled'.format(
+                                     election_id))
+
+    voting_option_ids = _get_ballot_voting_option_ids(payload, election)
+    _check_ballot_choices(state, election, voting_option_ids)
+
+    if not election.start_timestamp <= payload.timestamp \
+            <= election.end_timestamp:
+        raise InvalidTransaction('Election with the election id {} is not '
+                                 'open at {}'.format(election_id,
+                                                     payload.timestamp))
+
+    _check_not_finalized(state, election_id)
+
+    poll_registration = state.get_poll_registration(election_id, voter_id)
+    if poll_registration is None or not poll_registration.status:
+        raise InvalidTransaction('Voter {} is not registered in the poll '
+                                 'book of the election {}'.format(
+                                     voter_id, election_id))
+
+    # A ballot cast before the index existed is addressed by its vote ID
+    # alone, so it cannot be found from its voter here. The REST API refuses
+    # a second ballot from its stored votes until COUNT_LEGACY_BALLOTS
+    # indexes the first.
+    if state.get_ballot_vote_id(election_id, voter_id) is not None:
+        raise InvalidTransaction('Voter {} already voted in the election '
+                                 '{}'.format(voter_id, election_id))
+
+    state.set_ballot_index(
+        election_id, voter_id, vote_id, compact=payload.compact)
+
     state.set_vote(
-        vote_id=payload.data.vote_id,
+        vote_id=vote_id,
         timestamp=payload.data.timestamp,
-        voter_id=payload.data.voter_id,
-        election_id=payload.data.election_id,
-        voting_option_id=payload.data.voting_option_id
+        voter_id=voter_id,
+        election_id=election_id,
+        voting_option_ids=voting_option_ids,
+        voting_option_indexes=_get_ballot_voting_option_indexes(payload)
+    )
+
+    state.update_vote_tally(
+        election_id=election_id,
+        vote_id=vote_id,
+        removed_voting_option_ids=[],
+        added_voting_option_ids=voting_option_ids,
+        new_ballot=True
     )
 
 
 def _update_vote(state, public_key, payload):
-    if state.get_voter(public_key) is None:
+    vote_id, election_id = _get_ballot_ids(payload)
+
+    voter = state.get_voter(public_key)
+    if voter is None:
         raise InvalidTransaction('Voter with the public key {} does '
                                  'not exist'.format(public_key))
 
-    state.update_vote(
-        vote_id=payload.data.vote_id,
+    # A changed ballot is checked as a new one, so everything the checks
+    # read is fetched in a single request as for a new ballot
+    state.prefetch(declarations.update_vote(
+        public_key,
+        election_id,
+        voter.voter_id,
+        vote_id,
+        None if payload.compact else _get_ballot_voting_option_ids(
+            payload, None)).inputs)
+
+    # The election resolves the option indexes and holds the number of
+    # options a ballot may pick
+    election = state.get_election(election_id)
+    if election is None or not election.status:
+        raise InvalidTransaction('Election with the election id {} does '
+                                 'not exist or is cancelled'.format(
+                                     election_id))
+
+    if not election.can_change_vote:
+        raise InvalidTransaction('Election with the election id {} does '
+                                 'not allow changing votes'.format(
+                                     election_id))
+
+    if not election.start_timestamp <= payload.timestamp \
+            <= election.end_timestamp:
+        raise InvalidTransaction('Election with the election id {} is not '
+                                 'open at {}'.format(election_id,
+                                                     payload.timestamp))
+
+    _check_not_finalized(state, election_id)
+
+    voting_option_ids = _get_ballot_voting_option_ids(payload, election)
+    _check_ballot_choices(state, election, voting_option_ids)
+
+    # The ballot index of the voter names the only ballot they may change
+    ballot_vote_id = state.get_ballot_vote_id(election_id, voter.voter_id)
+    counted = ballot_vote_id is not None
+    if not counted:
+        # Ballots cast before the index and the tallies existed are indexed
+        # and counted when changed
+        vote = state.get_vote(election_id, vote_id)
+        if vote is None or vote.voter_id != voter.voter_id:
+            raise InvalidTransaction('Voter {} has no ballot {} in the '
+                                     'election {}'.format(voter.voter_id,
+                                                          vote_id,
+                                                          election_id))
+        state.set_ballot_index(
+            election_id, voter.voter_id, vote_id, compact=payload.compact)
+    elif ballot_vote_id != vote_id:
+        raise InvalidTransaction('Voter {} has no ballot {} in the '
+                                 'election {}'.format(voter.voter_id,
+                                                      vote_id,
+                                                      election_id))
+
+    previous_vote = state.update_vote(
+        vote_id=vote_id,
+        election_id=election_id,
         timestamp=payload.data.timestamp,
-        voting_option_id=payload.data.voting_option_id
+        voting_option_ids=voting_option_ids,
+        voting_option_indexes=_get_ballot_voting_option_indexes(payload)
     )
 
+    if previous_vote is None:
+        raise InvalidTransaction('Vote with the vote id {} does '
+                                 'not exist'.format(vote_id))
+
+    if not counted:
+        state.update_vote_tally(
+            election_id=election_id,
+            vote_id=vote_id,
+            removed_voting_option_ids=[],
+            added_voting_option_ids=voting_option_ids,
+            new_ballot=True
+        )
+        return
+
+    previous_voting_option_ids = _get_vote_voting_option_ids(
+        previous_vote, election)
+    removed_voting_option_ids = [
+        voting_option_id for voting_option_id in previous_voting_option_ids
+        if voting_option_id not in voting_option_ids]
+    added_voting_option_ids = [
+        voting_option_id for voting_option_id in voting_option_ids
+        if voting_option_id not in previous_voting_option_ids]
+    if removed_voting_option_ids or added_voting_option_ids:
+        state.update_vote_tally(
+            election_id=election_id,
+            vote_id=vote_id,
+            removed_voting_option_ids=removed_voting_option_ids,
+            added_voting_option_ids=added_voting_option_ids
+        )
+
+
+def _count_legacy_ballots(state, public_key, payload):
+    if state.get_voter(public_key) is None:
+        raise InvalidTransaction('Voter with the public key {} does '
+                                 'not exist'.format(public_key))
+
+    election_id = payload.data.election_id
+    election = state.get_election(election_id)
+    if election is None:
+        raise InvalidTransaction('Election with the election id {} does '
+                                 'not exist'.format(election_id))
+
+    _check_not_finalized(state, election_id)
+
+    for ballot in payload.data.ballots:
+        # Every ballot counted in the tallies is indexed, so a ballot
+        # counted meanwhile is left as it is
+        ballot_vote_id = state.get_ballot_vote_id(election_id, ballot.voter_id)
+        if ballot_vote_id is not None:
+            if ballot_vote_id != ballot.vote_id:
+                LOGGER.warning('Voter %s has a second ballot %s in the '
+                               'election %s, which is not counted',
+                               ballot.voter_id, ballot.vote_id, election_id)
+            continue
+
+        vote = state.get_vote(election_id, ballot.vote_id)
+        if vote is None or vote.voter_id != ballot.voter_id \
+                or not vote.vote_uuid and vote.election_id != election_id:
+            raise InvalidTransaction('Voter {} has no ballot {} in the '
+                                     'election {}'.format(ballot.voter_id,
+                                                          ballot.vote_id,
+                                                          election_id))
+
+        state.set_ballot_index(election_id, ballot.voter_id, ballot.vote_id)
+        state.update_vote_tally(
+            election_id=election_id,
+            vote_id=ballot.vote_id,
+            removed_voting_option_ids=[],
+            added_voting_option_ids=_get_vote_voting_option_ids(
+                vote, election),
+            new_ballot=True
+        )
+
+
+def _check_not_finalized(state, election_id):
+    # The result of a finalized election is final, so its ballots can no
+    # longer be cast or changed
+    if state.get_election_result(election_id) is not None:
+        raise InvalidTransaction('Election with the election id {} is '
+                                 'finalized'.format(election_id))
+
+
+def _get_ballot_ids(payload):
+    """Returns the vote and election IDs of a ballot, in their hex form for
+    both family versions
+    """
+    if not payload.compact:
+        return payload.data.vote_id, payload.data.election_id
+    return (addresser.unpack_id(payload.data.vote_uuid),
+            addresser.unpack_id(payload.data.election_uuid))
+
+
+def _get_ballot_voting_option_ids(payload, election):
+    """Returns the IDs of the voting options a ballot picks. A ballot with a
+    single choice sends it in the fields it had before multi-choice ballots.
+    """
+    if not payload.compact:
+        return list(payload.data.voting_option_ids) \
+            or [payload.data.voting_option_id]
+    return [_get_voting_option_id_at(election, voting_option_index)
+            for voting_option_index in
+            _get_ballot_voting_option_indexes(payload)]
+
+
+def _get_ballot_voting_option_indexes(payload):
+    if not payload.compact:
+        return None
+    return list(payload.data.voting_option_indexes) \
+        or [payload.data.voting_option_index]
+
+
+def _get_vote_voting_option_ids(vote, election):
+    if not vote.vote_uuid:
+        return list(vote.voting_option_ids) or [vote.voting_option_id]
+    return [_get_voting_option_id_at(election, voting_option_index)
+            for voting_option_index in
+            list(vote.voting_option_indexes) or [vote.voting_option_index]]
+
+
+def _check_ballot_choices(state, election, voting_option_ids):
+    _check_ballot_size(election, voting_option_ids)
+    for voting_option_id in voting_option_ids:
+        voting_option = state.get_voting_option(voting_option_id)
+        if voting_option is None or not voting_option.status \
+                or voting_option.election_id != election.election_id:
+            raise InvalidTransaction('Voting option {} is not available in '
+                                     'the election {}'.format(
+                                         voting_option_id,
+                                         election.election_id))
+
+
+def _check_ballot_size(election, voting_option_ids):
+    count = len(voting_option_ids)
+    criteria = election.multiple_options_criteria
+    value_min = election.multiple_options_value_min
+    value_max = election.multiple_options_value_max
+    if criteria == election_pb2.Election.NONE:
+        allowed = count == 1
+    elif criteria == election_pb2.Election.AT_LEAST:
+        allowed = count >= value_min
+    elif criteria == election_pb2.Election.EQUAL_TO:
+        allowed = count == value_min
+    elif criteria == election_pb2.Election.AT_MOST:
+        allowed = count <= value_max
+    else:
+        allowed = value_min <= count <= value_max
+
+    if count == 0 or not allowed:
+        raise InvalidTransaction('Election with the election id {} does not '
+                                 'accept ballots picking {} voting '
+                                 'options'.format(election.election_id,
+                                                  count))
+
+
+def _get_voting_option_id_at(election, voting_option_index):
+    if voting_option_index >= len(election.voting_option_uuids):
+        raise InvalidTransaction('Election with the election id {} has no '
+                                 'voting option {}'.format(
+                                     election.election_id,
+                                     voting_option_index))
+    return addresser.unpack_id(
+        election.voting_option_uuids[voting_option_index])
+
 
 def _update_election(state, public_key, payload):
     if state.get_voter(public_key) is None:
@@ -206,7 +542,10 @@ def _update_election(state, public_key, payload):
         can_show_realtime=payload.data.can_show_realtime,
         admin_id=payload.data.admin_id,
         status=payload.data.status,
-        timestamp=payload.timestamp
+        timestamp=payload.timestamp,
+        multiple_options_criteria=payload.data.multiple_options_criteria,
+        multiple_options_value_min=payload.data.multiple_options_value_min,
+        multiple_options_value_max=payload.data.multiple_options_value_max
     )
 
 
@@ -237,17 +576,65 @@ def _update_poll_registration(state, public_key, payload):
     )
 
 
-def _validate_timestamp(timestamp):
-    """Validates that the client submitted timestamp for a transaction is not
-    greater than current time, within a tolerance defined by SYNC_TOLERANCE
+def _finalize_election(state, public_key, payload):
+    voter = state.get_voter(public_key)
+    if voter is None:
+        raise InvalidTransaction('Voter with the public key {} does '
+                                 'not exist'.format(public_key))
 
-    NOTE: Timestamp validation can be challenging since the machines that are
-    submitting and validating transactions may have different system times
-    """
-    dts = datetime.datetime.utcnow()
-    current_time = round(time.mktime(dts.timetuple()) + dts.microsecond / 1e6)
-    if (timestamp - current_time) > SYNC_TOLERANCE:
-        raise InvalidTransaction(
-            'Timestamp must be less than local time.'
-            ' Expected {0} in ({1}-{2}, {1}+{2})'.format(
-                timestamp, current_time, SYNC_TOLERANCE))
+    election_id = payload.data.election_id
+    election = state.get_election(election_id)
+    if election is None:
+        raise InvalidTransaction('Election with the election id {} does '
+                                 'not exist'.format(election_id))
+
+    if voter.voter_id != election.admin_id:
+        raise InvalidTransaction('Voter {} is not the admin of the election '
+                                 '{}'.format(voter.voter_id, election_id))
+
+    # A timestamp may be up to SYNC_TOLERANCE ahead of the validator's
+    # clock, which would otherwise let the voting window be cut short
+    if payload.timestamp <= election.end_timestamp + validator.SYNC_TOLERANCE:
+        raise InvalidTransaction('Election with the election id {} has not '
+                                 'ended at {}'.format(election_id,
+                                                      payload.timestamp))
+
+    if state.get_election_result(election_id) is not None:
+        raise InvalidTransaction('Election with the election id {} is '
+                                 'already finalized'.format(election_id))
+
+    num_votes, num_ballots = state.get_vote_counts(election_id)
+    state.set_election_result(
+        election_id=election_id,
+        num_votes=num_votes,
+        num_ballots=num_ballots,
+        finalized_at=payload.timestamp)
+
+
+# The function that applies each action, looked up once per transaction
+# instead of comparing the action against every branch
+ACTION_HANDLERS = {
+    payload_pb2.BevPayload.CREATE_ELECTION: _create_election,
+    payload_pb2.BevPayload.CREATE_VOTING_OPTION: _create_voting_option,
+    payload_pb2.BevPayload.CREATE_POLL_REGISTRATION:
+        _create_poll_registration,
+    payload_pb2.BevPayload.CREATE_VOTER: _create_voter,
+    payload_pb2.BevPayload.CREATE_VOTE: _create_vote,
+    payload_pb2.BevPayload.UPDATE_VOTE: _update_vote,
+    payload_pb2.BevPayload.UPDATE_ELECTION: _update_election,
+    payload_pb2.BevPayload.UPDATE_VOTER: _update_voter,
+    payload_pb2.BevPayload.UPDATE_VOTING_OPTION: _update_voting_option,
+    payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION:
+        _update_poll_registration,
+    payload_pb2.BevPayload.CREATE_ELECTION_BUNDLE: _create_election_bundle,
+    payload_pb2.BevPayload.BULK_CREATE_POLL_REGISTRATIONS:
+        _bulk_create_poll_registrations,
+    payload_pb2.BevPayload.FINALIZE_ELECTION: _finalize_election,
+    payload_pb2.BevPayload.COUNT_LEGACY_BALLOTS: _count_legacy_ballots,
+}
+
+# The label of each action in the metrics
+_ACTION_NAMES = {
+    action: name.lower()
+    for name, action in payload_pb2.BevPayload.Action.items()
+}
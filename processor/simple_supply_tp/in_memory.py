@@ -0,0 +1,71 @@
+import collections
+import time
+
+
+StateEntry = collections.namedtuple('StateEntry', ['address', 'data'])
+
+TransactionHeader = collections.namedtuple(
+    'TransactionHeader',
+    ['signer_public_key', 'family_version', 'inputs', 'outputs'])
+
+# The parts of a sawtooth_sdk TpProcessRequest that the handler reads
+Transaction = collections.namedtuple('Transaction', ['header', 'payload'])
+
+
+class InMemoryContext(object):
+    """Stands in for the sawtooth_sdk Context so that transactions can be
+    applied by SimpleSupplyHandler without a validator. State is a dict,
+    and every round trip to the validator can be slowed down by a fixed
+    latency.
+
+    Args:
+        latency (float): Seconds each get_state and set_state call waits
+            before it is served
+        state (dict): The initial state, as bytes by address
+    """
+
+    def __init__(self, latency=0, state=None):
+        self._latency = latency
+        self._state = dict(state or {})
+        self.get_calls = 0
+        self.set_calls = 0
+        self.bytes_written = 0
+
+    @property
+    def state(self):
+        return self._state
+
+    def get_state(self, addresses, timeout=None):
+        """Returns the entries of the addresses that hold data, like the
+        validator does
+        """
+        self.get_calls += 1
+        self._wait()
+        return [StateEntry(address=address, data=self._state[address])
+                for address in addresses if self._state.get(address)]
+
+    def set_state(self, entries, timeout=None):
+        self.set_calls += 1
+        self._wait()
+        for address, data in entries.items():
+            self._state[address] = data
+            self.bytes_written += len(data)
+        return list(entries)
+
+    def delete_state(self, addresses, timeout=None):
+        self.set_calls += 1
+        self._wait()
+        deleted = [address for address in addresses if address in self._state]
+        for address in deleted:
+            del self._state[address]
+        return deleted
+
+    def add_event(self, event_type, attributes=None, data=None, timeout=None):
+        pass
+
+    def add_receipt_data(self, data, timeout=None):
+        pass
+
+    def _wait(self):
+        if self._latency:
+            time.sleep(self._latency)
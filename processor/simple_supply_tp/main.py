@@ -1,10 +1,34 @@
 import argparse
+import logging
+import multiprocessing
+import os
+import signal
 import sys
+import time
 
 from sawtooth_sdk.processor.core import TransactionProcessor
 from sawtooth_sdk.processor.log import init_console_logging
 
+from simple_supply_tp import metrics
 from simple_supply_tp.handler import SimpleSupplyHandler
+from simple_supply_tp.transaction_log import RecordingHandler
+from simple_supply_tp.transaction_log import TransactionLogWriter
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds between checks of the workers, and before a crashed worker is
+# started again
+SUPERVISE_INTERVAL = 1
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 30
+
+# A worker that ran for this many seconds before crashing is restarted
+# after RESTART_DELAY again instead of the backed-off delay
+STABLE_UPTIME = 60
+
+# Seconds given to the workers to unregister before they are killed
+SHUTDOWN_TIMEOUT = 10
 
 
 def parse_args(args):
@@ -22,6 +46,33 @@ def parse_args(args):
         default=0,
         help='Increase output sent to stderr')
 
+    parser.add_argument(
+        '-w', '--workers',
+        type=int,
+        default=1,
+        help='Number of processor processes to register with the\n'
+             'validator. With more than one, this process supervises\n'
+             'them and restarts any that crash')
+
+    parser.add_argument(
+        '--metrics-port',
+        type=int,
+        help='Serve the processor metrics in the Prometheus text\n'
+             'format on this port. With more than one worker, worker\n'
+             'N serves its own metrics on this port + N')
+
+    parser.add_argument(
+        '--metrics-host',
+        default='127.0.0.1',
+        help='Interface the metrics endpoint listens on')
+
+    parser.add_argument(
+        '--record',
+        metavar='LOG',
+        help='Append every transaction received to this log, to be\n'
+             'replayed with simple-supply-bench replay. Worker N\n'
+             'writes to LOG.N')
+
     return parser.parse_args(args)
 
 
@@ -29,12 +80,27 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     opts = parse_args(args)
+
+    if opts.workers > 1:
+        init_console_logging(verbose_level=opts.verbose)
+        supervise_workers(opts)
+        return
+
+    # SIGTERM is handled like an interrupt, so the processor unregisters
+    # and the transaction log is closed
+    signal.signal(signal.SIGTERM, _interrupt)
+
     processor = None
+    log = None
     try:
         init_console_logging(verbose_level=opts.verbose)
+        start_metrics_server(opts)
 
         processor = TransactionProcessor(url=opts.connect)
         handler = SimpleSupplyHandler()
+        if opts.record:
+            log = TransactionLogWriter(opts.record)
+            handler = RecordingHandler(handler, log)
         processor.add_handler(handler)
         processor.start()
     except KeyboardInterrupt:
@@ -44,3 +110,153 @@ def main(args=None):
     finally:
         if processor is not None:
             processor.stop()
+        if log is not None:
+            log.close()
+
+
+def supervise_workers(opts):
+    """Runs opts.workers transaction processors in child processes until
+    SIGINT or SIGTERM is received. A worker that exits while the pool is
+    running is started again, waiting longer after each quick crash.
+    """
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    workers = {}
+    for worker_id in range(opts.workers):
+        workers[worker_id] = _Worker(worker_id, opts)
+        workers[worker_id].start()
+
+    LOGGER.info('Started %s transaction processor workers', opts.workers)
+
+    while not stopping:
+        time.sleep(SUPERVISE_INTERVAL)
+        for worker in workers.values():
+            if worker.is_alive() or stopping:
+                continue
+            if worker.restart_at is None:
+                worker.crashed()
+            elif time.time() >= worker.restart_at:
+                worker.start()
+
+    LOGGER.info('Stopping transaction processor workers')
+    for worker in workers.values():
+        worker.terminate()
+
+    deadline = time.time() + SHUTDOWN_TIMEOUT
+    for worker in workers.values():
+        worker.join(max(0, deadline - time.time()))
+        if worker.is_alive():
+            LOGGER.warning('Killing unresponsive %s', worker.name)
+            worker.kill()
+
+
+class _Worker(object):
+    """A transaction processor child process that can be started again
+    after it exits
+    """
+
+    def __init__(self, worker_id, opts):
+        self.name = 'worker-{}'.format(worker_id)
+        self.restart_at = None
+        self._worker_id = worker_id
+        self._opts = opts
+        self._process = None
+        self._started_at = None
+        self._restart_delay = RESTART_DELAY
+
+    def start(self):
+        self._process = multiprocessing.Process(
+            target=_run_worker,
+            args=(self._worker_id, self._opts),
+            name=self.name)
+        self._process.start()
+        self._started_at = time.time()
+        self.restart_at = None
+        LOGGER.info('Started %s (pid %s)', self.name, self._process.pid)
+
+    def crashed(self):
+        if time.time() - self._started_at >= STABLE_UPTIME:
+            self._restart_delay = RESTART_DELAY
+
+        LOGGER.error('%s exited with code %s, restarting in %ss',
+                     self.name, self._process.exitcode, self._restart_delay)
+        self.restart_at = time.time() + self._restart_delay
+        self._restart_delay = min(self._restart_delay * 2, MAX_RESTART_DELAY)
+
+    def is_alive(self):
+        return self._process.is_alive()
+
+    def terminate(self):
+        if self._process.is_alive():
+            self._process.terminate()
+
+    def join(self, timeout):
+        self._process.join(timeout)
+
+    def kill(self):
+        os.kill(self._process.pid, signal.SIGKILL)
+        self._process.join()
+
+
+def _run_worker(worker_id, opts):
+    init_worker_logging(worker_id, opts.verbose)
+
+    # The supervisor stops the workers with SIGTERM, which is handled like
+    # an interrupt so the processor unregisters from the validator
+    signal.signal(signal.SIGTERM, _interrupt)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    processor = None
+    log = None
+    try:
+        start_metrics_server(opts, worker_id)
+
+        processor = TransactionProcessor(url=opts.connect)
+        handler = SimpleSupplyHandler()
+        if opts.record:
+            log = TransactionLogWriter('{}.{}'.format(opts.record, worker_id))
+            handler = RecordingHandler(handler, log)
+        processor.add_handler(handler)
+        processor.start()
+    except KeyboardInterrupt:
+        pass
+    except Exception:  # pylint: disable=broad-except
+        LOGGER.exception('Worker %s failed', worker_id)
+        sys.exit(1)
+    finally:
+        if processor is not None:
+            processor.stop()
+        if log is not None:
+            log.close()
+
+
+def start_metrics_server(opts, worker_id=0):
+    if opts.metrics_port is None:
+        return
+    metrics.start_http_server(opts.metrics_host, opts.metrics_port + worker_id)
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def init_worker_logging(worker_id, level):
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(
+        '[%(asctime)s worker-{} %(levelname)s %(name)s] %(message)s'.format(
+            worker_id)))
+
+    logger = logging.getLogger()
+    logger.handlers = [handler]
+    if level == 1:
+        logger.setLevel(logging.INFO)
+    elif level > 1:
+        logger.setLevel(logging.DEBUG)
+    else:
+        logger.setLevel(logging.WARN)
@@ -0,0 +1,196 @@
+"""Instrumentation of the transaction processor hot path.
+
+The metrics are kept in memory by every processor process and can be
+scraped in the Prometheus text format from an optional HTTP endpoint, which
+is started by simple_supply_tp.main when --metrics-port is given.
+"""
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+import logging
+import re
+import threading
+
+
+LOGGER = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+SIZE_BUCKETS = (64, 128, 256, 512, 1024, 4096, 16384, 65536, 262144,
+                1048576)
+
+# Words of a rejection message that name a resource rather than the reason,
+# e.g. IDs, public keys, emails and timestamps
+_IDENTIFIER = re.compile(r'\S*[\d@]\S*|\S{16,}')
+
+
+class Counter(object):
+    def __init__(self, name, documentation, label_names):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = \
+                self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for label_values, value in values:
+            yield self.name, self._labels(label_values), value
+
+    def _labels(self, label_values, **extra):
+        labels = list(zip(self.label_names, label_values))
+        labels.extend(extra.items())
+        return labels
+
+
+class Histogram(Counter):
+    def __init__(self, name, documentation, label_names, buckets):
+        super().__init__(name, documentation, label_names)
+        self._buckets = buckets
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts = self._values.get(label_values)
+            if counts is None:
+                # One count per bucket, then the +Inf count and the sum
+                counts = [0] * (len(self._buckets) + 1) + [0]
+                self._values[label_values] = counts
+
+            for index, bound in enumerate(self._buckets):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += 1
+            counts[-1] += value
+
+    def samples(self):
+        with self._lock:
+            values = sorted(
+                (label_values, list(counts))
+                for label_values, counts in self._values.items())
+        for label_values, counts in values:
+            for bound, count in zip(self._buckets, counts):
+                yield (self.name + '_bucket',
+                       self._labels(label_values, le=repr(float(bound))),
+                       count)
+            yield (self.name + '_bucket',
+                   self._labels(label_values, le='+Inf'),
+                   counts[-2])
+            yield self.name + '_count', self._labels(label_values), counts[-2]
+            yield self.name + '_sum', self._labels(label_values), counts[-1]
+
+
+TRANSACTIONS = Counter(
+    'bev_transactions_total',
+    'Transactions applied, by action and result',
+    ('action', 'result'))
+APPLY_LATENCY = Histogram(
+    'bev_apply_seconds',
+    'Time spent applying a transaction, by action',
+    ('action',),
+    LATENCY_BUCKETS)
+INVALID_TRANSACTIONS = Counter(
+    'bev_invalid_transactions_total',
+    'Rejected transactions, by action and reason',
+    ('action', 'reason'))
+STATE_REQUESTS = Counter(
+    'bev_state_requests_total',
+    'get_state and set_state requests sent to the validator',
+    ('method',))
+STATE_ADDRESSES = Counter(
+    'bev_state_addresses_total',
+    'Addresses read and written through the validator',
+    ('method',))
+STATE_LATENCY = Histogram(
+    'bev_state_request_seconds',
+    'Round trip of get_state and set_state requests',
+    ('method',),
+    LATENCY_BUCKETS)
+CONTAINER_SIZE = Histogram(
+    'bev_container_bytes',
+    'Size of the serialized containers written, by address type',
+    ('address_type',),
+    SIZE_BUCKETS)
+CONTAINER_CACHE = Counter(
+    'bev_container_cache_total',
+    'Lookups of parsed containers in the cache, by address type and result',
+    ('address_type', 'result'))
+
+METRICS = [
+    TRANSACTIONS,
+    APPLY_LATENCY,
+    INVALID_TRANSACTIONS,
+    STATE_REQUESTS,
+    STATE_ADDRESSES,
+    STATE_LATENCY,
+    CONTAINER_SIZE,
+    CONTAINER_CACHE,
+]
+
+
+def rejection_reason(message):
+    """Turns the message of an InvalidTransaction into a label value by
+    masking the identifiers in it, so that rejections group by cause
+    """
+    return _IDENTIFIER.sub('{}', str(message))
+
+
+def render(metrics=None):
+    """Formats the metrics in the Prometheus text exposition format
+
+    Returns:
+        str: The exposition of every metric
+    """
+    lines = []
+    for metric in metrics or METRICS:
+        lines.append('# HELP {} {}'.format(metric.name, metric.documentation))
+        lines.append('# TYPE {} {}'.format(
+            metric.name,
+            'histogram' if isinstance(metric, Histogram) else 'counter'))
+        for name, labels, value in metric.samples():
+            if labels:
+                name += '{' + ','.join(
+                    '{}="{}"'.format(label, _escape(label_value))
+                    for label, label_value in labels) + '}'
+            lines.append('{} {}'.format(name, value))
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n')
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):  # pylint: disable=invalid-name
+        if self.path not in ('/', '/metrics'):
+            self.send_error(404)
+            return
+
+        body = render().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        LOGGER.debug('Metrics request: ' + format, *args)
+
+
+def start_http_server(host, port):
+    """Serves the metrics at http://host:port/metrics from a daemon thread
+
+    Returns:
+        HTTPServer: The running server
+    """
+    server = HTTPServer((host, port), _MetricsRequestHandler)
+    thread = threading.Thread(
+        target=server.serve_forever, name='metrics', daemon=True)
+    thread.start()
+    LOGGER.info('Serving metrics on http://%s:%s/metrics', host, port)
+    return server
@@ -1,72 +1,65 @@
 from sawtooth_sdk.processor.exceptions import InvalidTransaction
 
+from simple_supply_addressing import addresser
+
 from simple_supply_protobuf import payload_pb2
 
+from simple_supply_validation.validator import DATA_FIELDS
 
-class BevPayload(object):
 
-    def __init__(self, payload):
-        self._transaction = payload_pb2.BevPayload()
-        self._transaction.ParseFromString(payload)
+class BevPayload(object):
+    """Wraps the payload of a BEV transaction. The payload is only parsed
+    when one of its fields is first read, and the data of the action is
+    resolved once.
+
+    Args:
+        payload (bytes): The serialized BevPayload
+        family_version (str): The family version in the transaction header
+    """
+
+    def __init__(self,
+                 payload,
+                 family_version=addresser.LEGACY_FAMILY_VERSION):
+        self._payload = payload
+        self.family_version = family_version
+        self._transaction = None
+        self._data = None
 
     @property
     def action(self):
-        return self._transaction.action
+        return self._parsed.action
 
     @property
     def data(self):
-        if self._transaction.HasField('create_election') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.CREATE_ELECTION:
-            return self._transaction.create_election
-
-        if self._transaction.HasField('create_voting_option') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.CREATE_VOTING_OPTION:
-            return self._transaction.create_voting_option
-
-        if self._transaction.HasField('create_poll_registration') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.CREATE_POLL_REGISTRATION:
-            return self._transaction.create_poll_registration
-
-        if self._transaction.HasField('create_voter') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.CREATE_VOTER:
-            return self._transaction.create_voter
-
-        if self._transaction.HasField('create_vote') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.CREATE_VOTE:
-            return self._transaction.create_vote
+        if self._data is None:
+            transaction = self._parsed
+            field = transaction.WhichOneof('data')
 
-        if self._transaction.HasField('update_vote') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.UPDATE_VOTE:
-            return self._transaction.update_vote
+            if field is None or field != DATA_FIELDS.get(transaction.action):
+                raise InvalidTransaction('Action does not match payload data')
 
-        if self._transaction.HasField('update_election') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.UPDATE_ELECTION:
-            return self._transaction.update_election
+            self._data = getattr(transaction, field)
+        return self._data
 
-        if self._transaction.HasField('update_voter') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.UPDATE_VOTER:
-            return self._transaction.update_voter
-
-        if self._transaction.HasField('update_voting_option') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.UPDATE_VOTING_OPTION:
-            return self._transaction.update_voting_option
-
-        if self._transaction.HasField('update_poll_registration') and \
-            self._transaction.action == \
-                payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION:
-            return self._transaction.update_poll_registration
+    @property
+    def message(self):
+        """The parsed payload_pb2.BevPayload"""
+        return self._parsed
 
-        raise InvalidTransaction('Action does not match payload data')
+    @property
+    def compact(self):
+        """Whether ballots are sent with the binary IDs and option index of
+        family version 0.2
+        """
+        return self.family_version != addresser.LEGACY_FAMILY_VERSION
 
     @property
     def timestamp(self):
-        return self._transaction.timestamp
+        return self._parsed.timestamp
+
+    @property
+    def _parsed(self):
+        if self._transaction is None:
+            self._transaction = payload_pb2.BevPayload()
+            self._transaction.ParseFromString(self._payload)
+        return self._transaction
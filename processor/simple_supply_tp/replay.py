@@ -0,0 +1,153 @@
+"""Replays a transaction log through SimpleSupplyHandler.
+
+Applies recorded transactions as fast as possible against an
+InMemoryContext, in the order they were recorded, and reports the apply
+time of each action. Rejected transactions are counted and skipped like
+the validator would. With --profile the replay runs under cProfile.
+
+    simple-supply-bench replay import BATCH_LIST... -o LOG
+    simple-supply-bench replay run LOG [--profile FILE]
+"""
+import argparse
+import collections
+import cProfile
+import pstats
+import time
+
+from sawtooth_sdk.processor.exceptions import InvalidTransaction
+
+from simple_supply_tp.handler import SimpleSupplyHandler
+from simple_supply_tp.in_memory import InMemoryContext
+from simple_supply_tp.in_memory import Transaction
+from simple_supply_tp.payload import BevPayload
+from simple_supply_tp.throughput import ACTION_NAMES
+from simple_supply_tp.transaction_log import TransactionLogWriter
+from simple_supply_tp.transaction_log import import_batches
+from simple_supply_tp.transaction_log import read_transaction_log
+
+
+def load(path):
+    """Reads a log into the transactions handed to the handler
+
+    Returns:
+        list of (int, Transaction): The action and transaction of each
+            record, with None as the action of undecodable payloads
+    """
+    transactions = []
+    for header, payload in read_transaction_log(path):
+        try:
+            action = BevPayload(payload).action
+        except Exception:  # pylint: disable=broad-except
+            action = None
+        transactions.append(
+            (action, Transaction(header=header, payload=payload)))
+    return transactions
+
+
+def replay(transactions, latency=0):
+    """Applies the transactions in order with a fresh handler and state
+
+    Returns:
+        (dict, InMemoryContext): The number applied, the number rejected and
+            the seconds spent in apply for each action, and the context
+            holding the resulting state
+    """
+    handler = SimpleSupplyHandler()
+    context = InMemoryContext(latency=latency)
+    stats = collections.OrderedDict()
+
+    for action, transaction in transactions:
+        applied, rejected, seconds = stats.get(action, (0, 0, 0))
+        if action is None:
+            stats[action] = (applied, rejected + 1, seconds)
+            continue
+
+        start = time.perf_counter()
+        try:
+            handler.apply(transaction, context)
+            applied += 1
+        except InvalidTransaction:
+            rejected += 1
+        seconds += time.perf_counter() - start
+
+        stats[action] = (applied, rejected, seconds)
+
+    return stats, context
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Records and replays processor transactions')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    import_parser = commands.add_parser(
+        'import', help='build a log from serialized BatchLists')
+    import_parser.add_argument(
+        'batch_lists', nargs='+',
+        help='files holding a serialized BatchList each')
+    import_parser.add_argument(
+        '-o', '--output', required=True,
+        help='log to append the transactions to, compressed if it ends in '
+             '.gz')
+
+    run_parser = commands.add_parser(
+        'run', help='replay a log through the handler')
+    run_parser.add_argument(
+        'log', help='log written by --record or import')
+    run_parser.add_argument(
+        '--latency', type=float, default=0,
+        help='simulated validator round trip, in milliseconds')
+    run_parser.add_argument(
+        '--profile',
+        help='write the cProfile statistics of the replay to this file')
+    run_parser.add_argument(
+        '--profile-limit', type=int, default=25,
+        help='number of functions of the profile to print')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+
+    if opts.command == 'import':
+        writer = TransactionLogWriter(opts.output)
+        try:
+            count = import_batches(opts.batch_lists, writer)
+        finally:
+            writer.close()
+        print('{} transactions written to {}'.format(count, opts.output))
+        return
+
+    transactions = load(opts.log)
+
+    profiler = cProfile.Profile() if opts.profile else None
+    if profiler is not None:
+        profiler.enable()
+    start = time.perf_counter()
+    stats, context = replay(transactions, opts.latency / 1000)
+    elapsed = time.perf_counter() - start
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(opts.profile)
+
+    print('{} transactions in {:.3f} s, {:.0f} tx/s, {} addresses in '
+          'state'.format(len(transactions),
+                         elapsed,
+                         len(transactions) / elapsed if elapsed else 0,
+                         len(context.state)))
+    print('{:>30} {:>8} {:>8} {:>10} {:>9}'.format(
+        'action', 'applied', 'rejected', 'tx/s', 'mean ms'))
+    for action, (applied, rejected, seconds) in stats.items():
+        count = applied + rejected
+        print('{:>30} {:>8} {:>8} {:>10.0f} {:>9.3f}'.format(
+            ACTION_NAMES.get(action, 'UNDECODABLE'),
+            applied,
+            rejected,
+            count / seconds if seconds else 0,
+            seconds * 1000 / count))
+
+    if profiler is not None:
+        print()
+        pstats.Stats(opts.profile).sort_stats('cumulative').print_stats(
+            opts.profile_limit)
@@ -1,16 +1,166 @@
+import collections
+import hashlib
+from operator import attrgetter
+import threading
+import time
+
 from simple_supply_addressing import addresser
 
+from simple_supply_protobuf import ballotIndex_pb2
 from simple_supply_protobuf import election_pb2
+from simple_supply_protobuf import electionResult_pb2
 from simple_supply_protobuf import votingOption_pb2
 from simple_supply_protobuf import pollRegistration_pb2
 from simple_supply_protobuf import voter_pb2
 from simple_supply_protobuf import vote_pb2
+from simple_supply_protobuf import voteTally_pb2
+
+from simple_supply_tp import metrics
+
+
+def _vote_key(vote):
+    return vote.vote_id or addresser.unpack_id(vote.vote_uuid)
+
+
+def _ballot_index_key(ballot_index):
+    return (ballot_index.election_id
+            or addresser.unpack_id(ballot_index.election_uuid),
+            ballot_index.voter_id)
+
+
+# The key each type of container keeps its entries sorted by. Entries
+# written by family version 0.2 are keyed by the hex form of their binary
+# IDs, so they sort among the entries of version 0.1.
+ELECTION_KEY = attrgetter('election_id')
+VOTING_OPTION_KEY = attrgetter('voting_option_id')
+POLL_REGISTRATION_KEY = attrgetter('election_id', 'voter_id')
+VOTER_KEY = attrgetter('public_key')
+VOTE_KEY = _vote_key
+VOTE_TALLY_KEY = attrgetter('election_id', 'shard')
+VOTE_COUNT_KEY = attrgetter('voting_option_id')
+BALLOT_INDEX_KEY = _ballot_index_key
+ELECTION_RESULT_KEY = attrgetter('election_id')
+
+# Parsed containers kept by every processor process
+CONTAINER_CACHE_SIZE = 4096
+
+
+class ContainerCache(object):
+    """Bounded LRU cache of parsed containers, keyed by their address and a
+    digest of the state bytes they were parsed from. Identical bytes always
+    parse into the same container, so entries stay valid across blocks and
+    forks. The containers returned are shared and must not be modified.
+
+    Args:
+        max_size (int): Number of containers kept
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._containers = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, address, data, container_type):
+        """Returns the container parsed from data, parsing it on a miss
+
+        Args:
+            address (str): The address the data was read from
+            data (bytes): The serialized container
+            container_type (type): The protobuf container class
+
+        Returns:
+            The parsed container
+        """
+        key = (address, hashlib.blake2b(data, digest_size=16).digest())
+        with self._lock:
+            container = self._containers.get(key)
+            if container is not None:
+                self._containers.move_to_end(key)
+
+        metrics.CONTAINER_CACHE.inc(
+            addresser.get_address_type(address).name.lower(),
+            'miss' if container is None else 'hit')
+        if container is not None:
+            return container
+
+        container = container_type()
+        container.ParseFromString(data)
+        with self._lock:
+            self._containers[key] = container
+            while len(self._containers) > self.max_size:
+                self._containers.popitem(last=False)
+        return container
+
+    def clear(self):
+        with self._lock:
+            self._containers.clear()
+
+
+CONTAINER_CACHE = ContainerCache(CONTAINER_CACHE_SIZE)
 
 
 class SimpleSupplyState(object):
+    """Reads and writes the BEV resources in state on behalf of one
+    transaction. Reads are served from a buffer filled by prefetch, and
+    writes are held until flush sends them to the validator at once.
+    Containers that are only read are parsed through CONTAINER_CACHE, so
+    the resources returned by the getters must not be modified.
+    The entries of every container are kept sorted by their key, so an
+    entry is found with a binary search instead of a scan.
+    """
+
     def __init__(self, context, timeout=2):
         self._context = context
         self._timeout = timeout
+        self._state = {}
+        self._pending = {}
+
+    def prefetch(self, addresses):
+        """Reads the given addresses from the validator in a single request
+        and keeps their data for the rest of the transaction. Namespace
+        prefixes and addresses already read are skipped.
+
+            Args:
+                addresses (list of str): The addresses the transaction reads,
+                    usually the inputs declared in its header
+        """
+        addresses = [
+            address for address in set(addresses)
+            if len(address) == addresser.ADDRESS_LENGTH
+            and address not in self._state
+        ]
+        if not addresses:
+            return
+
+        start = time.perf_counter()
+        state_entries = self._context.get_state(
+            addresses=addresses, timeout=self._timeout)
+        metrics.STATE_LATENCY.observe(time.perf_counter() - start, 'get')
+        metrics.STATE_REQUESTS.inc('get')
+        metrics.STATE_ADDRESSES.inc('get', amount=len(addresses))
+
+        for address in addresses:
+            self._state[address] = b''
+        for entry in state_entries:
+            self._state[entry.address] = entry.data
+
+    def flush(self):
+        """Writes every change made by the transaction to the validator in a
+        single request
+        """
+        if not self._pending:
+            return
+
+        start = time.perf_counter()
+        self._context.set_state(self._pending, timeout=self._timeout)
+        metrics.STATE_LATENCY.observe(time.perf_counter() - start, 'set')
+        metrics.STATE_REQUESTS.inc('set')
+        metrics.STATE_ADDRESSES.inc('set', amount=len(self._pending))
+
+        for address, data in self._pending.items():
+            metrics.CONTAINER_SIZE.observe(
+                len(data), addresser.get_address_type(address).name.lower())
+        self._pending = {}
 
     def set_election(self,
                      election_id,
@@ -23,7 +173,11 @@ class SimpleSupplyState(object):
                      can_show_realtime,
                      admin_id,
                      status,
-                     timestamp):
+                     timestamp,
+                     voting_option_uuids=(),
+                     multiple_options_criteria=0,
+                     multiple_options_value_min=0,
+                     multiple_options_value_max=0):
         """Creates a new election in state
 
             Args:
@@ -38,6 +192,12 @@ class SimpleSupplyState(object):
                 admin_id (int):  Unique ID of the administrator
                 status (bool): Defines if the election is online or canceled
                 timestamp (int): Timestamp
+                voting_option_uuids (list of bytes): Binary IDs of the
+                    voting options ballots can refer to by index
+                multiple_options_criteria (int): How many voting options a
+                    ballot picks, as an Election.MultipleOptionsCriteria
+                multiple_options_value_min (int): Lower bound of the criteria
+                multiple_options_value_max (int): Upper bound of the criteria
         """
         address = addresser.get_election_address(election_id)
 
@@ -52,20 +212,17 @@ class SimpleSupplyState(object):
             can_show_realtime=can_show_realtime,
             admin_id=admin_id,
             status=status,
-            timestamp=timestamp)
+            timestamp=timestamp,
+            voting_option_uuids=voting_option_uuids,
+            multiple_options_criteria=multiple_options_criteria,
+            multiple_options_value_min=multiple_options_value_min,
+            multiple_options_value_max=multiple_options_value_max)
 
         container = election_pb2.ElectionContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-
-        container.entries.extend([election])
-        data = container.SerializeToString()
+        self._load_container(address, container)
 
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        _put_entry(container.entries, ELECTION_KEY, election)
+        self._store_container(address, container)
 
     def set_voting_option(self,
                           voting_option_id,
@@ -92,17 +249,10 @@ class SimpleSupplyState(object):
             status=status)
 
         container = votingOption_pb2.VotingOptionContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-
-        container.entries.extend([voting_option])
-        data = container.SerializeToString()
+        self._load_container(address, container)
 
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        _put_entry(container.entries, VOTING_OPTION_KEY, voting_option)
+        self._store_container(address, container)
 
     def set_poll_registration(self,
                               voter_id,
@@ -117,7 +267,8 @@ class SimpleSupplyState(object):
                 election_id (str): Unique ID of the election
                 status (bool): Defines if the user in poll registration is activated or disable
         """
-        address = addresser.get_poll_registration_address(voter_id)
+        address = addresser.get_poll_registration_address(
+            election_id, voter_id)
 
         poll_registration = pollRegistration_pb2.PollRegistration(
             voter_id=voter_id,
@@ -126,17 +277,72 @@ class SimpleSupplyState(object):
             status=status)
 
         container = pollRegistration_pb2.PollRegistrationContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
+        self._load_container(address, container)
 
-        container.entries.extend([poll_registration])
-        data = container.SerializeToString()
+        _put_entry(container.entries, POLL_REGISTRATION_KEY, poll_registration)
+        self._store_container(address, container)
 
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+    def get_election(self, election_id):
+        """Gets the election with the given ID
+
+        Args:
+            election_id (str): Unique ID of the election
+
+        Returns:
+            election_pb2.Election: The election, or None if it does not exist
+        """
+        container = self._read_container(
+            addresser.get_election_address(election_id),
+            election_pb2.ElectionContainer)
+        return _get_entry(container.entries, ELECTION_KEY, election_id)
+
+    def get_voting_option(self, voting_option_id):
+        """Gets the voting option with the given ID
+
+        Args:
+            voting_option_id (str): Unique ID of the voting option
+
+        Returns:
+            votingOption_pb2.VotingOption: The voting option, or None if it
+                does not exist
+        """
+        container = self._read_container(
+            addresser.get_voting_option_address(voting_option_id),
+            votingOption_pb2.VotingOptionContainer)
+        return _get_entry(
+            container.entries, VOTING_OPTION_KEY, voting_option_id)
+
+    def get_poll_registration(self, election_id, voter_id):
+        """Gets the registration of a voter in the poll book of an election,
+        looking in the legacy container of the voter if it was not migrated
+
+        Args:
+            election_id (str): Unique ID of the election
+            voter_id (str): Unique ID of the voter
+
+        Returns:
+            pollRegistration_pb2.PollRegistration: The registration, or None
+                if the voter is not registered
+        """
+        container = self._read_container(
+            addresser.get_poll_registration_address(election_id, voter_id),
+            pollRegistration_pb2.PollRegistrationContainer)
+        if container.entries:
+            return _get_entry(
+                container.entries,
+                POLL_REGISTRATION_KEY,
+                (election_id, voter_id))
+
+        # Legacy containers were appended to, so they are not sorted
+        container = self._read_container(
+            addresser.get_legacy_poll_registration_address(voter_id),
+            pollRegistration_pb2.PollRegistrationContainer)
+        for poll_registration in container.entries:
+            if poll_registration.voter_id == voter_id \
+                    and poll_registration.election_id == election_id:
+                return poll_registration
+
+        return None
 
     def get_voter(self,
                   public_key):
@@ -148,17 +354,9 @@ class SimpleSupplyState(object):
         Returns:
             voter_pb2.Voter: Voter with the provided public_key
         """
-        address = addresser.get_voter_address(public_key)
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container = voter_pb2.VoterContainer()
-            container.ParseFromString(state_entries[0].data)
-            for voter in container.entries:
-                if voter.public_key == public_key:
-                    return voter
-
-        return None
+        container = self._read_container(
+            addresser.get_voter_address(public_key), voter_pb2.VoterContainer)
+        return _get_entry(container.entries, VOTER_KEY, public_key)
 
     def set_voter(self,
                   voter_id,
@@ -183,17 +381,10 @@ class SimpleSupplyState(object):
             created_at=created_at,
             type=type)
         container = voter_pb2.VoterContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-
-        container.entries.extend([voter])
-        data = container.SerializeToString()
+        self._load_container(address, container)
 
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        _put_entry(container.entries, VOTER_KEY, voter)
+        self._store_container(address, container)
 
     def update_voter(self,
                      voter_id,
@@ -212,28 +403,25 @@ class SimpleSupplyState(object):
         """
         address = addresser.get_voter_address(public_key)
         container = voter_pb2.VoterContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for voter in container.entries:
-                if voter.public_key == public_key:
-                    voter.voter_id = voter_id
-                    voter.name = name
-                    voter.created_at = created_at
-                    voter.type = type
-
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        self._load_container(address, container)
+
+        voter = _get_entry(container.entries, VOTER_KEY, public_key)
+        if voter is None:
+            return
+
+        voter.voter_id = voter_id
+        voter.name = name
+        voter.created_at = created_at
+        voter.type = type
+        self._store_container(address, container)
 
     def set_vote(self,
                  vote_id,
                  timestamp,
                  voter_id,
                  election_id,
-                 voting_option_id):
+                 voting_option_ids,
+                 voting_option_indexes=None):
         """Creates a new vote in state
 
             Args:
@@ -241,50 +429,281 @@ class SimpleSupplyState(object):
                 timestamp (int): Timestamp
                 voter_id (str): Unique ID of the voting option
                 election_id (str): Unique ID of the election
-                voting_option_id (str): Unique ID of the voting option
+                voting_option_ids (list of str): Unique IDs of the voting
+                    options picked
+                voting_option_indexes (list of int): Indexes of the voting
+                    options in the election, to store the vote in its family
+                    version 0.2 form
         """
-        address = addresser.get_vote_address(vote_id)
-        vote = vote_pb2.Vote(
-            vote_id=vote_id,
-            timestamp=timestamp,
-            voter_id=voter_id,
-            election_id=election_id,
-            voting_option_id=voting_option_id)
+        address = addresser.get_vote_address(election_id, vote_id)
+        vote = _make_vote(vote_id,
+                          timestamp,
+                          voter_id,
+                          election_id,
+                          voting_option_ids,
+                          voting_option_indexes)
 
         container = vote_pb2.VoteContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
+        self._load_container(address, container)
+
+        _put_entry(container.entries, VOTE_KEY, vote)
+        self._store_container(address, container)
+
+    def get_vote(self, election_id, vote_id):
+        """Gets a vote, looking at its legacy address if it was not migrated
+
+            Args:
+                election_id (str): Unique ID of the election
+                vote_id (str): Unique ID of the vote
 
-        container.entries.extend([vote])
-        data = container.SerializeToString()
+            Returns:
+                vote_pb2.Vote: The vote, or None if it does not exist
+        """
+        container = self._read_container(
+            addresser.get_vote_address(election_id, vote_id),
+            vote_pb2.VoteContainer)
+        if container.entries:
+            return _get_entry(container.entries, VOTE_KEY, vote_id)
+
+        # Legacy containers were appended to, so they are not sorted
+        container = self._read_container(
+            addresser.get_legacy_vote_address(vote_id),
+            vote_pb2.VoteContainer)
+        for vote in container.entries:
+            if vote.vote_id == vote_id:
+                return vote
+
+        return None
 
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+    def get_ballot_vote_id(self, election_id, voter_id):
+        """Follows the ballot index of a voter to their ballot in an
+        election
+
+            Args:
+                election_id (str): Unique ID of the election
+                voter_id (str): Unique ID of the voter
+
+            Returns:
+                str: The ID of the vote, or None if the voter has not voted
+        """
+        container = self._read_container(
+            addresser.get_ballot_index_address(election_id, voter_id),
+            ballotIndex_pb2.BallotIndexContainer)
+        ballot_index = _get_entry(
+            container.entries, BALLOT_INDEX_KEY, (election_id, voter_id))
+        if ballot_index is None:
+            return None
+        return ballot_index.vote_id or addresser.unpack_id(
+            ballot_index.vote_uuid)
+
+    def set_ballot_index(self, election_id, voter_id, vote_id, compact=False):
+        """Records the ballot a voter cast in an election
+
+            Args:
+                election_id (str): Unique ID of the election
+                voter_id (str): Unique ID of the voter
+                vote_id (str): Unique ID of the vote
+                compact (bool): Whether to store the binary IDs of family
+                    version 0.2
+        """
+        address = addresser.get_ballot_index_address(election_id, voter_id)
+        container = ballotIndex_pb2.BallotIndexContainer()
+        self._load_container(address, container)
+
+        if compact:
+            ballot_index = ballotIndex_pb2.BallotIndex(
+                election_uuid=addresser.pack_id(election_id),
+                voter_id=voter_id,
+                vote_uuid=addresser.pack_id(vote_id))
+        else:
+            ballot_index = ballotIndex_pb2.BallotIndex(
+                election_id=election_id,
+                voter_id=voter_id,
+                vote_id=vote_id)
+
+        _put_entry(container.entries, BALLOT_INDEX_KEY, ballot_index)
+        self._store_container(address, container)
 
     def update_vote(self,
                     vote_id,
+                    election_id,
                     timestamp,
-                    voting_option_id):
+                    voting_option_ids,
+                    voting_option_indexes=None):
+        """Updates a vote in state. A vote still stored at its legacy address
+        is moved to its election-scoped address.
 
-        address = addresser.get_vote_address(vote_id)
+            Args:
+                vote_id (str): Unique ID of the vote
+                election_id (str): Unique ID of the election
+                timestamp (int): Timestamp
+                voting_option_ids (list of str): Unique IDs of the voting
+                    options picked
+                voting_option_indexes (list of int): Indexes of the voting
+                    options in the election, to store the vote in its family
+                    version 0.2 form
+
+            Returns:
+                vote_pb2.Vote: The vote as it was before the update, or None
+                    if the vote does not exist
+        """
+        address = addresser.get_vote_address(election_id, vote_id)
         container = vote_pb2.VoteContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
+        if not self._load_container(address, container):
+            self._migrate_legacy_entries(
+                addresser.get_legacy_vote_address(vote_id),
+                vote_pb2.VoteContainer(),
+                container,
+                VOTE_KEY,
+                lambda vote: vote.vote_id == vote_id)
+
+        vote = _get_entry(container.entries, VOTE_KEY, vote_id)
+        if vote is None:
+            return None
+
+        previous = vote_pb2.Vote()
+        previous.CopyFrom(vote)
+        vote.CopyFrom(_make_vote(vote_id,
+                                 timestamp,
+                                 vote.voter_id,
+                                 election_id,
+                                 voting_option_ids,
+                                 voting_option_indexes))
+        self._store_container(address, container)
+        return previous
+
+    def update_vote_tally(self,
+                          election_id,
+                          vote_id,
+                          removed_voting_option_ids,
+                          added_voting_option_ids,
+                          new_ballot=False):
+        """Moves one ballot between the counters of the tally shard of a
+        vote
+
+            Args:
+                election_id (str): Unique ID of the election
+                vote_id (str): Unique ID of the vote, which picks the shard
+                removed_voting_option_ids (list of str): The voting options
+                    the ballot is withdrawn from
+                added_voting_option_ids (list of str): The voting options
+                    the ballot is counted for
+                new_ballot (bool): Whether the ballot is cast rather than
+                    changed, and adds to the ballots of the shard
+        """
+        shard = addresser.get_vote_tally_shard(vote_id)
+        address = addresser.get_vote_tally_address(election_id, shard)
+        container = voteTally_pb2.VoteTallyContainer()
+        self._load_container(address, container)
+
+        vote_tally = _get_entry(
+            container.entries, VOTE_TALLY_KEY, (election_id, shard))
+        if vote_tally is None:
+            vote_tally = _put_entry(
+                container.entries,
+                VOTE_TALLY_KEY,
+                voteTally_pb2.VoteTally(election_id=election_id, shard=shard))
+
+        for voting_option_id in removed_voting_option_ids:
+            count = _get_entry(
+                vote_tally.counts, VOTE_COUNT_KEY, voting_option_id)
+            # Counters never go below zero, whatever the ballots hold
+            if count is not None and count.num_votes > 0:
+                count.num_votes -= 1
+
+        for voting_option_id in added_voting_option_ids:
+            count = _get_entry(
+                vote_tally.counts, VOTE_COUNT_KEY, voting_option_id)
+            if count is None:
+                count = _put_entry(
+                    vote_tally.counts,
+                    VOTE_COUNT_KEY,
+                    voteTally_pb2.VoteCount(
+                        voting_option_id=voting_option_id))
+            count.num_votes += 1
+
+        if new_ballot:
+            vote_tally.num_ballots += 1
+
+        self._store_container(address, container)
+
+    def get_vote_counts(self, election_id):
+        """Sums the counters of every tally shard of an election
+
+            Args:
+                election_id (str): Unique ID of the election
 
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for vote in container.entries:
-                if vote.vote_id == vote_id:
-                    vote.timestamp = timestamp
-                    vote.voting_option_id = voting_option_id
+            Returns:
+                (dict, int): The number of votes of each voting option ID
+                    that received any, and the number of ballots
+        """
+        addresses = addresser.get_vote_tally_addresses(election_id)
+        self.prefetch(addresses)
+
+        num_votes = {}
+        num_ballots = 0
+        for shard, address in enumerate(addresses):
+            container = self._read_container(
+                address, voteTally_pb2.VoteTallyContainer)
+            vote_tally = _get_entry(
+                container.entries, VOTE_TALLY_KEY, (election_id, shard))
+            if vote_tally is None:
+                continue
+            num_ballots += vote_tally.num_ballots
+            for count in vote_tally.counts:
+                num_votes[count.voting_option_id] = \
+                    num_votes.get(count.voting_option_id, 0) + count.num_votes
+        return num_votes, num_ballots
+
+    def get_election_result(self, election_id):
+        """Gets the final result of an election
+
+            Args:
+                election_id (str): Unique ID of the election
+
+            Returns:
+                electionResult_pb2.ElectionResult: The result, or None if
+                    the election was not finalized
+        """
+        container = self._read_container(
+            addresser.get_election_result_address(election_id),
+            electionResult_pb2.ElectionResultContainer)
+        return _get_entry(
+            container.entries, ELECTION_RESULT_KEY, election_id)
+
+    def set_election_result(self,
+                            election_id,
+                            num_votes,
+                            num_ballots,
+                            finalized_at):
+        """Stores the final result of an election
 
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+            Args:
+                election_id (str): Unique ID of the election
+                num_votes (dict): The number of votes of each voting option
+                    ID that received any
+                num_ballots (int): The number of ballots counted
+                finalized_at (int): Unix UTC timestamp of the finalization
+        """
+        address = addresser.get_election_result_address(election_id)
+
+        election_result = electionResult_pb2.ElectionResult(
+            election_id=election_id,
+            counts=[
+                electionResult_pb2.OptionResult(
+                    voting_option_id=voting_option_id,
+                    num_votes=count)
+                for voting_option_id, count in sorted(num_votes.items())
+                if count
+            ],
+            num_votes=num_ballots,
+            finalized_at=finalized_at)
+
+        container = electionResult_pb2.ElectionResultContainer()
+        self._load_container(address, container)
+
+        _put_entry(container.entries, ELECTION_RESULT_KEY, election_result)
+        self._store_container(address, container)
 
     def update_election(self,
                         election_id,
@@ -297,32 +716,53 @@ class SimpleSupplyState(object):
                         can_show_realtime,
                         admin_id,
                         status,
-                        timestamp):
+                        timestamp,
+                        multiple_options_criteria=0,
+                        multiple_options_value_min=0,
+                        multiple_options_value_max=0):
 
         address = addresser.get_election_address(election_id)
         container = election_pb2.ElectionContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for election in container.entries:
-                if election.election_id == election_id:
-                    election.name = name
-                    election.description = description
-                    election.start_timestamp = start_timestamp
-                    election.end_timestamp = end_timestamp
-                    election.results_permission = results_permission
-                    election.can_change_vote = can_change_vote
-                    election.can_show_realtime = can_show_realtime
-                    election.admin_id = admin_id
-                    election.status = status
-                    election.timestamp = timestamp
-
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        self._load_container(address, container)
+
+        election = _get_entry(container.entries, ELECTION_KEY, election_id)
+        if election is None:
+            return
+
+        election.name = name
+        election.description = description
+        election.start_timestamp = start_timestamp
+        election.end_timestamp = end_timestamp
+        election.results_permission = results_permission
+        election.can_change_vote = can_change_vote
+        election.can_show_realtime = can_show_realtime
+        election.admin_id = admin_id
+        election.status = status
+        election.timestamp = timestamp
+        election.multiple_options_criteria = multiple_options_criteria
+        election.multiple_options_value_min = multiple_options_value_min
+        election.multiple_options_value_max = multiple_options_value_max
+        self._store_container(address, container)
+
+    def add_election_voting_option(self, election_id, voting_option_uuid):
+        """Appends a voting option to the ones ballots can refer to by
+        index, if the election exists and does not list it yet
+
+            Args:
+                election_id (str): Unique ID of the election
+                voting_option_uuid (bytes): Binary ID of the voting option
+        """
+        address = addresser.get_election_address(election_id)
+        container = election_pb2.ElectionContainer()
+        self._load_container(address, container)
+
+        election = _get_entry(container.entries, ELECTION_KEY, election_id)
+        if election is None \
+                or voting_option_uuid in election.voting_option_uuids:
+            return
+
+        election.voting_option_uuids.append(voting_option_uuid)
+        self._store_container(address, container)
 
     def update_voting_option(self,
                              voting_option_id,
@@ -333,43 +773,193 @@ class SimpleSupplyState(object):
 
         address = addresser.get_voting_option_address(voting_option_id)
         container = votingOption_pb2.VotingOptionContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for voting_option in container.entries:
-                if voting_option.voting_option_id == voting_option_id:
-                    voting_option.name = name
-                    voting_option.description = description
-                    voting_option.election_id = election_id
-                    voting_option.status = status
-
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        self._load_container(address, container)
+
+        voting_option = _get_entry(
+            container.entries, VOTING_OPTION_KEY, voting_option_id)
+        if voting_option is None:
+            return
+
+        voting_option.name = name
+        voting_option.description = description
+        voting_option.election_id = election_id
+        voting_option.status = status
+        self._store_container(address, container)
 
     def update_poll_registration(self,
                                  voter_id,
                                  name,
                                  election_id,
                                  status):
+        """Updates a poll registration in state. A registration still stored
+        in the voter's legacy container is moved to its per-election address.
 
-        address = addresser.get_poll_registration_address(voter_id)
+            Args:
+                voter_id (str): Unique ID of the voter
+                name (str): Name of the voter
+                election_id (str): Unique ID of the election
+                status (bool): Defines if the user in poll registration is
+                    activated or disable
+        """
+        address = addresser.get_poll_registration_address(
+            election_id, voter_id)
         container = pollRegistration_pb2.PollRegistrationContainer()
-        state_entries = self._context.get_state(
-            addresses=[address], timeout=self._timeout)
-
-        if state_entries:
-            container.ParseFromString(state_entries[0].data)
-            for poll_registration in container.entries:
-                if poll_registration.voter_id == voter_id:
-                    poll_registration.name = name
-                    poll_registration.election_id = election_id
-                    poll_registration.status = status
-
-        data = container.SerializeToString()
-        updated_state = {}
-        updated_state[address] = data
-        self._context.set_state(updated_state, timeout=self._timeout)
+        if not self._load_container(address, container):
+            self._migrate_legacy_entries(
+                addresser.get_legacy_poll_registration_address(voter_id),
+                pollRegistration_pb2.PollRegistrationContainer(),
+                container,
+                POLL_REGISTRATION_KEY,
+                lambda poll_registration:
+                poll_registration.voter_id == voter_id
+                and poll_registration.election_id == election_id)
+
+        poll_registration = _get_entry(
+            container.entries, POLL_REGISTRATION_KEY, (election_id, voter_id))
+        if poll_registration is None:
+            return
+
+        poll_registration.name = name
+        poll_registration.status = status
+        self._store_container(address, container)
+
+    def _migrate_legacy_entries(self,
+                                legacy_address,
+                                legacy_container,
+                                container,
+                                key,
+                                matches):
+        """Moves the entries that match out of a container stored with a
+        version 1 address layout and into the given container
+
+            Args:
+                legacy_address (str): The version 1 address of the entries
+                legacy_container: An empty container of the stored type
+                container: The container the entries are moved to
+                key (callable): The key the container is sorted by
+                matches (callable): Selects the entries to move
+        """
+        if not self._load_container(legacy_address, legacy_container):
+            return
+
+        moved = False
+        for index in reversed(range(len(legacy_container.entries))):
+            entry = legacy_container.entries[index]
+            if matches(entry):
+                _put_entry(container.entries, key, entry)
+                del legacy_container.entries[index]
+                moved = True
+
+        if not moved:
+            return
+
+        self._store_container(legacy_address, legacy_container)
+
+    def _load_container(self, address, container):
+        """Parses the data stored at an address into the given container
+
+        Returns:
+            bool: Whether there was any data at the address
+        """
+        data = self._get_data(address)
+        if not data:
+            return False
+
+        container.ParseFromString(data)
+        return True
+
+    def _read_container(self, address, container_type):
+        """Returns the container stored at an address for reading only. It
+        is empty if there is no data at the address.
+        """
+        data = self._get_data(address)
+        if not data:
+            return container_type()
+        return CONTAINER_CACHE.get(address, data, container_type)
+
+    def _store_container(self, address, container):
+        self._set_data(address, container.SerializeToString())
+
+    def _get_data(self, address):
+        if address not in self._state:
+            self.prefetch([address])
+        return self._state[address]
+
+    def _set_data(self, address, data):
+        self._state[address] = data
+        self._pending[address] = data
+
+
+def _make_vote(vote_id,
+               timestamp,
+               voter_id,
+               election_id,
+               voting_option_ids,
+               voting_option_indexes):
+    # A single choice keeps the fields ballots had before multi-choice
+    # ballots existed
+    if voting_option_indexes is None:
+        vote = vote_pb2.Vote(
+            vote_id=vote_id,
+            timestamp=timestamp,
+            voter_id=voter_id,
+            election_id=election_id)
+        if len(voting_option_ids) == 1:
+            vote.voting_option_id = voting_option_ids[0]
+        else:
+            vote.voting_option_ids.extend(voting_option_ids)
+        return vote
+
+    vote = vote_pb2.Vote(
+        vote_uuid=addresser.pack_id(vote_id),
+        timestamp=timestamp,
+        voter_id=voter_id,
+        election_uuid=addresser.pack_id(election_id))
+    if len(voting_option_indexes) == 1:
+        vote.voting_option_index = voting_option_indexes[0]
+    else:
+        vote.voting_option_indexes.extend(voting_option_indexes)
+    return vote
+
+
+def _find_entry(entries, key, value):
+    """Binary searches entries that are sorted by key
+
+    Returns:
+        (int, bool): The index of the entry with the given key value, or the
+            index it would be inserted at, and whether it was found
+    """
+    low = 0
+    high = len(entries)
+    while low < high:
+        middle = (low + high) // 2
+        if key(entries[middle]) < value:
+            low = middle + 1
+        else:
+            high = middle
+
+    return low, low < len(entries) and key(entries[low]) == value
+
+
+def _get_entry(entries, key, value):
+    index, found = _find_entry(entries, key, value)
+    if not found:
+        return None
+    return entries[index]
+
+
+def _put_entry(entries, key, entry):
+    """Stores a copy of an entry at its sorted position, replacing the entry
+    with the same key value if there is one
+
+    Returns:
+        The stored entry
+    """
+    index, found = _find_entry(entries, key, key(entry))
+    if not found:
+        entries.add()
+        for position in range(len(entries) - 1, index, -1):
+            entries[position].CopyFrom(entries[position - 1])
+
+    entries[index].CopyFrom(entry)
+    return entries[index]
@@ -0,0 +1,330 @@
+"""Throughput benchmark of SimpleSupplyHandler.
+
+Replays a generated election day through the real handler against an
+InMemoryContext: the voters sign up, an admin creates the elections with
+their voting options and poll books, every voter casts a ballot in every
+election and some of them change it. The transactions carry the same
+payloads and declared addresses as the ones built by the REST API.
+"""
+import argparse
+import collections
+import random
+import time
+import uuid
+
+from simple_supply_addressing import addresser
+from simple_supply_addressing import declarations
+
+from simple_supply_protobuf import payload_pb2
+
+from simple_supply_tp import metrics
+from simple_supply_tp.handler import SimpleSupplyHandler
+from simple_supply_tp.in_memory import InMemoryContext
+from simple_supply_tp.in_memory import Transaction
+from simple_supply_tp.in_memory import TransactionHeader
+from simple_supply_tp.payload import DATA_FIELDS
+
+
+ACTION_NAMES = {
+    number: name
+    for name, number in payload_pb2.BevPayload.Action.items()
+}
+
+# Voters registered by each poll book transaction, as sent by the REST API
+POLL_BOOK_CHUNK_SIZE = 1000
+
+
+def make_workload(voters,
+                  elections,
+                  options,
+                  change_rate,
+                  seed=0,
+                  family_version=addresser.FAMILY_VERSION,
+                  choices=1):
+    """Generates the transactions of an election day, in submission order
+
+    Args:
+        voters (int): Size of the electorate
+        elections (int): Number of elections every voter takes part in
+        options (int): Number of voting options of each election
+        change_rate (float): Share of the ballots that are changed later
+        seed (int): Seed of the random generator, for repeatable runs
+        family_version (str): The family version the transactions are
+            sent with
+        choices (int): Number of voting options every ballot picks
+
+    Returns:
+        list of (int, Transaction): The action and transaction of each
+            request
+    """
+    rand = random.Random(seed)
+    timestamp = int(time.time())
+    compact = family_version != addresser.LEGACY_FAMILY_VERSION
+
+    def new_id():
+        return uuid.UUID(int=rand.getrandbits(128)).hex
+
+    def new_public_key():
+        return '02' + new_id() + new_id()
+
+    admin = (new_id(), new_public_key())
+    electorate = [(new_id(), new_public_key()) for _ in range(voters)]
+
+    transactions = []
+
+    def submit(signer, action, data, declaration):
+        payload = payload_pb2.BevPayload(action=action, timestamp=timestamp)
+        getattr(payload, DATA_FIELDS[action]).CopyFrom(data)
+        header = TransactionHeader(
+            signer_public_key=signer,
+            family_version=family_version,
+            inputs=declaration.inputs,
+            outputs=declaration.outputs)
+        transactions.append((action, Transaction(
+            header=header, payload=payload.SerializeToString())))
+
+    for (voter_id, public_key), voter_type in \
+            [(admin, 'ADMIN')] + [(voter, 'VOTER') for voter in electorate]:
+        submit(public_key,
+               payload_pb2.BevPayload.CREATE_VOTER,
+               payload_pb2.CreateVoterAction(
+                   voter_id=voter_id,
+                   public_key=public_key,
+                   name=voter_id,
+                   created_at=timestamp,
+                   type=voter_type),
+               declarations.create_voter(public_key, public_key))
+
+    ballots = []
+    for _ in range(elections):
+        election_id = new_id()
+        option_ids = [new_id() for _ in range(options)]
+        registrations = [
+            payload_pb2.CreatePollRegistrationAction(
+                voter_id=voter_id,
+                name=voter_id,
+                election_id=election_id,
+                status=True)
+            for voter_id, _ in electorate]
+
+        chunks = [registrations[start:start + POLL_BOOK_CHUNK_SIZE]
+                  for start in range(0, len(registrations),
+                                     POLL_BOOK_CHUNK_SIZE)] or [[]]
+
+        submit(admin[1],
+               payload_pb2.BevPayload.CREATE_ELECTION_BUNDLE,
+               payload_pb2.CreateElectionBundleAction(
+                   election=payload_pb2.CreateElectionAction(
+                       election_id=election_id,
+                       name=election_id,
+                       start_timestamp=timestamp,
+                       end_timestamp=timestamp + 86400,
+                       can_change_vote=True,
+                       admin_id=admin[0],
+                       status=True,
+                       **_multiple_options_criteria(choices)),
+                   voting_options=[
+                       payload_pb2.CreateVotingOptionAction(
+                           voting_option_id=option_id,
+                           name=option_id,
+                           election_id=election_id,
+                           status=True)
+                       for option_id in option_ids],
+                   poll_registrations=chunks[0]),
+               declarations.create_election_bundle(
+                   admin[1],
+                   election_id,
+                   option_ids,
+                   _registered_voter_ids(chunks[0])))
+
+        for chunk in chunks[1:]:
+            submit(admin[1],
+                   payload_pb2.BevPayload.BULK_CREATE_POLL_REGISTRATIONS,
+                   payload_pb2.BulkCreatePollRegistrationsAction(
+                       poll_registrations=chunk),
+                   declarations.bulk_create_poll_registrations(
+                       admin[1], election_id, _registered_voter_ids(chunk)))
+
+        for voter_id, public_key in electorate:
+            ballots.append(
+                (public_key, voter_id, election_id, new_id(), option_ids))
+
+    rand.shuffle(ballots)
+    for public_key, voter_id, election_id, vote_id, option_ids in ballots:
+        voting_option_indexes = rand.sample(range(len(option_ids)), choices)
+        voting_option_ids = [option_ids[voting_option_index]
+                             for voting_option_index in voting_option_indexes]
+        if compact:
+            action = payload_pb2.CreateVoteAction(
+                vote_uuid=addresser.pack_id(vote_id),
+                timestamp=timestamp,
+                voter_id=voter_id,
+                election_uuid=addresser.pack_id(election_id))
+        else:
+            action = payload_pb2.CreateVoteAction(
+                vote_id=vote_id,
+                timestamp=timestamp,
+                voter_id=voter_id,
+                election_id=election_id)
+        _set_choices(action, compact, voting_option_ids, voting_option_indexes)
+
+        submit(public_key,
+               payload_pb2.BevPayload.CREATE_VOTE,
+               action,
+               declarations.create_vote(
+                   public_key,
+                   election_id,
+                   voter_id,
+                   vote_id,
+                   voting_option_ids))
+
+    for public_key, voter_id, election_id, vote_id, option_ids in ballots:
+        if rand.random() >= change_rate:
+            continue
+        voting_option_indexes = rand.sample(range(len(option_ids)), choices)
+        voting_option_ids = [option_ids[voting_option_index]
+                             for voting_option_index in voting_option_indexes]
+        if compact:
+            action = payload_pb2.UpdateVoteAction(
+                vote_uuid=addresser.pack_id(vote_id),
+                timestamp=timestamp,
+                election_uuid=addresser.pack_id(election_id))
+        else:
+            action = payload_pb2.UpdateVoteAction(
+                vote_id=vote_id,
+                timestamp=timestamp,
+                election_id=election_id)
+        _set_choices(action, compact, voting_option_ids, voting_option_indexes)
+
+        submit(public_key,
+               payload_pb2.BevPayload.UPDATE_VOTE,
+               action,
+               declarations.update_vote(
+                   public_key,
+                   election_id,
+                   voter_id,
+                   vote_id,
+                   voting_option_ids))
+
+    return transactions
+
+
+def _registered_voter_ids(registrations):
+    return [registration.voter_id for registration in registrations]
+
+
+def _multiple_options_criteria(choices):
+    if choices == 1:
+        return {}
+    return {
+        'multiple_options_criteria':
+            payload_pb2.CreateElectionAction.EQUAL_TO,
+        'multiple_options_value_min': choices,
+    }
+
+
+def _set_choices(action, compact, voting_option_ids, voting_option_indexes):
+    # A single choice is sent in the fields ballots had before multi-choice
+    # ballots existed
+    if compact and len(voting_option_indexes) == 1:
+        action.voting_option_index = voting_option_indexes[0]
+    elif compact:
+        action.voting_option_indexes.extend(voting_option_indexes)
+    elif len(voting_option_ids) == 1:
+        action.voting_option_id = voting_option_ids[0]
+    else:
+        action.voting_option_ids.extend(voting_option_ids)
+
+
+def run(transactions, latency):
+    """Applies the transactions in order with a fresh handler and state
+
+    Returns:
+        (dict, InMemoryContext): The apply latencies (list of float) and
+            the state bytes written (int) of each action, and the context
+            holding the resulting state
+    """
+    handler = SimpleSupplyHandler()
+    context = InMemoryContext(latency=latency)
+    stats = collections.OrderedDict()
+
+    for action, transaction in transactions:
+        latencies, written = stats.get(action, ([], 0))
+        bytes_written = context.bytes_written
+
+        start = time.perf_counter()
+        handler.apply(transaction, context)
+        latencies.append(time.perf_counter() - start)
+
+        stats[action] = (
+            latencies, written + context.bytes_written - bytes_written)
+
+    return stats, context
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[int(round(fraction * (len(values) - 1)))]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks the transaction handler on an in-memory '
+                    'state')
+    parser.add_argument(
+        '--voters', type=int, default=5000,
+        help='size of the electorate')
+    parser.add_argument(
+        '--elections', type=int, default=2,
+        help='number of elections every voter takes part in')
+    parser.add_argument(
+        '--options', type=int, default=4,
+        help='number of voting options of each election')
+    parser.add_argument(
+        '--change-rate', type=float, default=0.1,
+        help='share of the ballots that are changed')
+    parser.add_argument(
+        '--choices', type=int, default=1,
+        help='number of voting options every ballot picks')
+    parser.add_argument(
+        '--latency', type=float, default=0,
+        help='simulated validator round trip, in milliseconds')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+    transactions = make_workload(
+        opts.voters,
+        opts.elections,
+        opts.options,
+        opts.change_rate,
+        choices=opts.choices)
+    stats, context = run(transactions, opts.latency / 1000)
+
+    print('{} transactions, {} get_state and {} set_state calls, '
+          '{} addresses in state'.format(
+              len(transactions),
+              context.get_calls,
+              context.set_calls,
+              len(context.state)))
+    lookups = collections.Counter()
+    for _, labels, count in metrics.CONTAINER_CACHE.samples():
+        lookups[dict(labels)['result']] += count
+    print('{:.1f}% of {} container reads served by the parsed container '
+          'cache'.format(
+              lookups['hit'] * 100 / sum(lookups.values())
+              if lookups else 0,
+              sum(lookups.values())))
+    print('{:>30} {:>7} {:>10} {:>9} {:>9} {:>12} {:>9}'.format(
+        'action', 'count', 'tx/s', 'p50 ms', 'p99 ms', 'bytes', 'bytes/tx'))
+    row = '{:>30} {:>7} {:>10.0f} {:>9.3f} {:>9.3f} {:>12} {:>9.0f}'
+    for action, (latencies, written) in stats.items():
+        print(row.format(
+            ACTION_NAMES[action],
+            len(latencies),
+            len(latencies) / sum(latencies),
+            percentile(latencies, 0.5) * 1000,
+            percentile(latencies, 0.99) * 1000,
+            written,
+            written / len(latencies)))
@@ -0,0 +1,214 @@
+"""On-disk log of the transactions applied by the processor.
+
+A log is a sequence of records, each holding a serialized TransactionHeader
+and the transaction payload, both prefixed by their length. Logs whose name
+ends in .gz are compressed. They are written by the processor when started
+with --record, or built from batches, and replayed by simple_supply_tp.replay.
+"""
+import gzip
+import os
+import struct
+import threading
+import zlib
+
+from sawtooth_sdk.processor.handler import TransactionHandler
+from sawtooth_sdk.protobuf.batch_pb2 import BatchList
+from sawtooth_sdk.protobuf.transaction_pb2 import TransactionHeader
+
+from simple_supply_addressing import addresser
+
+
+MAGIC = b'BEVTXLOG1\n'
+_LENGTHS = struct.Struct('>II')
+
+# Records are kept in memory until this many are waiting, or for at most
+# FLUSH_INTERVAL seconds, so a processor that is killed loses no more than
+# that
+FLUSH_RECORDS = 1000
+FLUSH_INTERVAL = 1
+
+# Raised reading a gzip member cut short: EOFError at the end of the file,
+# or reading the member appended after it, zlib.error or an OSError for
+# its header or CRC (gzip.BadGzipFile from Python 3.8)
+_GZIP_TRUNCATION_ERRORS = (EOFError, zlib.error, OSError)
+
+
+def _open(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode)
+    return open(path, mode)
+
+
+class TransactionLogWriter(object):
+    """Appends transactions to a log. Records may be written from several
+    threads.
+
+    The records waiting are written together, as a complete gzip member in a
+    compressed log, so the log on disk can be read up to the last of them
+    at any time.
+
+    Args:
+        path (str): The log file, created if it does not exist
+        flush_records (int): Number of records written together
+        flush_interval (float): Seconds a record waits at most
+    """
+
+    def __init__(self, path, flush_records=FLUSH_RECORDS,
+                 flush_interval=FLUSH_INTERVAL):
+        new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'ab')
+        self._compress = path.endswith('.gz')
+        self._lock = threading.Lock()
+        self._records = []
+        self._flush_records = flush_records
+        if new:
+            self._records.append(MAGIC)
+            self._flush()
+
+        self._closed = threading.Event()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically,
+            args=(flush_interval,),
+            name='transaction-log-flusher',
+            daemon=True)
+        self._flusher.start()
+
+    def write(self, header_bytes, payload):
+        record = b''.join((
+            _LENGTHS.pack(len(header_bytes), len(payload)),
+            header_bytes,
+            payload))
+        with self._lock:
+            self._records.append(record)
+            if len(self._records) >= self._flush_records:
+                self._flush()
+
+    def flush(self):
+        """Writes the records waiting to the log
+        """
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        self._closed.set()
+        self._flusher.join()
+        with self._lock:
+            self._flush()
+            self._file.close()
+
+    def _flush_periodically(self, interval):
+        while not self._closed.wait(interval):
+            self.flush()
+
+    def _flush(self):
+        if not self._records:
+            return
+        data = b''.join(self._records)
+        self._records = []
+        if self._compress:
+            data = gzip.compress(data)
+        self._file.write(data)
+        self._file.flush()
+
+
+def read_transaction_log(path):
+    """Reads the records of a log in the order they were written. A log
+    cut short while a record or gzip member was written, as by a crash,
+    ends at the last complete record before it.
+
+    Yields:
+        (TransactionHeader, bytes): The header and payload of each
+            transaction
+    """
+    # A plain log cut short only leaves a short read
+    errors = _GZIP_TRUNCATION_ERRORS if path.endswith('.gz') else ()
+
+    with _open(path, 'rb') as log:
+        try:
+            magic = log.read(len(MAGIC))
+        except errors:
+            return
+        if not magic:
+            return
+        if magic != MAGIC:
+            raise ValueError('{} is not a transaction log'.format(path))
+
+        while True:
+            try:
+                record = _read_record(log)
+            except errors:
+                return
+            if record is None:
+                return
+            yield record
+
+
+def _read_record(log):
+    lengths = log.read(_LENGTHS.size)
+    if len(lengths) < _LENGTHS.size:
+        return None
+    header_length, payload_length = _LENGTHS.unpack(lengths)
+
+    header_bytes = log.read(header_length)
+    payload = log.read(payload_length)
+    if len(header_bytes) < header_length or len(payload) < payload_length:
+        return None
+
+    header = TransactionHeader()
+    header.ParseFromString(header_bytes)
+    return header, payload
+
+
+def import_batches(batch_list_paths, writer):
+    """Writes the BEV transactions of serialized BatchLists to a log, as the
+    validator would send them to the processor
+
+    Returns:
+        int: The number of transactions written
+    """
+    count = 0
+    for path in batch_list_paths:
+        batch_list = BatchList()
+        with open(path, 'rb') as batch_file:
+            batch_list.ParseFromString(batch_file.read())
+
+        for batch in batch_list.batches:
+            for transaction in batch.transactions:
+                header = TransactionHeader()
+                header.ParseFromString(transaction.header)
+                if header.family_name != addresser.FAMILY_NAME:
+                    continue
+                writer.write(transaction.header, transaction.payload)
+                count += 1
+    return count
+
+
+class RecordingHandler(TransactionHandler):
+    """Writes every transaction to a log before passing it to the wrapped
+    handler, rejected ones included
+
+    Args:
+        handler (TransactionHandler): The handler applying the transactions
+        writer (TransactionLogWriter): The log the transactions go to
+    """
+
+    def __init__(self, handler, writer):
+        self._handler = handler
+        self._writer = writer
+
+    @property
+    def family_name(self):
+        return self._handler.family_name
+
+    @property
+    def family_versions(self):
+        return self._handler.family_versions
+
+    @property
+    def namespaces(self):
+        return self._handler.namespaces
+
+    def apply(self, transaction, context):
+        self._writer.write(
+            transaction.header.SerializeToString(), transaction.payload)
+        self._handler.apply(transaction, context)
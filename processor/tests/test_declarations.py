@@ -0,0 +1,399 @@
+"""Checks that every action of the family only reads and writes the
+addresses simple_supply_addressing.declarations declares for it.
+
+Each transaction is applied by SimpleSupplyHandler with the whole namespace
+as its inputs and outputs, against a TracingContext recording what it
+touches, and must be accepted. The checks run for both family versions,
+and for the entries still stored with the version 1 address layout.
+"""
+import time
+import unittest
+import uuid
+
+from simple_supply_addressing import addresser
+from simple_supply_addressing import declarations
+
+from simple_supply_protobuf import payload_pb2
+from simple_supply_protobuf import pollRegistration_pb2
+from simple_supply_protobuf import vote_pb2
+
+from simple_supply_tp.conflicts import TracingContext
+from simple_supply_tp.handler import SimpleSupplyHandler
+from simple_supply_tp.in_memory import Transaction
+from simple_supply_tp.in_memory import TransactionHeader
+from simple_supply_tp.payload import DATA_FIELDS
+
+from simple_supply_validation.validator import SYNC_TOLERANCE
+
+
+Action = payload_pb2.BevPayload
+
+
+def _new_id():
+    return uuid.uuid4().hex
+
+
+def _new_public_key():
+    return '02' + _new_id() + _new_id()
+
+
+class CompactDeclarationsTest(unittest.TestCase):
+    """Actions sent with the current family version"""
+
+    family_version = addresser.FAMILY_VERSION
+
+    def setUp(self):
+        self.context = TracingContext()
+        self.handler = SimpleSupplyHandler()
+        self.now = int(time.time())
+        # The start of the voting window of each election
+        self._elections = {}
+        self.admin_id, self.admin_key = self._create_voter('ADMIN')
+        self.voter_id, self.voter_key = self._create_voter('VOTER')
+
+    @property
+    def compact(self):
+        return self.family_version != addresser.LEGACY_FAMILY_VERSION
+
+    def test_voter(self):
+        self._apply(
+            self.voter_key,
+            Action.UPDATE_VOTER,
+            payload_pb2.UpdateVoterAction(
+                voter_id=self.voter_id,
+                public_key=self.voter_key,
+                name='Renamed',
+                created_at=self.now),
+            declarations.update_voter(self.voter_key, self.voter_key))
+
+    def test_election(self):
+        election_id = _new_id()
+        voting_option_id = _new_id()
+
+        self._apply(
+            self.admin_key,
+            Action.CREATE_ELECTION,
+            payload_pb2.CreateElectionAction(**self._election(election_id)),
+            declarations.create_election(self.admin_key, election_id))
+        self._apply(
+            self.admin_key,
+            Action.UPDATE_ELECTION,
+            payload_pb2.UpdateElectionAction(**self._election(election_id)),
+            declarations.update_election(self.admin_key, election_id))
+
+        self._apply(
+            self.admin_key,
+            Action.CREATE_VOTING_OPTION,
+            self._voting_option(
+                payload_pb2.CreateVotingOptionAction,
+                voting_option_id,
+                election_id),
+            declarations.create_voting_option(
+                self.admin_key, voting_option_id, election_id))
+        self._apply(
+            self.admin_key,
+            Action.UPDATE_VOTING_OPTION,
+            self._voting_option(
+                payload_pb2.UpdateVotingOptionAction,
+                voting_option_id,
+                election_id),
+            declarations.update_voting_option(
+                self.admin_key, voting_option_id))
+
+        self._apply(
+            self.admin_key,
+            Action.CREATE_POLL_REGISTRATION,
+            self._poll_registration(
+                payload_pb2.CreatePollRegistrationAction,
+                self.voter_id,
+                election_id),
+            declarations.create_poll_registration(
+                self.admin_key, election_id, self.voter_id))
+        self._apply(
+            self.admin_key,
+            Action.UPDATE_POLL_REGISTRATION,
+            self._poll_registration(
+                payload_pb2.UpdatePollRegistrationAction,
+                self.voter_id,
+                election_id),
+            declarations.update_poll_registration(
+                self.admin_key, election_id, self.voter_id))
+
+    def test_election_bundle(self):
+        election_id, _ = self._create_election_bundle(
+            [self.voter_id], self.now - 3600, self.now + 3600)
+
+        voter_ids = [_new_id() for _ in range(3)]
+        self._apply(
+            self.admin_key,
+            Action.BULK_CREATE_POLL_REGISTRATIONS,
+            payload_pb2.BulkCreatePollRegistrationsAction(
+                poll_registrations=[
+                    self._poll_registration(
+                        payload_pb2.CreatePollRegistrationAction,
+                        voter_id,
+                        election_id)
+                    for voter_id in voter_ids]),
+            declarations.bulk_create_poll_registrations(
+                self.admin_key, election_id, voter_ids))
+
+    def test_ballot(self):
+        # The election ends long enough before the transactions are sent,
+        # so that it can be finalized once the ballot is cast and changed
+        election_id, voting_option_ids = self._create_election_bundle(
+            [self.voter_id], self.now - 7200, self.now - SYNC_TOLERANCE - 60)
+        vote_id = _new_id()
+
+        self._cast_ballot(election_id, vote_id, voting_option_ids, 0)
+        self._change_ballot(election_id, vote_id, voting_option_ids, 1)
+
+        self._apply(
+            self.admin_key,
+            Action.FINALIZE_ELECTION,
+            payload_pb2.FinalizeElectionAction(election_id=election_id),
+            declarations.finalize_election(self.admin_key, election_id))
+
+    def test_legacy_poll_registration(self):
+        election_id, voting_option_ids = self._create_election_bundle(
+            [], self.now - 3600, self.now + 3600)
+        voter_id = _new_id()
+        self._store_legacy_poll_registration(self.voter_id, election_id)
+        self._store_legacy_poll_registration(voter_id, election_id)
+
+        # A ballot is checked against the registration at its legacy address
+        self._cast_ballot(election_id, _new_id(), voting_option_ids, 0)
+
+        # A changed registration moves out of its legacy container
+        self._apply(
+            self.admin_key,
+            Action.UPDATE_POLL_REGISTRATION,
+            self._poll_registration(
+                payload_pb2.UpdatePollRegistrationAction,
+                voter_id,
+                election_id),
+            declarations.update_poll_registration(
+                self.admin_key, election_id, voter_id))
+        self.assertIn(
+            addresser.get_legacy_poll_registration_address(voter_id),
+            self.context.writes)
+
+    def test_legacy_ballot(self):
+        election_id, voting_option_ids = self._create_election_bundle(
+            [self.voter_id], self.now - 3600, self.now + 3600)
+        vote_id = _new_id()
+        self._store_legacy_vote(
+            vote_id, self.voter_id, election_id, voting_option_ids[0])
+
+        # A changed ballot moves out of its legacy container, and is indexed
+        # and counted in the tallies
+        self._change_ballot(election_id, vote_id, voting_option_ids, 1)
+        self.assertIn(
+            addresser.get_legacy_vote_address(vote_id), self.context.writes)
+
+    def test_count_legacy_ballots(self):
+        election_id, voting_option_ids = self._create_election_bundle(
+            [], self.now - 3600, self.now + 3600)
+        ballots = [(_new_id(), _new_id()) for _ in range(3)]
+        for vote_id, voter_id in ballots:
+            self._store_legacy_vote(
+                vote_id, voter_id, election_id, voting_option_ids[0])
+
+        self._apply(
+            self.admin_key,
+            Action.COUNT_LEGACY_BALLOTS,
+            payload_pb2.CountLegacyBallotsAction(
+                election_id=election_id,
+                ballots=[
+                    payload_pb2.CountLegacyBallotsAction.Ballot(
+                        vote_id=vote_id, voter_id=voter_id)
+                    for vote_id, voter_id in ballots]),
+            declarations.count_legacy_ballots(
+                self.admin_key, election_id, ballots))
+
+    def _apply(self, signer, action, data, declaration, timestamp=None):
+        payload = payload_pb2.BevPayload(
+            action=action, timestamp=timestamp or self.now)
+        getattr(payload, DATA_FIELDS[action]).CopyFrom(data)
+        transaction = Transaction(
+            header=TransactionHeader(
+                signer_public_key=signer,
+                family_version=self.family_version,
+                inputs=[addresser.NAMESPACE],
+                outputs=[addresser.NAMESPACE]),
+            payload=payload.SerializeToString())
+
+        self.context.reads.clear()
+        self.context.writes.clear()
+        self.handler.apply(transaction, self.context)
+
+        name = Action.Action.Name(action)
+        self.assertEqual(
+            set(), self.context.reads - set(declaration.inputs),
+            '{} reads undeclared addresses'.format(name))
+        self.assertEqual(
+            set(), self.context.writes - set(declaration.outputs),
+            '{} writes undeclared addresses'.format(name))
+
+    def _create_voter(self, voter_type):
+        voter_id, public_key = _new_id(), _new_public_key()
+        self._apply(
+            public_key,
+            Action.CREATE_VOTER,
+            payload_pb2.CreateVoterAction(
+                voter_id=voter_id,
+                public_key=public_key,
+                name=voter_id,
+                created_at=self.now,
+                type=voter_type),
+            declarations.create_voter(public_key, public_key))
+        return voter_id, public_key
+
+    def _create_election_bundle(self, voter_ids, start, end):
+        election_id = _new_id()
+        voting_option_ids = [_new_id() for _ in range(3)]
+
+        self._apply(
+            self.admin_key,
+            Action.CREATE_ELECTION_BUNDLE,
+            payload_pb2.CreateElectionBundleAction(
+                election=payload_pb2.CreateElectionAction(
+                    **self._election(election_id, start, end)),
+                voting_options=[
+                    self._voting_option(
+                        payload_pb2.CreateVotingOptionAction,
+                        voting_option_id,
+                        election_id)
+                    for voting_option_id in voting_option_ids],
+                poll_registrations=[
+                    self._poll_registration(
+                        payload_pb2.CreatePollRegistrationAction,
+                        voter_id,
+                        election_id)
+                    for voter_id in voter_ids]),
+            declarations.create_election_bundle(
+                self.admin_key, election_id, voting_option_ids, voter_ids))
+        return election_id, voting_option_ids
+
+    def _cast_ballot(self, election_id, vote_id, voting_option_ids, index):
+        timestamp = self._ballot_timestamp(election_id)
+        if self.compact:
+            action = payload_pb2.CreateVoteAction(
+                vote_uuid=addresser.pack_id(vote_id),
+                election_uuid=addresser.pack_id(election_id),
+                voter_id=self.voter_id,
+                voting_option_indexes=[index],
+                timestamp=timestamp)
+        else:
+            action = payload_pb2.CreateVoteAction(
+                vote_id=vote_id,
+                election_id=election_id,
+                voter_id=self.voter_id,
+                voting_option_ids=[voting_option_ids[index]],
+                timestamp=timestamp)
+
+        self._apply(
+            self.voter_key,
+            Action.CREATE_VOTE,
+            action,
+            declarations.create_vote(
+                self.voter_key,
+                election_id,
+                self.voter_id,
+                vote_id,
+                [voting_option_ids[index]]),
+            timestamp)
+
+    def _change_ballot(self, election_id, vote_id, voting_option_ids, index):
+        timestamp = self._ballot_timestamp(election_id) + 1
+        if self.compact:
+            action = payload_pb2.UpdateVoteAction(
+                vote_uuid=addresser.pack_id(vote_id),
+                election_uuid=addresser.pack_id(election_id),
+                voting_option_indexes=[index],
+                timestamp=timestamp)
+        else:
+            action = payload_pb2.UpdateVoteAction(
+                vote_id=vote_id,
+                election_id=election_id,
+                voting_option_ids=[voting_option_ids[index]],
+                timestamp=timestamp)
+
+        self._apply(
+            self.voter_key,
+            Action.UPDATE_VOTE,
+            action,
+            declarations.update_vote(
+                self.voter_key,
+                election_id,
+                self.voter_id,
+                vote_id,
+                [voting_option_ids[index]]),
+            timestamp)
+
+    def _ballot_timestamp(self, election_id):
+        # Ballots are sent while the election is open, which may be over
+        # when the test runs
+        return self._elections[election_id] + 1
+
+    def _election(self, election_id, start=None, end=None):
+        start = self.now if start is None else start
+        end = self.now + 3600 if end is None else end
+        self._elections[election_id] = start
+        return dict(
+            election_id=election_id,
+            name=election_id,
+            start_timestamp=start,
+            end_timestamp=end,
+            can_change_vote=True,
+            admin_id=self.admin_id,
+            status=True)
+
+    def _voting_option(self, action_type, voting_option_id, election_id):
+        return action_type(
+            voting_option_id=voting_option_id,
+            name=voting_option_id,
+            election_id=election_id,
+            status=True)
+
+    def _poll_registration(self, action_type, voter_id, election_id):
+        return action_type(
+            voter_id=voter_id,
+            name=voter_id,
+            election_id=election_id,
+            status=True)
+
+    def _store_legacy_poll_registration(self, voter_id, election_id):
+        container = pollRegistration_pb2.PollRegistrationContainer(
+            entries=[pollRegistration_pb2.PollRegistration(
+                voter_id=voter_id,
+                name=voter_id,
+                election_id=election_id,
+                status=True)])
+        self.context.state[
+            addresser.get_legacy_poll_registration_address(voter_id)] = \
+            container.SerializeToString()
+
+    def _store_legacy_vote(self,
+                           vote_id,
+                           voter_id,
+                           election_id,
+                           voting_option_id):
+        container = vote_pb2.VoteContainer(
+            entries=[vote_pb2.Vote(
+                vote_id=vote_id,
+                timestamp=self._ballot_timestamp(election_id),
+                voter_id=voter_id,
+                election_id=election_id,
+                voting_option_id=voting_option_id)])
+        self.context.state[addresser.get_legacy_vote_address(vote_id)] = \
+            container.SerializeToString()
+
+
+class LegacyDeclarationsTest(CompactDeclarationsTest):
+    """Actions sent with family version 0.1"""
+
+    family_version = addresser.LEGACY_FAMILY_VERSION
+
+
+if __name__ == '__main__':
+    unittest.main()
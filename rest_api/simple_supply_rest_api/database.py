@@ -58,9 +58,13 @@ class Database(object):
 
     async def fetch_current_elections_resources(self, voter_id, timestamp):
         fetch_elections = """
-                SELECT e.*,v.name AS "admin_name",(SELECT vote_id FROM votes WHERE voter_id='{0}'
-                    AND election_id=e.election_id LIMIT 1)
-                    IS NOT NULL AS "voted"
+                SELECT e.*,v.name AS "admin_name",(EXISTS(SELECT 1 FROM ballot_indexes b
+                    WHERE b.voter_id='{0}' AND b.election_id=e.election_id
+                    AND ({2}) >= b.start_block_num AND ({2}) < b.end_block_num)
+                    OR EXISTS(SELECT 1 FROM votes vt
+                    WHERE vt.voter_id='{0}' AND vt.election_id=e.election_id
+                    AND ({2}) >= vt.start_block_num AND ({2}) < vt.end_block_num))
+                    AS "voted"
                 FROM elections e JOIN voters v ON e.admin_id = v.voter_id
                 AND election_id IN (SELECT election_id FROM poll_registrations WHERE voter_id='{0}' AND status='1' 
                                     AND ({2}) >= start_block_num AND ({2}) < end_block_num)
@@ -78,9 +82,13 @@ class Database(object):
 
     async def fetch_past_elections_resources(self, voter_id, timestamp):
         fetch_elections = """
-                SELECT e.*,v.name AS "admin_name",(SELECT vote_id FROM votes WHERE voter_id='{0}'
-                    AND election_id=e.election_id LIMIT 1)
-                    IS NOT NULL AS "voted"
+                SELECT e.*,v.name AS "admin_name",(EXISTS(SELECT 1 FROM ballot_indexes b
+                    WHERE b.voter_id='{0}' AND b.election_id=e.election_id
+                    AND ({2}) >= b.start_block_num AND ({2}) < b.end_block_num)
+                    OR EXISTS(SELECT 1 FROM votes vt
+                    WHERE vt.voter_id='{0}' AND vt.election_id=e.election_id
+                    AND ({2}) >= vt.start_block_num AND ({2}) < vt.end_block_num))
+                    AS "voted"
                 FROM elections e JOIN voters v ON e.admin_id = v.voter_id
                 AND election_id IN (SELECT election_id FROM poll_registrations WHERE voter_id='{0}' AND status='1' 
                                     AND ({2}) >= start_block_num AND ({2}) < end_block_num)
@@ -114,9 +122,13 @@ class Database(object):
 
     async def fetch_public_past_elections_resources(self, voter_id, timestamp):
         fetch_elections = """
-                SELECT e.*,v.name AS "admin_name",(SELECT vote_id FROM votes WHERE voter_id='{0}'
-                    AND election_id=e.election_id LIMIT 1)
-                    IS NOT NULL AS "voted"
+                SELECT e.*,v.name AS "admin_name",(EXISTS(SELECT 1 FROM ballot_indexes b
+                    WHERE b.voter_id='{0}' AND b.election_id=e.election_id
+                    AND ({2}) >= b.start_block_num AND ({2}) < b.end_block_num)
+                    OR EXISTS(SELECT 1 FROM votes vt
+                    WHERE vt.voter_id='{0}' AND vt.election_id=e.election_id
+                    AND ({2}) >= vt.start_block_num AND ({2}) < vt.end_block_num))
+                    AS "voted"
                 FROM elections e JOIN voters v ON e.admin_id = v.voter_id
                 WHERE e.results_permission = 'PUBLIC'
                 AND e.status = '1'
@@ -173,46 +185,6 @@ class Database(object):
             await cursor.execute(fetch)
             return await cursor.fetchall()
 
-    async def insert_voting_option_num_vote_resource(self,
-                                                     voting_option_id,
-                                                     name,
-                                                     election_id):
-        num_votes = 0
-
-        insert = """
-           INSERT INTO count_votes (
-                    voting_option_id,
-                    name,
-                    election_id,
-                    num_votes)
-           VALUES ('{}', '{}', '{}', '{}')
-           """.format(
-            voting_option_id,
-            name,
-            election_id,
-            num_votes)
-
-        async with self._conn.cursor() as cursor:
-            await cursor.execute(insert)
-
-        self._conn.commit()
-
-    async def update_voting_option_num_vote_resource(self,
-                                                     voting_option_id,
-                                                     num_votes):
-        update = """
-        UPDATE count_votes
-        SET num_votes = '{1}'
-        WHERE voting_option_id = '{0}'
-        """.format(
-            voting_option_id,
-            num_votes)
-
-        async with self._conn.cursor() as cursor:
-            await cursor.execute(update)
-
-        self._conn.commit()
-
     async def fetch_auth_resource(self, public_key=None):
         fetch = """
         SELECT * FROM auth WHERE public_key='{}'
@@ -260,9 +232,13 @@ class Database(object):
                     SELECT e.*, v.name AS "admin_name", (SELECT voter_id FROM poll_registrations WHERE voter_id='{0}'
                        AND election_id='{1}' 
                        AND status='1' LIMIT 1) 
-                       IS NOT NULL AS "can_vote", (SELECT vote_id FROM votes WHERE voter_id='{0}'
-                        AND election_id='{1}' LIMIT 1)
-                        IS NOT NULL AS "voted"
+                       IS NOT NULL AS "can_vote", (EXISTS(SELECT 1 FROM ballot_indexes b
+                        WHERE b.voter_id='{0}' AND b.election_id='{1}'
+                        AND ({2}) >= b.start_block_num AND ({2}) < b.end_block_num)
+                        OR EXISTS(SELECT 1 FROM votes vt
+                        WHERE vt.voter_id='{0}' AND vt.election_id='{1}'
+                        AND ({2}) >= vt.start_block_num AND ({2}) < vt.end_block_num))
+                        AS "voted"
                     FROM elections e JOIN voters v ON e.admin_id = v.voter_id
                     WHERE election_id='{1}'
                     AND e.status = '1'
@@ -292,9 +268,13 @@ class Database(object):
                     SELECT e.*, v.name AS "admin_name", (SELECT voter_id FROM poll_registrations WHERE voter_id='{0}'
                        AND election_id='{1}' 
                        AND status='1' LIMIT 1) 
-                       IS NOT NULL AS "can_vote", (SELECT vote_id FROM votes WHERE voter_id='{0}'
-                        AND election_id='{1}' LIMIT 1)
-                        IS NOT NULL AS "voted"
+                       IS NOT NULL AS "can_vote", (EXISTS(SELECT 1 FROM ballot_indexes b
+                        WHERE b.voter_id='{0}' AND b.election_id='{1}'
+                        AND ({2}) >= b.start_block_num AND ({2}) < b.end_block_num)
+                        OR EXISTS(SELECT 1 FROM votes vt
+                        WHERE vt.voter_id='{0}' AND vt.election_id='{1}'
+                        AND ({2}) >= vt.start_block_num AND ({2}) < vt.end_block_num))
+                        AS "voted"
                     FROM elections e JOIN voters v ON e.admin_id = v.voter_id
                     WHERE election_id='{1}'
                     AND ({2}) >= e.start_block_num
@@ -306,15 +286,149 @@ class Database(object):
             return await cursor.fetchone()
 
     async def fetch_number_of_votes(self, election_id=None):
+        # Sums the counters of every tally shard of the election, so the
+        # cost depends on the number of voting options, not of ballots.
+        # Ballots cast before the tallies existed have no ballot index until
+        # they are counted into them, and are counted from their votes.
+        fetch = """
+                    WITH uncounted AS (
+                       SELECT unnest(COALESCE(NULLIF(v.voting_option_ids, '{{}}'),
+                                              ARRAY[v.voting_option_id])) AS "voting_option_id"
+                       FROM votes v
+                       WHERE v.election_id='{0}'
+                       AND ({1}) >= v.start_block_num
+                       AND ({1}) < v.end_block_num
+                       AND NOT EXISTS(SELECT 1 FROM ballot_indexes b
+                                      WHERE b.election_id = v.election_id
+                                      AND b.voter_id = v.voter_id
+                                      AND ({1}) >= b.start_block_num
+                                      AND ({1}) < b.end_block_num)
+                    )
+                    SELECT vo.voting_option_id, vo.name, vo.election_id,
+                       CAST(COALESCE(SUM(t.num_votes), 0)
+                            + (SELECT COUNT(*) FROM uncounted u
+                               WHERE u.voting_option_id = vo.voting_option_id)
+                            AS bigint) AS "num_votes"
+                    FROM voting_options vo LEFT JOIN vote_tallies t
+                       ON t.voting_option_id = vo.voting_option_id
+                       AND t.election_id = vo.election_id
+                       AND ({1}) >= t.start_block_num
+                       AND ({1}) < t.end_block_num
+                    WHERE vo.election_id='{0}'
+                    AND ({1}) >= vo.start_block_num
+                    AND ({1}) < vo.end_block_num
+                    GROUP BY vo.voting_option_id, vo.name, vo.election_id;
+                    """.format(election_id, LATEST_BLOCK_NUM)
+
+        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            await cursor.execute(fetch)
+            return await cursor.fetchall()
+
+    async def fetch_uncounted_ballots(self, election_id=None):
+        # Ballots cast before the vote tallies existed, which have no ballot
+        # index as every ballot counted in the tallies has
+        fetch = """
+                    SELECT v.vote_id, v.voter_id FROM votes v
+                    WHERE v.election_id='{0}'
+                    AND ({1}) >= v.start_block_num
+                    AND ({1}) < v.end_block_num
+                    AND NOT EXISTS(SELECT 1 FROM ballot_indexes b
+                                   WHERE b.election_id = v.election_id
+                                   AND b.voter_id = v.voter_id
+                                   AND ({1}) >= b.start_block_num
+                                   AND ({1}) < b.end_block_num)
+                    ORDER BY v.vote_id;
+                    """.format(election_id, LATEST_BLOCK_NUM)
+
+        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            await cursor.execute(fetch)
+            return await cursor.fetchall()
+
+    async def fetch_election_ballots(self, election_id=None):
+        fetch = """
+                    SELECT vote_id, voter_id FROM votes
+                    WHERE election_id='{0}'
+                    AND ({1}) >= start_block_num
+                    AND ({1}) < end_block_num
+                    ORDER BY vote_id;
+                    """.format(election_id, LATEST_BLOCK_NUM)
+
+        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            await cursor.execute(fetch)
+            return await cursor.fetchall()
+
+    async def fetch_final_number_of_votes(self, election_id=None):
+        # Reads the counts stored when the election was finalized, which
+        # never change afterwards
         fetch = """
-                    SELECT * FROM count_votes
-                    WHERE election_id='{0}';
-                    """.format(election_id)
+                    SELECT vo.voting_option_id, vo.name, vo.election_id,
+                       CAST(COALESCE(r.num_votes, 0) AS bigint) AS "num_votes"
+                    FROM voting_options vo LEFT JOIN election_result_counts r
+                       ON r.voting_option_id = vo.voting_option_id
+                       AND r.election_id = vo.election_id
+                       AND ({1}) >= r.start_block_num
+                       AND ({1}) < r.end_block_num
+                    WHERE vo.election_id='{0}'
+                    AND ({1}) >= vo.start_block_num
+                    AND ({1}) < vo.end_block_num;
+                    """.format(election_id, LATEST_BLOCK_NUM)
 
         async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
             await cursor.execute(fetch)
             return await cursor.fetchall()
 
+    async def fetch_election_result(self, election_id=None):
+        fetch = """
+                    SELECT election_id, num_votes, finalized_at,
+                       start_block_num AS "finalized_block_num"
+                    FROM election_results
+                    WHERE election_id='{0}'
+                    AND ({1}) >= start_block_num
+                    AND ({1}) < end_block_num;
+                    """.format(election_id, LATEST_BLOCK_NUM)
+
+        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            await cursor.execute(fetch)
+            return await cursor.fetchone()
+
+    async def fetch_ballot_eligibility(self, voting_option_id=None, voter_id=None):
+        # Ballots cast before the ballot index existed have none until they
+        # are counted into the tallies, so their votes are looked up too
+        fetch = """
+                    SELECT vo.voting_option_id, vo.election_id, e.status,
+                       e.start_timestamp, e.end_timestamp, e.voting_option_ids,
+                       e.multiple_options_criteria, e.multiple_options_value_min,
+                       e.multiple_options_value_max,
+                       EXISTS(SELECT 1 FROM poll_registrations pr
+                          WHERE pr.election_id = vo.election_id
+                          AND pr.voter_id = '{1}'
+                          AND pr.status = '1'
+                          AND ({2}) >= pr.start_block_num
+                          AND ({2}) < pr.end_block_num) AS "registered",
+                       EXISTS(SELECT 1 FROM ballot_indexes b
+                          WHERE b.election_id = vo.election_id
+                          AND b.voter_id = '{1}'
+                          AND ({2}) >= b.start_block_num
+                          AND ({2}) < b.end_block_num)
+                       OR EXISTS(SELECT 1 FROM votes vt
+                          WHERE vt.election_id = vo.election_id
+                          AND vt.voter_id = '{1}'
+                          AND ({2}) >= vt.start_block_num
+                          AND ({2}) < vt.end_block_num) AS "voted"
+                    FROM voting_options vo JOIN elections e
+                       ON e.election_id = vo.election_id
+                       AND ({2}) >= e.start_block_num
+                       AND ({2}) < e.end_block_num
+                    WHERE vo.voting_option_id = '{0}'
+                    AND vo.status = '1'
+                    AND ({2}) >= vo.start_block_num
+                    AND ({2}) < vo.end_block_num;
+                    """.format(voting_option_id, voter_id, LATEST_BLOCK_NUM)
+
+        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            await cursor.execute(fetch)
+            return await cursor.fetchone()
+
     async def fetch_poll_book(self, election_id=None):
         fetch = """
                     SELECT * FROM poll_registrations
@@ -369,16 +483,6 @@ class Database(object):
             await cursor.execute(fetch)
             return await cursor.fetchone()
 
-    async def fetch_voting_option_num_vote_resource(self, voting_option_id=None):
-        fetch = """
-              SELECT * FROM count_votes
-              WHERE voting_option_id='{0}';
-              """.format(voting_option_id)
-
-        async with self._conn.cursor(cursor_factory=RealDictCursor) as cursor:
-            await cursor.execute(fetch)
-            return await cursor.fetchone()
-
     async def fetch_election_voting_options_resource(self, election_id=None):
         fetch = """
            SELECT * FROM voting_options
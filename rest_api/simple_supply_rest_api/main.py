@@ -88,6 +88,9 @@ def start_rest_api(host, port, messenger, database):
     app.router.add_get('/elections/public/past', handler.list_public_past_elections)
     app.router.add_get('/elections/{electionId}', handler.get_election)
     app.router.add_get('/elections/{electionId}/number_of_votes', handler.get_election_votes)
+    app.router.add_get('/elections/{electionId}/recount', handler.recount_election_votes)
+    app.router.add_post('/elections/{electionId}/finalize', handler.finalize_election)
+    app.router.add_get('/elections/{electionId}/result', handler.get_election_result)
     app.router.add_get('/elections/{electionId}/poll_book', handler.get_poll_registrations)
     app.router.add_get('/elections/{electionId}/poll_book/count', handler.count_poll_registrations)
     app.router.add_get('/elections/{electionId}/voting_options', handler.list_voting_options_election)
@@ -1,5 +1,7 @@
 from sawtooth_rest_api.messaging import Connection
 from sawtooth_rest_api.protobuf import client_batch_submit_pb2
+from sawtooth_rest_api.protobuf import client_list_control_pb2
+from sawtooth_rest_api.protobuf import client_state_pb2
 from sawtooth_rest_api.protobuf import validator_pb2
 from sawtooth_signing import CryptoFactory
 from sawtooth_signing import create_context
@@ -7,12 +9,20 @@ from sawtooth_signing import secp256k1
 from simple_supply_rest_api.errors import ApiBadRequest
 from simple_supply_rest_api.errors import ApiInternalError
 
+from simple_supply_addressing import addresser
+
+from simple_supply_protobuf import vote_pb2
+
 from simple_supply_rest_api.transaction_creation import \
     make_create_election_transaction
 from simple_supply_rest_api.transaction_creation import \
     make_create_voting_option_transaction
 from simple_supply_rest_api.transaction_creation import \
     make_create_poll_registration_transaction
+from simple_supply_rest_api.transaction_creation import \
+    make_create_election_bundle_transaction
+from simple_supply_rest_api.transaction_creation import \
+    make_bulk_create_poll_registrations_transaction
 from simple_supply_rest_api.transaction_creation import \
     make_create_voter_transaction
 from simple_supply_rest_api.transaction_creation import \
@@ -27,10 +37,15 @@ from simple_supply_rest_api.transaction_creation import \
     make_update_voting_option_status_transaction
 from simple_supply_rest_api.transaction_creation import \
     make_update_poll_book_status_transaction
+from simple_supply_rest_api.transaction_creation import \
+    make_finalize_election_transaction
+from simple_supply_rest_api.transaction_creation import \
+    make_count_legacy_ballots_transaction
 import logging
 
 LOGGER = logging.getLogger(__name__)
 MAX_TRIES = 50
+STATE_PAGE_SIZE = 1000
 
 class Messenger(object):
     def __init__(self, validator_url, database):
@@ -64,7 +79,10 @@ class Messenger(object):
                                                can_show_realtime,
                                                admin_id,
                                                status,
-                                               timestamp):
+                                               timestamp,
+                                               multiple_options_criteria='NONE',
+                                               multiple_options_value_min=0,
+                                               multiple_options_value_max=0):
         transaction_signer = self._crypto_factory.new_signer(
             secp256k1.Secp256k1PrivateKey.from_hex(private_key))
 
@@ -81,7 +99,10 @@ class Messenger(object):
             can_show_realtime=can_show_realtime,
             admin_id=admin_id,
             status=status,
-            timestamp=timestamp)
+            timestamp=timestamp,
+            multiple_options_criteria=multiple_options_criteria,
+            multiple_options_value_min=multiple_options_value_min,
+            multiple_options_value_max=multiple_options_value_max)
 
         count_tries = 0
 
@@ -166,6 +187,93 @@ class Messenger(object):
         if count_tries == MAX_TRIES:
             raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
 
+    async def send_create_election_bundle_transaction(self,
+                                                      private_key,
+                                                      election_id,
+                                                      name,
+                                                      description,
+                                                      start_timestamp,
+                                                      end_timestamp,
+                                                      results_permission,
+                                                      can_change_vote,
+                                                      can_show_realtime,
+                                                      admin_id,
+                                                      status,
+                                                      voting_options,
+                                                      poll_registrations,
+                                                      timestamp,
+                                                      multiple_options_criteria='NONE',
+                                                      multiple_options_value_min=0,
+                                                      multiple_options_value_max=0):
+        transaction_signer = self._crypto_factory.new_signer(
+            secp256k1.Secp256k1PrivateKey.from_hex(private_key))
+
+        batch = make_create_election_bundle_transaction(
+            transaction_signer=transaction_signer,
+            batch_signer=self._batch_signer,
+            election_id=election_id,
+            name=name,
+            description=description,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
+            results_permission=results_permission,
+            can_change_vote=can_change_vote,
+            can_show_realtime=can_show_realtime,
+            admin_id=admin_id,
+            status=status,
+            voting_options=voting_options,
+            poll_registrations=poll_registrations,
+            timestamp=timestamp,
+            multiple_options_criteria=multiple_options_criteria,
+            multiple_options_value_min=multiple_options_value_min,
+            multiple_options_value_max=multiple_options_value_max)
+
+        count_tries = 0
+
+        while await self._send_and_wait_for_commit(batch) is False and count_tries < MAX_TRIES:
+            election = await self._database.fetch_election_resource(election_id=election_id)
+
+            if election is not None:
+                break
+
+            LOGGER.info("Invalid transaction. Retrying...")
+            count_tries = count_tries + 1
+
+        if count_tries == MAX_TRIES:
+            raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
+
+    async def send_bulk_create_poll_registrations_transaction(self,
+                                                              private_key,
+                                                              election_id,
+                                                              poll_registrations,
+                                                              timestamp):
+        transaction_signer = self._crypto_factory.new_signer(
+            secp256k1.Secp256k1PrivateKey.from_hex(private_key))
+
+        batch = make_bulk_create_poll_registrations_transaction(
+            transaction_signer=transaction_signer,
+            batch_signer=self._batch_signer,
+            election_id=election_id,
+            poll_registrations=poll_registrations,
+            timestamp=timestamp)
+
+        count_tries = 0
+
+        while await self._send_and_wait_for_commit(batch) is False and count_tries < MAX_TRIES:
+            # The registrations of a chunk are committed together
+            poll_book_registration = await self._database.fetch_poll_book_registration(
+                election_id=election_id,
+                voter_id=poll_registrations[-1].get('voter_id'))
+
+            if poll_book_registration is not None:
+                break
+
+            LOGGER.info("Invalid transaction. Retrying...")
+            count_tries = count_tries + 1
+
+        if count_tries == MAX_TRIES:
+            raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
+
     async def send_create_voter_transaction(self,
                                             private_key,
                                             voter_id,
@@ -237,7 +345,8 @@ class Messenger(object):
                                            timestamp,
                                            voter_id,
                                            election_id,
-                                           voting_option_id):
+                                           voting_option_ids,
+                                           voting_option_indexes=None):
         transaction_signer = self._crypto_factory.new_signer(
             secp256k1.Secp256k1PrivateKey.from_hex(private_key))
 
@@ -248,7 +357,8 @@ class Messenger(object):
             timestamp=timestamp,
             voter_id=voter_id,
             election_id=election_id,
-            voting_option_id=voting_option_id)
+            voting_option_ids=voting_option_ids,
+            voting_option_indexes=voting_option_indexes)
 
         count_tries = 0
 
@@ -258,6 +368,7 @@ class Messenger(object):
                 break
 
             LOGGER.debug("Invalid transaction. Retrying...")
+            count_tries = count_tries + 1
 
         if count_tries == MAX_TRIES:
             raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
@@ -265,8 +376,11 @@ class Messenger(object):
     async def send_update_vote_transaction(self,
                                            private_key,
                                            vote_id,
+                                           voter_id,
+                                           election_id,
                                            timestamp,
-                                           voting_option_id):
+                                           voting_option_ids,
+                                           voting_option_indexes=None):
         transaction_signer = self._crypto_factory.new_signer(
             secp256k1.Secp256k1PrivateKey.from_hex(private_key))
 
@@ -274,8 +388,11 @@ class Messenger(object):
             transaction_signer=transaction_signer,
             batch_signer=self._batch_signer,
             vote_id=vote_id,
+            voter_id=voter_id,
+            election_id=election_id,
             timestamp=timestamp,
-            voting_option_id=voting_option_id)
+            voting_option_ids=voting_option_ids,
+            voting_option_indexes=voting_option_indexes)
 
         count_tries = 0
 
@@ -288,6 +405,7 @@ class Messenger(object):
                 break
 
             LOGGER.debug("Invalid transaction. Retrying...")
+            count_tries = count_tries + 1
 
         if count_tries == MAX_TRIES:
             raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
@@ -304,7 +422,10 @@ class Messenger(object):
                                                can_show_realtime,
                                                admin_id,
                                                status,
-                                               timestamp):
+                                               timestamp,
+                                               multiple_options_criteria='NONE',
+                                               multiple_options_value_min=0,
+                                               multiple_options_value_max=0):
         transaction_signer = self._crypto_factory.new_signer(
             secp256k1.Secp256k1PrivateKey.from_hex(private_key))
 
@@ -321,7 +442,10 @@ class Messenger(object):
             can_show_realtime=can_show_realtime,
             admin_id=admin_id,
             status=status,
-            timestamp=timestamp)
+            timestamp=timestamp,
+            multiple_options_criteria=multiple_options_criteria,
+            multiple_options_value_min=multiple_options_value_min,
+            multiple_options_value_max=multiple_options_value_max)
 
         count_tries = 0
 
@@ -412,6 +536,150 @@ class Messenger(object):
         if count_tries == MAX_TRIES:
             raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
 
+    async def send_finalize_election_transaction(self,
+                                                 private_key,
+                                                 election_id,
+                                                 timestamp):
+        transaction_signer = self._crypto_factory.new_signer(
+            secp256k1.Secp256k1PrivateKey.from_hex(private_key))
+
+        batch = make_finalize_election_transaction(
+            transaction_signer=transaction_signer,
+            batch_signer=self._batch_signer,
+            election_id=election_id,
+            timestamp=timestamp)
+
+        count_tries = 0
+
+        while await self._send_and_wait_for_commit(batch) is False and count_tries < MAX_TRIES:
+            election_result = await self._database.fetch_election_result(election_id=election_id)
+
+            if election_result is not None:
+                break
+
+            LOGGER.info("Invalid transaction. Retrying...")
+            count_tries = count_tries + 1
+
+        if count_tries == MAX_TRIES:
+            raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
+
+    async def send_count_legacy_ballots_transaction(self,
+                                                    private_key,
+                                                    election_id,
+                                                    ballots,
+                                                    timestamp):
+        transaction_signer = self._crypto_factory.new_signer(
+            secp256k1.Secp256k1PrivateKey.from_hex(private_key))
+
+        batch = make_count_legacy_ballots_transaction(
+            transaction_signer=transaction_signer,
+            batch_signer=self._batch_signer,
+            election_id=election_id,
+            ballots=ballots,
+            timestamp=timestamp)
+
+        count_tries = 0
+
+        while await self._send_and_wait_for_commit(batch) is False and count_tries < MAX_TRIES:
+            # The ballots of a chunk are counted together
+            uncounted_ballots = await self._database.fetch_uncounted_ballots(election_id=election_id)
+
+            if ballots[-1] not in uncounted_ballots:
+                break
+
+            LOGGER.info("Invalid transaction. Retrying...")
+            count_tries = count_tries + 1
+
+        if count_tries == MAX_TRIES:
+            raise ApiInternalError("Invalid transaction. MAX_TRIES limit reached.")
+
+    async def fetch_election_votes(self, election_id):
+        """Lists the ballots of an election straight from the validator's
+        state, by querying the address prefix shared by all of them
+
+        Args:
+            election_id (str): Unique ID of the election
+
+        Returns:
+            list of vote_pb2.Vote: The ballots of the election
+        """
+        prefix = addresser.get_election_votes_prefix(election_id)
+        paging = client_list_control_pb2.ClientPagingControls(
+            limit=STATE_PAGE_SIZE)
+        votes = []
+
+        while True:
+            list_request = client_state_pb2.ClientStateListRequest(
+                address=prefix,
+                paging=paging)
+            res = await self._connection.send(
+                validator_pb2.Message.CLIENT_STATE_LIST_REQUEST,
+                list_request.SerializeToString(),
+                500
+            )
+
+            list_response = client_state_pb2.ClientStateListResponse()
+            list_response.ParseFromString(res.content)
+            if list_response.status == \
+                    client_state_pb2.ClientStateListResponse.NO_RESOURCE:
+                break
+            if list_response.status != \
+                    client_state_pb2.ClientStateListResponse.OK:
+                raise ApiInternalError(
+                    'Unable to list the votes of the election {}'.format(
+                        election_id))
+
+            for entry in list_response.entries:
+                container = vote_pb2.VoteContainer()
+                container.ParseFromString(entry.data)
+                votes.extend(container.entries)
+
+            if not list_response.paging.next:
+                break
+            paging = client_list_control_pb2.ClientPagingControls(
+                start=list_response.paging.next,
+                limit=STATE_PAGE_SIZE)
+
+        return votes
+
+    async def fetch_legacy_votes(self, vote_ids):
+        """Reads ballots which were not migrated from their legacy
+        addresses, outside the prefix of their election
+
+        Args:
+            vote_ids (list of str): Unique IDs of the votes
+
+        Returns:
+            list of vote_pb2.Vote: The ballots found at a legacy address
+        """
+        votes = []
+        for vote_id in vote_ids:
+            get_request = client_state_pb2.ClientStateGetRequest(
+                address=addresser.get_legacy_vote_address(vote_id))
+            res = await self._connection.send(
+                validator_pb2.Message.CLIENT_STATE_GET_REQUEST,
+                get_request.SerializeToString(),
+                500
+            )
+
+            get_response = client_state_pb2.ClientStateGetResponse()
+            get_response.ParseFromString(res.content)
+            if get_response.status == \
+                    client_state_pb2.ClientStateGetResponse.NO_RESOURCE:
+                continue
+            if get_response.status != \
+                    client_state_pb2.ClientStateGetResponse.OK:
+                raise ApiInternalError(
+                    'Unable to read the vote {}'.format(vote_id))
+
+            # Legacy containers were appended to, so they are not sorted
+            container = vote_pb2.VoteContainer()
+            container.ParseFromString(get_response.value)
+            votes.extend(vote for vote in container.entries
+                         if vote.vote_id == vote_id)
+
+        return votes
+
     async def _send_and_wait_for_commit(self, batch):
         # Send transaction to validator
         submit_request = client_batch_submit_pb2.ClientBatchSubmitRequest(
@@ -16,12 +16,21 @@ from simple_supply_rest_api.errors import ApiNotFound
 from simple_supply_rest_api.errors import ApiUnauthorized
 from simple_supply_rest_api.errors import ApiInternalError
 
+from simple_supply_validation.validator import SYNC_TOLERANCE
+
 import uuid
 
 from diskcache import Cache
 
 LOGGER = logging.getLogger(__name__)
 
+# Number of voters registered by each poll book transaction
+POLL_BOOK_CHUNK_SIZE = 1000
+
+# Number of ballots cast before the vote tallies existed that each
+# transaction counts into them
+LEGACY_BALLOT_CHUNK_SIZE = 250
+
 
 class RouteHandler(object):
     def __init__(self, loop, messenger, database):
@@ -52,7 +61,14 @@ class RouteHandler(object):
         voting_options.append({"name": "NULL", "description": "VOTE NULL"})
         voting_options.append({"name": "BLANK", "description": "VOTE BLANK"})
 
-        await self._messenger.send_create_election_transaction(
+        for voting_option in voting_options:
+            voting_option['voting_option_id'] = uuid.uuid1().hex
+
+        poll_registrations = [
+            {'voter_id': poll_book.get('id'), 'name': poll_book.get('name')}
+            for poll_book in body.get('poll_book')]
+
+        await self._messenger.send_create_election_bundle_transaction(
             private_key=private_key,
             election_id=election_id,
             name=body.get('name'),
@@ -64,35 +80,16 @@ class RouteHandler(object):
             can_show_realtime=body.get('can_show_realtime'),
             admin_id=admin.get('voter_id'),
             status=1,
-            timestamp=get_time()
+            voting_options=voting_options,
+            poll_registrations=poll_registrations[:POLL_BOOK_CHUNK_SIZE],
+            timestamp=get_time(),
+            multiple_options_criteria=body.get('multiple_options_criteria', 'NONE'),
+            multiple_options_value_min=body.get('multiple_options_value_min', 0),
+            multiple_options_value_max=body.get('multiple_options_value_max', 0)
         )
 
-        for voting_option in voting_options:
-            voting_option_id = uuid.uuid1().hex
-
-            await self._messenger.send_create_voting_option_transaction(
-                private_key=private_key,
-                voting_option_id=voting_option_id,
-                name=voting_option.get('name'),
-                description=voting_option.get('description'),
-                election_id=election_id,
-                status=1,
-                timestamp=get_time()
-            )
-
-            await self._database.insert_voting_option_num_vote_resource(voting_option_id=voting_option_id,
-                                                                        name=voting_option.get('name'),
-                                                                        election_id=election_id)
-
-        for poll_book in body.get('poll_book'):
-            await self._messenger.send_create_poll_registration_transaction(
-                private_key=private_key,
-                voter_id=poll_book.get('id'),
-                name=poll_book.get('name'),
-                election_id=election_id,
-                status=1,
-                timestamp=get_time()
-            )
+        await self._send_poll_registrations(
+            private_key, election_id, poll_registrations[POLL_BOOK_CHUNK_SIZE:])
 
         return json_response({'data': 'Create election transaction submitted'})
 
@@ -186,65 +183,68 @@ class RouteHandler(object):
                 'The voting option ID is a required query string parameter'
             )
 
-        voter = await self._database.fetch_voter_resource(public_key=public_key)
-
-        if voter is None:
-            raise ApiNotFound(
-                'Voter with the public_key '
-                '{} was not found'.format(public_key))
+        # A ballot picking several voting options lists all of them in the
+        # body, including the one in the path
+        voting_option_ids = body.get('voting_option_ids') or [voting_option_id]
+        if voting_option_id not in voting_option_ids:
+            raise ApiBadRequest(
+                'The voting option {} must be one of the '
+                'voting_option_ids'.format(voting_option_id))
 
-        voting_option = await self._database.fetch_voting_option_resource(
-            voting_option_id=voting_option_id)
-        vo_count_vote = await self._database.fetch_voting_option_num_vote_resource(
-            voting_option_id=voting_option_id)
+        # The processor enforces these checks on chain; this single query
+        # only turns the common failures into readable errors early
+        ballot = await self._database.fetch_ballot_eligibility(
+            voting_option_id=voting_option_id,
+            voter_id=user.get('voter_id'))
 
-        if voting_option is None:
+        if ballot is None:
             raise ApiNotFound(
                 'Voting Option with the voting option id '
                 '{} was not found'.format(voting_option_id))
 
-        election_id = voting_option.get('election_id')
-        election = await self._database.fetch_election_resource(election_id=election_id)
+        election_id = ballot.get('election_id')
 
-        if election.get('status') == 0:
+        if not ballot.get('status'):
             raise ApiBadRequest(
                 'Election with the election id '
                 '{} is cancelled'.format(election_id))
 
         current_time = get_time()
 
-        if election.get('end_timestamp') < current_time or election.get('start_timestamp') > current_time:
+        if ballot.get('end_timestamp') < current_time or ballot.get('start_timestamp') > current_time:
             raise ApiBadRequest(
                 'Not in election time.'.format())
 
-        poll_registration = await self._database.fetch_poll_book_registration(voter_id=user.get('voter_id'),
-                                                                              election_id=election_id)
-
-        if poll_registration is None:
+        if not ballot.get('registered'):
             raise ApiBadRequest(
                 'Voter is not registered in the poll book of the election with the id '
                 '{} .'.format(election_id))
 
-        num_votes_update = vo_count_vote.get('num_votes') + 1
+        if ballot.get('voted'):
+            raise ApiConflict(
+                'Voter already voted in the election with the id '
+                '{} .'.format(election_id))
+
+        validate_ballot_size(ballot, voting_option_ids)
 
         await self._messenger.send_create_vote_transaction(
             private_key=private_key,
             vote_id=uuid.uuid1().hex,
             timestamp=get_time(),
-            voter_id=voter.get('voter_id'),
-            election_id=voting_option.get('election_id'),
-            voting_option_id=voting_option_id)
-
-        await self._database.update_voting_option_num_vote_resource(voting_option_id=voting_option_id,
-                                                                    num_votes=num_votes_update)
+            voter_id=user.get('voter_id'),
+            election_id=election_id,
+            voting_option_ids=voting_option_ids,
+            voting_option_indexes=get_voting_option_indexes(
+                ballot, voting_option_ids))
 
         return json_response({'data': 'Create vote transaction submitted'})
 
     async def update_vote(self, request):
         private_key, public_key, user = await self._authorize(request)
         body = await decode_request(request)
-        required_fields = ['voting_option_id']
-        validate_fields(required_fields, body)
+        if body.get('voting_option_ids') is None:
+            required_fields = ['voting_option_id']
+            validate_fields(required_fields, body)
 
         vote_id = request.match_info.get('voteId', '')
 
@@ -254,14 +254,18 @@ class RouteHandler(object):
             )
 
         vote = await self._database.fetch_vote_resource(vote_id=vote_id)
-        election_id = vote.get('election_id')
 
         if vote is None:
             raise ApiNotFound(
                 'Vote with the vote id '
                 '{} was not found'.format(vote_id))
 
-        if vote.get('voting_option_id') == body.get('voting_option_id'):
+        election_id = vote.get('election_id')
+
+        new_voting_option_ids = body.get('voting_option_ids') or [body.get('voting_option_id')]
+        voting_option_ids = vote.get('voting_option_ids') or [vote.get('voting_option_id')]
+
+        if set(voting_option_ids) == set(new_voting_option_ids):
             raise ApiBadRequest(
                 'Vote must be different.'
             )
@@ -294,29 +298,29 @@ class RouteHandler(object):
                 'User is not the owner of the election with the id '
                 '{} .'.format(election_id))
 
-        new_voting_option_id = body.get('voting_option_id')
-        old_voting_option_id = vote.get('voting_option_id')
+        validate_ballot_size(election, new_voting_option_ids)
 
-        old_num_vote = await self._database.fetch_voting_option_num_vote_resource(
-            voting_option_id=old_voting_option_id)
-        new_num_vote = await self._database.fetch_voting_option_num_vote_resource(
-            voting_option_id=new_voting_option_id)
-        num_votes_remove = old_num_vote.get('num_votes') - 1
-        num_votes_update = new_num_vote.get('num_votes') + 1
+        # A changed ballot may only pick the enabled options of its election,
+        # as a new one; the processor rejects any other
+        voting_options = await self._database.fetch_election_voting_options_resource(
+            election_id=election_id)
+        available_voting_option_ids = [voting_option.get('voting_option_id')
+                                       for voting_option in voting_options]
+        for new_voting_option_id in new_voting_option_ids:
+            if new_voting_option_id not in available_voting_option_ids:
+                raise ApiBadRequest(
+                    'Voting option {} is not available in the election with '
+                    'the id {} .'.format(new_voting_option_id, election_id))
 
         await self._messenger.send_update_vote_transaction(
             private_key=private_key,
             vote_id=vote_id,
+            voter_id=user.get('voter_id'),
+            election_id=election_id,
             timestamp=get_time(),
-            voting_option_id=new_voting_option_id)
-
-        # remove -1 to old voting option
-        await self._database.update_voting_option_num_vote_resource(voting_option_id=old_voting_option_id,
-                                                                    num_votes=num_votes_remove)
-
-        # add +1 to new voting option
-        await self._database.update_voting_option_num_vote_resource(voting_option_id=new_voting_option_id,
-                                                                    num_votes=num_votes_update)
+            voting_option_ids=new_voting_option_ids,
+            voting_option_indexes=get_voting_option_indexes(
+                election, new_voting_option_ids))
 
         return json_response(
             {'data': 'Update Vote transaction submitted'})
@@ -367,7 +371,13 @@ class RouteHandler(object):
                 'can_show_realtime') is not None else election.get('can_show_realtime'),
             admin_id=user.get('voter_id'),
             status=body.get('status') if body.get('status') is not None else election.get('status'),
-            timestamp=get_time())
+            timestamp=get_time(),
+            multiple_options_criteria=body.get('multiple_options_criteria') if body.get(
+                'multiple_options_criteria') is not None else election.get('multiple_options_criteria') or 'NONE',
+            multiple_options_value_min=body.get('multiple_options_value_min') if body.get(
+                'multiple_options_value_min') is not None else election.get('multiple_options_value_min') or 0,
+            multiple_options_value_max=body.get('multiple_options_value_max') if body.get(
+                'multiple_options_value_max') is not None else election.get('multiple_options_value_max') or 0)
 
         if body.get('voting_options') is not None:
             for voting_option in body.get('voting_options'):
@@ -382,20 +392,12 @@ class RouteHandler(object):
                     status=1,
                     timestamp=get_time()
                 )
-
-                await self._database.insert_voting_option_num_vote_resource(voting_option_id=voting_option_id,
-                                                                            name=voting_option.get('name'),
-                                                                            election_id=election_id)
         if body.get('poll_book') is not None:
-            for poll_book in body.get('poll_book'):
-                await self._messenger.send_create_poll_registration_transaction(
-                    private_key=private_key,
-                    voter_id=poll_book.get('id'),
-                    name=poll_book.get('name'),
-                    election_id=election_id,
-                    status=1,
-                    timestamp=get_time()
-                )
+            await self._send_poll_registrations(
+                private_key,
+                election_id,
+                [{'voter_id': poll_book.get('id'), 'name': poll_book.get('name')}
+                 for poll_book in body.get('poll_book')])
 
         return json_response(
             {'data': 'Update Election transaction submitted'})
@@ -439,7 +441,11 @@ class RouteHandler(object):
                 'The election ID is a required query string parameter'
             )
 
-        number_of_votes = await self._database.fetch_number_of_votes(election_id=election_id)
+        # Finalized elections are counted from their stored result
+        if await self._database.fetch_election_result(election_id=election_id) is not None:
+            number_of_votes = await self._database.fetch_final_number_of_votes(election_id=election_id)
+        else:
+            number_of_votes = await self._database.fetch_number_of_votes(election_id=election_id)
 
         if number_of_votes is None:
             raise ApiNotFound(
@@ -465,6 +471,136 @@ class RouteHandler(object):
 
         return json_response(number_of_votes)
 
+    async def recount_election_votes(self, request):
+        private_key, public_key, user = await self._authorize(request)
+        election_id = request.match_info.get('electionId', '')
+
+        if election_id == '':
+            raise ApiBadRequest(
+                'The election ID is a required query string parameter'
+            )
+
+        election = await self._database.fetch_election_resource(election_id=election_id)
+
+        if election is None:
+            raise ApiNotFound(
+                'Election with the election id '
+                '{} was not found'.format(election_id))
+
+        if election.get('admin_id') != user.get('voter_id'):
+            raise ApiForbidden(
+                'User is not the owner of the election with the id '
+                '{} .'.format(election_id))
+
+        votes = await self._messenger.fetch_election_votes(election_id)
+
+        # Ballots cast before votes were scoped by election stay at their
+        # legacy address until they are changed, outside the prefix listed
+        listed_vote_ids = set(get_vote_id(vote) for vote in votes)
+        ballots = await self._database.fetch_election_ballots(election_id=election_id)
+        votes.extend(await self._messenger.fetch_legacy_votes(
+            [ballot.get('vote_id') for ballot in ballots
+             if ballot.get('vote_id') not in listed_vote_ids]))
+
+        num_votes = {}
+        for vote in votes:
+            for voting_option_id in get_vote_voting_option_ids(vote, election):
+                num_votes[voting_option_id] = num_votes.get(voting_option_id, 0) + 1
+
+        return json_response(
+            [{'voting_option_id': voting_option_id, 'num_votes': count}
+             for voting_option_id, count in num_votes.items()])
+
+    async def finalize_election(self, request):
+        private_key, public_key, user = await self._authorize(request)
+        election_id = request.match_info.get('electionId', '')
+
+        if election_id == '':
+            raise ApiBadRequest(
+                'The election ID is a required query string parameter'
+            )
+
+        election = await self._database.fetch_election_resource(election_id=election_id)
+
+        if election is None:
+            raise ApiNotFound(
+                'Election with the election id '
+                '{} was not found'.format(election_id))
+
+        if election.get('admin_id') != user.get('voter_id'):
+            raise ApiForbidden(
+                'User is not the owner of the election with the id '
+                '{} .'.format(election_id))
+
+        current_time = get_time()
+
+        # The processor finalizes an election only once SYNC_TOLERANCE has
+        # passed after its end
+        if election.get('end_timestamp') + SYNC_TOLERANCE >= current_time:
+            raise ApiBadRequest(
+                'Election with the election id '
+                '{} has not ended.'.format(election_id))
+
+        if await self._database.fetch_election_result(election_id=election_id) is not None:
+            raise ApiConflict(
+                'Election with the election id '
+                '{} is already finalized.'.format(election_id))
+
+        # The result is summed from the vote tallies, so the ballots cast
+        # before they existed are counted into them first
+        uncounted_ballots = await self._database.fetch_uncounted_ballots(election_id=election_id)
+        for start in range(0, len(uncounted_ballots), LEGACY_BALLOT_CHUNK_SIZE):
+            await self._messenger.send_count_legacy_ballots_transaction(
+                private_key=private_key,
+                election_id=election_id,
+                ballots=uncounted_ballots[start:start + LEGACY_BALLOT_CHUNK_SIZE],
+                timestamp=current_time)
+
+        await self._messenger.send_finalize_election_transaction(
+            private_key=private_key,
+            election_id=election_id,
+            timestamp=current_time)
+
+        return json_response(
+            {'data': 'Finalize Election transaction submitted'})
+
+    async def get_election_result(self, request):
+        private_key, public_key, user = await self._authorize(request)
+        election_id = request.match_info.get('electionId', '')
+
+        if election_id == '':
+            raise ApiBadRequest(
+                'The election ID is a required query string parameter'
+            )
+
+        election = await self._database.fetch_election_resource(election_id=election_id)
+
+        if election is None:
+            raise ApiNotFound(
+                'Election with the election id '
+                '{} was not found'.format(election_id))
+
+        if election.get('results_permission') != 'PUBLIC':
+
+            poll_registration = await self._database.fetch_poll_book_registration(voter_id=user.get('voter_id'),
+                                                                                  election_id=election_id)
+
+            if poll_registration is None and election.get('admin_id') != user.get('voter_id'):
+                raise ApiBadRequest(
+                    'Voter is not registered in the poll book of the election with the id '
+                    '{} .'.format(election_id))
+
+        election_result = await self._database.fetch_election_result(election_id=election_id)
+
+        if election_result is None:
+            raise ApiNotFound(
+                'Election with the election id '
+                '{} is not finalized'.format(election_id))
+
+        election_result['counts'] = await self._database.fetch_final_number_of_votes(election_id=election_id)
+
+        return json_response(election_result)
+
     async def get_poll_registrations(self, request):
         private_key, public_key, user = await self._authorize(request)
         election_id = request.match_info.get('electionId', '')
@@ -858,6 +994,15 @@ class RouteHandler(object):
         return json_response(
             {'accessToken': token, 'user': user})
 
+    async def _send_poll_registrations(self, private_key, election_id, poll_registrations):
+        for start in range(0, len(poll_registrations), POLL_BOOK_CHUNK_SIZE):
+            await self._messenger.send_bulk_create_poll_registrations_transaction(
+                private_key=private_key,
+                election_id=election_id,
+                poll_registrations=poll_registrations[start:start + POLL_BOOK_CHUNK_SIZE],
+                timestamp=get_time()
+            )
+
     async def _authorize(self, request):
         token = request.headers.get('AUTHORIZATION')
         if token is None:
@@ -943,3 +1088,61 @@ def hash_password(password):
 def get_time():
     dts = datetime.datetime.utcnow()
     return round(time.mktime(dts.timetuple()) + dts.microsecond / 1e6)
+
+
+def get_voting_option_indexes(election, voting_option_ids):
+    """Returns the indexes compact ballots refer to voting options by, or
+    None if the election does not index one of them and the ballot has to
+    be sent with the legacy family version
+    """
+    election_voting_option_ids = election.get('voting_option_ids') or []
+    try:
+        return [election_voting_option_ids.index(voting_option_id)
+                for voting_option_id in voting_option_ids]
+    except ValueError:
+        return None
+
+
+def get_vote_id(vote):
+    """Returns the hex ID of a ballot of either family version
+    """
+    if vote.vote_uuid:
+        return vote.vote_uuid.hex()
+    return vote.vote_id
+
+
+def get_vote_voting_option_ids(vote, election):
+    """Returns the IDs of the voting options a ballot picks. Compact
+    ballots refer to them by their index in the election, and ballots with
+    a single choice keep it in the fields they had before multi-choice
+    ballots.
+    """
+    if not vote.vote_uuid:
+        return list(vote.voting_option_ids) or [vote.voting_option_id]
+    election_voting_option_ids = election.get('voting_option_ids') or []
+    return [election_voting_option_ids[voting_option_index]
+            for voting_option_index in
+            list(vote.voting_option_indexes) or [vote.voting_option_index]]
+
+
+def validate_ballot_size(election, voting_option_ids):
+    """Checks the number of voting options a ballot picks against the
+    multiple options criteria of the election, as the processor does
+    """
+    count = len(voting_option_ids)
+    criteria = election.get('multiple_options_criteria') or 'NONE'
+    value_min = election.get('multiple_options_value_min') or 0
+    value_max = election.get('multiple_options_value_max') or 0
+    allowed = {
+        'NONE': count == 1,
+        'AT_LEAST': count >= value_min,
+        'EQUAL_TO': count == value_min,
+        'AT_MOST': count <= value_max,
+        'BETWEEN': value_min <= count <= value_max,
+    }.get(criteria, False)
+
+    if count == 0 or not allowed:
+        raise ApiBadRequest(
+            'Election with the election id {} does not accept ballots '
+            'picking {} voting options'.format(election.get('election_id'),
+                                               count))
@@ -4,9 +4,14 @@ from sawtooth_rest_api.protobuf import batch_pb2
 from sawtooth_rest_api.protobuf import transaction_pb2
 
 from simple_supply_addressing import addresser
+from simple_supply_addressing import declarations
 
 from simple_supply_protobuf import payload_pb2
 
+from simple_supply_validation import validator
+
+from simple_supply_rest_api.errors import ApiBadRequest
+
 
 def make_create_election_transaction(transaction_signer,
                                      batch_signer,
@@ -20,7 +25,10 @@ def make_create_election_transaction(transaction_signer,
                                      can_show_realtime,
                                      admin_id,
                                      status,
-                                     timestamp):
+                                     timestamp,
+                                     multiple_options_criteria='NONE',
+                                     multiple_options_value_min=0,
+                                     multiple_options_value_max=0):
     """Make a CreateElectionAction transaction and wrap it in a batch
 
     Args:
@@ -37,17 +45,18 @@ def make_create_election_transaction(transaction_signer,
         admin_id (str):  Unique ID of the administrator
         status (bool): Defines if the election is online or canceled
         timestamp (int): Unix UTC timestamp of when the election is created
+        multiple_options_criteria (str): How many voting options a ballot
+            picks: NONE for a single choice, AT_LEAST, EQUAL_TO, AT_MOST or
+            BETWEEN
+        multiple_options_value_min (int): Lower bound of the criteria
+        multiple_options_value_max (int): Upper bound of the criteria
 
     Returns:
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(transaction_signer.get_public_key().as_hex()),
-        addresser.get_election_address(election_id)
-    ]
-
-    outputs = [addresser.get_election_address(election_id)]
+    declaration = declarations.create_election(
+        transaction_signer.get_public_key().as_hex(), election_id)
 
     action = payload_pb2.CreateElectionAction(
         election_id=election_id,
@@ -59,19 +68,20 @@ def make_create_election_transaction(transaction_signer,
         can_change_vote=can_change_vote,
         can_show_realtime=can_show_realtime,
         admin_id=admin_id,
-        status=status)
+        status=status,
+        multiple_options_criteria=multiple_options_criteria,
+        multiple_options_value_min=multiple_options_value_min,
+        multiple_options_value_max=multiple_options_value_max)
 
     payload = payload_pb2.BevPayload(
         action=payload_pb2.BevPayload.CREATE_ELECTION,
         create_election=action,
         timestamp=timestamp
     )
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -100,13 +110,10 @@ def make_create_voting_option_transaction(transaction_signer,
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(
-            transaction_signer.get_public_key().as_hex()),
-        addresser.get_voting_option_address(voting_option_id)
-    ]
-
-    outputs = [addresser.get_voting_option_address(voting_option_id)]
+    declaration = declarations.create_voting_option(
+        transaction_signer.get_public_key().as_hex(),
+        voting_option_id,
+        election_id)
 
     action = payload_pb2.CreateVotingOptionAction(
         voting_option_id=voting_option_id,
@@ -120,12 +127,10 @@ def make_create_voting_option_transaction(transaction_signer,
         create_voting_option=action,
         timestamp=timestamp
     )
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -152,13 +157,8 @@ def make_create_poll_registration_transaction(transaction_signer,
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(
-            transaction_signer.get_public_key().as_hex()),
-        addresser.get_poll_registration_address(voter_id)
-    ]
-
-    outputs = [addresser.get_poll_registration_address(voter_id)]
+    declaration = declarations.create_poll_registration(
+        transaction_signer.get_public_key().as_hex(), election_id, voter_id)
 
     action = payload_pb2.CreatePollRegistrationAction(
         voter_id=voter_id,
@@ -171,12 +171,10 @@ def make_create_poll_registration_transaction(transaction_signer,
         create_poll_registration=action,
         timestamp=timestamp
     )
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -203,9 +201,8 @@ def make_create_voter_transaction(transaction_signer,
            batch_pb2.Batch: The transaction wrapped in a batch
        """
 
-    inputs = [addresser.get_voter_address(transaction_signer.get_public_key().as_hex())]
-
-    outputs = [addresser.get_voter_address(public_key)]
+    declaration = declarations.create_voter(
+        transaction_signer.get_public_key().as_hex(), public_key)
 
     action = payload_pb2.CreateVoterAction(
         voter_id=voter_id,
@@ -219,12 +216,10 @@ def make_create_voter_transaction(transaction_signer,
         create_voter=action,
         timestamp=created_at
     )
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -251,9 +246,8 @@ def make_update_voter_transaction(transaction_signer,
            batch_pb2.Batch: The transaction wrapped in a batch
        """
 
-    inputs = [addresser.get_voter_address(transaction_signer.get_public_key().as_hex())]
-
-    outputs = [addresser.get_voter_address(public_key)]
+    declaration = declarations.update_voter(
+        transaction_signer.get_public_key().as_hex(), public_key)
 
     action = payload_pb2.UpdateVoterAction(
         voter_id=voter_id,
@@ -267,12 +261,10 @@ def make_update_voter_transaction(transaction_signer,
         update_voter=action,
         timestamp=created_at
     )
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -283,7 +275,8 @@ def make_create_vote_transaction(transaction_signer,
                                  timestamp,
                                  voter_id,
                                  election_id,
-                                 voting_option_id):
+                                 voting_option_ids,
+                                 voting_option_indexes=None):
     """Make a CreateVoteAction transaction and wrap it in a batch
 
     Args:
@@ -293,84 +286,115 @@ def make_create_vote_transaction(transaction_signer,
         timestamp (int): Unix UTC timestamp of when the agent is created
         voter_id (str): Unique ID of the voter
         election_id (str): Unique ID of the election
-        voting_option_id (str): Unique ID of the voting option
+        voting_option_ids (list of str): Unique IDs of the voting options
+            picked
+        voting_option_indexes (list of int): Indexes of the voting options
+            in the election. The ballot is sent with the compact IDs of the
+            current family version when given, and with the legacy one
+            otherwise.
 
 
     Returns:
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(transaction_signer.get_public_key().as_hex()),
-        addresser.get_vote_address(vote_id)
-    ]
-
-    outputs = [addresser.get_vote_address(vote_id)]
-
-    action = payload_pb2.CreateVoteAction(
-        vote_id=vote_id,
-        timestamp=timestamp,
-        voter_id=voter_id,
-        election_id=election_id,
-        voting_option_id=voting_option_id)
+    declaration = declarations.create_vote(
+        transaction_signer.get_public_key().as_hex(),
+        election_id,
+        voter_id,
+        vote_id,
+        voting_option_ids)
+
+    if voting_option_indexes is None:
+        action = payload_pb2.CreateVoteAction(
+            vote_id=vote_id,
+            timestamp=timestamp,
+            voter_id=voter_id,
+            election_id=election_id)
+        family_version = addresser.LEGACY_FAMILY_VERSION
+    else:
+        action = payload_pb2.CreateVoteAction(
+            vote_uuid=addresser.pack_id(vote_id),
+            timestamp=timestamp,
+            voter_id=voter_id,
+            election_uuid=addresser.pack_id(election_id))
+        family_version = addresser.FAMILY_VERSION
+    _set_ballot_choices(action, voting_option_ids, voting_option_indexes)
 
     payload = payload_pb2.BevPayload(
         action=payload_pb2.BevPayload.CREATE_VOTE,
         create_vote=action,
         timestamp=timestamp)
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
-        batch_signer=batch_signer)
+        batch_signer=batch_signer,
+        family_version=family_version)
 
 
 def make_update_vote_transaction(transaction_signer,
                                  batch_signer,
                                  vote_id,
+                                 voter_id,
+                                 election_id,
                                  timestamp,
-                                 voting_option_id):
+                                 voting_option_ids,
+                                 voting_option_indexes=None):
     """Make a UpdateVoteAction transaction and wrap it in a batch
 
     Args:
         transaction_signer (sawtooth_signing.Signer): The transaction key pair
         batch_signer (sawtooth_signing.Signer): The batch key pair
         vote_id (str): Unique ID of the vote
+        voter_id (str): Unique ID of the voter who cast the vote
+        election_id (str): Unique ID of the election of the vote
         timestamp (int): Unix UTC timestamp of when the vote is change
-        voting_option_id (str): Unique ID of the voting option
+        voting_option_ids (list of str): Unique IDs of the voting options
+            picked
+        voting_option_indexes (list of int): Indexes of the voting options
+            in the election. The ballot is sent with the compact IDs of the
+            current family version when given, and with the legacy one
+            otherwise.
 
 
     Returns:
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(transaction_signer.get_public_key().as_hex()),
-        addresser.get_vote_address(vote_id)
-    ]
-
-    outputs = [addresser.get_vote_address(vote_id)]
-
-    action = payload_pb2.UpdateVoteAction(
-        vote_id=vote_id,
-        timestamp=timestamp,
-        voting_option_id=voting_option_id)
+    declaration = declarations.update_vote(
+        transaction_signer.get_public_key().as_hex(),
+        election_id,
+        voter_id,
+        vote_id,
+        voting_option_ids)
+
+    if voting_option_indexes is None:
+        action = payload_pb2.UpdateVoteAction(
+            vote_id=vote_id,
+            election_id=election_id,
+            timestamp=timestamp)
+        family_version = addresser.LEGACY_FAMILY_VERSION
+    else:
+        action = payload_pb2.UpdateVoteAction(
+            vote_uuid=addresser.pack_id(vote_id),
+            election_uuid=addresser.pack_id(election_id),
+            timestamp=timestamp)
+        family_version = addresser.FAMILY_VERSION
+    _set_ballot_choices(action, voting_option_ids, voting_option_indexes)
 
     payload = payload_pb2.BevPayload(
         action=payload_pb2.BevPayload.UPDATE_VOTE,
         update_vote=action,
         timestamp=timestamp)
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
-        batch_signer=batch_signer)
+        batch_signer=batch_signer,
+        family_version=family_version)
 
 
 def make_update_election_transaction(transaction_signer,
@@ -385,7 +409,10 @@ def make_update_election_transaction(transaction_signer,
                                      can_show_realtime,
                                      admin_id,
                                      status,
-                                     timestamp):
+                                     timestamp,
+                                     multiple_options_criteria='NONE',
+                                     multiple_options_value_min=0,
+                                     multiple_options_value_max=0):
     """Make a UpdateElectionAction transaction and wrap it in a batch
 
     Args:
@@ -402,17 +429,18 @@ def make_update_election_transaction(transaction_signer,
         admin_id (str):  Unique ID of the administrator
         status (bool): Defines if the election is online or canceled
         timestamp (int): Unix UTC timestamp of when the election is created
+        multiple_options_criteria (str): How many voting options a ballot
+            picks: NONE for a single choice, AT_LEAST, EQUAL_TO, AT_MOST or
+            BETWEEN
+        multiple_options_value_min (int): Lower bound of the criteria
+        multiple_options_value_max (int): Upper bound of the criteria
 
     Returns:
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(transaction_signer.get_public_key().as_hex()),
-        addresser.get_election_address(election_id)
-    ]
-
-    outputs = [addresser.get_election_address(election_id)]
+    declaration = declarations.update_election(
+        transaction_signer.get_public_key().as_hex(), election_id)
 
     action = payload_pb2.UpdateElectionAction(
         election_id=election_id,
@@ -424,18 +452,19 @@ def make_update_election_transaction(transaction_signer,
         can_change_vote=can_change_vote,
         can_show_realtime=can_show_realtime,
         admin_id=admin_id,
-        status=status)
+        status=status,
+        multiple_options_criteria=multiple_options_criteria,
+        multiple_options_value_min=multiple_options_value_min,
+        multiple_options_value_max=multiple_options_value_max)
 
     payload = payload_pb2.BevPayload(
         action=payload_pb2.BevPayload.UPDATE_ELECTION,
         update_election=action,
         timestamp=timestamp)
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -466,12 +495,8 @@ def make_update_voting_option_status_transaction(transaction_signer,
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(transaction_signer.get_public_key().as_hex()),
-        addresser.get_voting_option_address(voting_option_id)
-    ]
-
-    outputs = [addresser.get_voting_option_address(voting_option_id)]
+    declaration = declarations.update_voting_option(
+        transaction_signer.get_public_key().as_hex(), voting_option_id)
 
     action = payload_pb2.UpdateVotingOptionAction(
         voting_option_id=voting_option_id,
@@ -484,12 +509,10 @@ def make_update_voting_option_status_transaction(transaction_signer,
         action=payload_pb2.BevPayload.UPDATE_VOTING_OPTION,
         update_voting_option=action,
         timestamp=timestamp)
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
@@ -518,12 +541,8 @@ def make_update_poll_book_status_transaction(transaction_signer,
         batch_pb2.Batch: The transaction wrapped in a batch
     """
 
-    inputs = [
-        addresser.get_voter_address(transaction_signer.get_public_key().as_hex()),
-        addresser.get_poll_registration_address(voter_id)
-    ]
-
-    outputs = [addresser.get_poll_registration_address(voter_id)]
+    declaration = declarations.update_poll_registration(
+        transaction_signer.get_public_key().as_hex(), election_id, voter_id)
 
     action = payload_pb2.UpdatePollRegistrationAction(
         voter_id=voter_id,
@@ -535,28 +554,274 @@ def make_update_poll_book_status_transaction(transaction_signer,
         action=payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION,
         update_poll_registration=action,
         timestamp=timestamp)
-    payload_bytes = payload.SerializeToString()
 
     return _make_batch(
-        payload_bytes=payload_bytes,
-        inputs=inputs,
-        outputs=outputs,
+        payload=payload,
+        declaration=declaration,
+        transaction_signer=transaction_signer,
+        batch_signer=batch_signer)
+
+
+def make_create_election_bundle_transaction(transaction_signer,
+                                            batch_signer,
+                                            election_id,
+                                            name,
+                                            description,
+                                            start_timestamp,
+                                            end_timestamp,
+                                            results_permission,
+                                            can_change_vote,
+                                            can_show_realtime,
+                                            admin_id,
+                                            status,
+                                            voting_options,
+                                            poll_registrations,
+                                            timestamp,
+                                            multiple_options_criteria='NONE',
+                                            multiple_options_value_min=0,
+                                            multiple_options_value_max=0):
+    """Make a CreateElectionBundleAction transaction and wrap it in a batch
+
+    Args:
+        transaction_signer (sawtooth_signing.Signer): The transaction key pair
+        batch_signer (sawtooth_signing.Signer): The batch key pair
+        election_id (str): Unique ID of the election
+        name (str): Name of the election
+        description (str): Description of the election
+        start_timestamp (int): Unix UTC timestamp of when the election start
+        end_timestamp (int): Unix UTC timestamp of when the election end
+        results_permission (int): Defines if the results of the election will be presented
+        can_change_vote (bool): Defines if its possible to change the voting option of the election
+        can_show_realtime (bool): Defines if the results of the election will be show realtime
+        admin_id (str):  Unique ID of the administrator
+        status (bool): Defines if the election is online or canceled
+        voting_options (list of dict): The voting options of the election,
+            with their voting_option_id, name and description
+        poll_registrations (list of dict): The poll book of the election,
+            with the voter_id and name of each registered voter
+        timestamp (int): Unix UTC timestamp of when the election is created
+        multiple_options_criteria (str): How many voting options a ballot
+            picks: NONE for a single choice, AT_LEAST, EQUAL_TO, AT_MOST or
+            BETWEEN
+        multiple_options_value_min (int): Lower bound of the criteria
+        multiple_options_value_max (int): Upper bound of the criteria
+
+    Returns:
+        batch_pb2.Batch: The transaction wrapped in a batch
+    """
+
+    declaration = declarations.create_election_bundle(
+        transaction_signer.get_public_key().as_hex(),
+        election_id,
+        [option.get('voting_option_id') for option in voting_options],
+        [registration.get('voter_id') for registration in poll_registrations])
+
+    action = payload_pb2.CreateElectionBundleAction(
+        election=payload_pb2.CreateElectionAction(
+            election_id=election_id,
+            name=name,
+            description=description,
+            start_timestamp=start_timestamp,
+            end_timestamp=end_timestamp,
+            results_permission=results_permission,
+            can_change_vote=can_change_vote,
+            can_show_realtime=can_show_realtime,
+            admin_id=admin_id,
+            status=status,
+            multiple_options_criteria=multiple_options_criteria,
+            multiple_options_value_min=multiple_options_value_min,
+            multiple_options_value_max=multiple_options_value_max),
+        voting_options=[
+            payload_pb2.CreateVotingOptionAction(
+                voting_option_id=option.get('voting_option_id'),
+                name=option.get('name'),
+                description=option.get('description'),
+                election_id=election_id,
+                status=True)
+            for option in voting_options],
+        poll_registrations=_make_poll_registration_actions(
+            election_id, poll_registrations))
+
+    payload = payload_pb2.BevPayload(
+        action=payload_pb2.BevPayload.CREATE_ELECTION_BUNDLE,
+        create_election_bundle=action,
+        timestamp=timestamp
+    )
+
+    return _make_batch(
+        payload=payload,
+        declaration=declaration,
         transaction_signer=transaction_signer,
         batch_signer=batch_signer)
 
 
-def _make_batch(payload_bytes,
-                inputs,
-                outputs,
+def make_bulk_create_poll_registrations_transaction(transaction_signer,
+                                                    batch_signer,
+                                                    election_id,
+                                                    poll_registrations,
+                                                    timestamp):
+    """Make a BulkCreatePollRegistrationsAction transaction and wrap it in a
+    batch
+
+    Args:
+        transaction_signer (sawtooth_signing.Signer): The transaction key pair
+        batch_signer (sawtooth_signing.Signer): The batch key pair
+        election_id (str): Unique ID of the election
+        poll_registrations (list of dict): The voter_id and name of each
+            voter to add to the poll book
+        timestamp (int): Unix UTC timestamp of when the voters are registered
+
+    Returns:
+        batch_pb2.Batch: The transaction wrapped in a batch
+    """
+
+    declaration = declarations.bulk_create_poll_registrations(
+        transaction_signer.get_public_key().as_hex(),
+        election_id,
+        [registration.get('voter_id') for registration in poll_registrations])
+
+    action = payload_pb2.BulkCreatePollRegistrationsAction(
+        poll_registrations=_make_poll_registration_actions(
+            election_id, poll_registrations))
+
+    payload = payload_pb2.BevPayload(
+        action=payload_pb2.BevPayload.BULK_CREATE_POLL_REGISTRATIONS,
+        bulk_create_poll_registrations=action,
+        timestamp=timestamp
+    )
+
+    return _make_batch(
+        payload=payload,
+        declaration=declaration,
+        transaction_signer=transaction_signer,
+        batch_signer=batch_signer)
+
+
+def make_finalize_election_transaction(transaction_signer,
+                                       batch_signer,
+                                       election_id,
+                                       timestamp):
+    """Make a FinalizeElectionAction transaction and wrap it in a batch
+
+    Args:
+        transaction_signer (sawtooth_signing.Signer): The transaction key pair
+        batch_signer (sawtooth_signing.Signer): The batch key pair
+        election_id (str): Unique ID of the election
+        timestamp (int): Unix UTC timestamp of when the election is finalized
+
+    Returns:
+        batch_pb2.Batch: The transaction wrapped in a batch
+    """
+
+    declaration = declarations.finalize_election(
+        transaction_signer.get_public_key().as_hex(), election_id)
+
+    action = payload_pb2.FinalizeElectionAction(election_id=election_id)
+
+    payload = payload_pb2.BevPayload(
+        action=payload_pb2.BevPayload.FINALIZE_ELECTION,
+        finalize_election=action,
+        timestamp=timestamp)
+
+    return _make_batch(
+        payload=payload,
+        declaration=declaration,
+        transaction_signer=transaction_signer,
+        batch_signer=batch_signer)
+
+
+def make_count_legacy_ballots_transaction(transaction_signer,
+                                          batch_signer,
+                                          election_id,
+                                          ballots,
+                                          timestamp):
+    """Make a CountLegacyBallotsAction transaction and wrap it in a batch
+
+    Args:
+        transaction_signer (sawtooth_signing.Signer): The transaction key pair
+        batch_signer (sawtooth_signing.Signer): The batch key pair
+        election_id (str): Unique ID of the election
+        ballots (list of dict): The vote_id and voter_id of each ballot cast
+            before the vote tallies existed
+        timestamp (int): Unix UTC timestamp of when the ballots are counted
+
+    Returns:
+        batch_pb2.Batch: The transaction wrapped in a batch
+    """
+
+    declaration = declarations.count_legacy_ballots(
+        transaction_signer.get_public_key().as_hex(),
+        election_id,
+        [(ballot.get('vote_id'), ballot.get('voter_id'))
+         for ballot in ballots])
+
+    action = payload_pb2.CountLegacyBallotsAction(
+        election_id=election_id,
+        ballots=[
+            payload_pb2.CountLegacyBallotsAction.Ballot(
+                vote_id=ballot.get('vote_id'),
+                voter_id=ballot.get('voter_id'))
+            for ballot in ballots
+        ])
+
+    payload = payload_pb2.BevPayload(
+        action=payload_pb2.BevPayload.COUNT_LEGACY_BALLOTS,
+        count_legacy_ballots=action,
+        timestamp=timestamp)
+
+    return _make_batch(
+        payload=payload,
+        declaration=declaration,
+        transaction_signer=transaction_signer,
+        batch_signer=batch_signer)
+
+
+def _set_ballot_choices(action, voting_option_ids, voting_option_indexes):
+    # A single choice is sent in the fields ballots had before multi-choice
+    # ballots existed, so that it stays readable by older processors
+    if voting_option_indexes is None:
+        if len(voting_option_ids) == 1:
+            action.voting_option_id = voting_option_ids[0]
+        else:
+            action.voting_option_ids.extend(voting_option_ids)
+    elif len(voting_option_indexes) == 1:
+        action.voting_option_index = voting_option_indexes[0]
+    else:
+        action.voting_option_indexes.extend(voting_option_indexes)
+
+
+def _make_poll_registration_actions(election_id, poll_registrations):
+    return [
+        payload_pb2.CreatePollRegistrationAction(
+            voter_id=registration.get('voter_id'),
+            name=registration.get('name'),
+            election_id=election_id,
+            status=True)
+        for registration in poll_registrations]
+
+
+def _make_batch(payload,
+                declaration,
                 transaction_signer,
-                batch_signer):
+                batch_signer,
+                family_version=addresser.FAMILY_VERSION):
+    # A payload the processor would reject whatever the state is refused
+    # before it is signed and sent to the validator
+    try:
+        validator.validate_payload(payload, family_version)
+    except validator.ValidationError as err:
+        raise ApiBadRequest(str(err)) from err
+
+    payload_bytes = payload.SerializeToString()
     transaction_header = transaction_pb2.TransactionHeader(
         family_name=addresser.FAMILY_NAME,
-        family_version=addresser.FAMILY_VERSION,
-        inputs=inputs,
-        outputs=outputs,
+        family_version=family_version,
+        inputs=declaration.inputs,
+        outputs=declaration.outputs,
         signer_public_key=transaction_signer.get_public_key().as_hex(),
         batcher_public_key=batch_signer.get_public_key().as_hex(),
+        # Requests that depend on each other wait for the previous batch to
+        # be committed, so the scheduler only needs the inputs and outputs
         dependencies=[],
         payload_sha512=hashlib.sha512(payload_bytes).hexdigest())
     transaction_header_bytes = transaction_header.SerializeToString()
@@ -0,0 +1,227 @@
+"""Micro-benchmark of state data decoding in the subscriber.
+
+Decodes the containers a run of blocks writes into the rows the Database
+insert methods take. The reflective variant reproduces the path the
+converters replaced: deserialize_data builds a dictionary per entry by
+walking the fields of its descriptor, and the row is then read from it by
+column name. Both read the data type of a container from its address
+beforehand, which is left out.
+
+Both paths parse every container the same way, which takes most of the
+time with the pure-Python protobuf backend. The conversion variants time
+the conversion of entries parsed beforehand on their own.
+"""
+import argparse
+import random
+import timeit
+import uuid
+
+from simple_supply_addressing.addresser import AddressSpace
+
+from simple_supply_protobuf import election_pb2
+from simple_supply_protobuf import pollRegistration_pb2
+from simple_supply_protobuf import vote_pb2
+from simple_supply_protobuf import voteTally_pb2
+from simple_supply_protobuf import ballotIndex_pb2
+
+from simple_supply_subscriber import database
+from simple_supply_subscriber import decoding
+
+
+# The fields of the rows read from each data type of the workload
+ROW_FIELDS = {
+    AddressSpace.ELECTION: database.ELECTION_FIELDS,
+    AddressSpace.POLL_REGISTRATION: database.POLL_REGISTRATION_FIELDS,
+    AddressSpace.LEGACY_VOTE: database.VOTE_FIELDS,
+    AddressSpace.VOTE: database.VOTE_FIELDS,
+    AddressSpace.VOTE_TALLY: database.VOTE_TALLY_FIELDS,
+    AddressSpace.BALLOT_INDEX: database.BALLOT_INDEX_FIELDS,
+}
+
+
+def make_workload(containers, entries, options, seed=0):
+    """Generates serialized containers: mostly ballots with their ballot
+    index and tally shard, and some poll books and elections
+
+    Args:
+        containers (int): Number of containers to generate
+        entries (int): Number of entries of each container
+        options (int): Number of voting options of the elections
+        seed (int): Seed of the random generator, for repeatable runs
+
+    Returns:
+        list of (AddressSpace, bytes): The data type and serialized
+            container of each state change
+    """
+    rand = random.Random(seed)
+
+    def new_uuid():
+        return uuid.UUID(int=rand.getrandbits(128))
+
+    option_uuids = [new_uuid().bytes for _ in range(options)]
+
+    def election():
+        return election_pb2.Election(
+            election_id=new_uuid().hex,
+            name='Election',
+            start_timestamp=1,
+            end_timestamp=2,
+            results_permission=election_pb2.Election.PUBLIC,
+            admin_id=new_uuid().hex,
+            status=True,
+            voting_option_uuids=option_uuids)
+
+    def poll_registration():
+        return pollRegistration_pb2.PollRegistration(
+            voter_id=new_uuid().hex,
+            name='Voter',
+            election_id=new_uuid().hex,
+            status=True)
+
+    def legacy_vote():
+        return vote_pb2.Vote(
+            vote_id=new_uuid().hex,
+            timestamp=1,
+            voter_id=new_uuid().hex,
+            election_id=new_uuid().hex,
+            voting_option_id=new_uuid().hex)
+
+    def vote():
+        return vote_pb2.Vote(
+            vote_uuid=new_uuid().bytes,
+            timestamp=1,
+            voter_id=new_uuid().hex,
+            election_uuid=new_uuid().bytes,
+            voting_option_index=rand.randrange(options))
+
+    def vote_tally():
+        return voteTally_pb2.VoteTally(
+            election_id=new_uuid().hex,
+            shard=rand.randrange(16),
+            counts=[voteTally_pb2.VoteCount(
+                voting_option_id=option_uuid.hex(),
+                num_votes=rand.randrange(1000))
+                    for option_uuid in option_uuids],
+            num_ballots=1000)
+
+    def ballot_index():
+        return ballotIndex_pb2.BallotIndex(
+            voter_id=new_uuid().hex,
+            election_uuid=new_uuid().bytes,
+            vote_uuid=new_uuid().bytes)
+
+    makers = [
+        (AddressSpace.VOTE, vote, 0.3),
+        (AddressSpace.LEGACY_VOTE, legacy_vote, 0.1),
+        (AddressSpace.BALLOT_INDEX, ballot_index, 0.3),
+        (AddressSpace.VOTE_TALLY, vote_tally, 0.2),
+        (AddressSpace.POLL_REGISTRATION, poll_registration, 0.08),
+        (AddressSpace.ELECTION, election, 0.02),
+    ]
+
+    workload = []
+    for _ in range(containers):
+        data_type, make, _ = rand.choices(
+            makers, weights=[weight for _, _, weight in makers])[0]
+        container = decoding.CONTAINERS[data_type](
+            entries=[make() for _ in range(entries)])
+        workload.append((data_type, container.SerializeToString()))
+    return workload
+
+
+def _dict_row(entry, fields):
+    return tuple(
+        [_dict_row(item, field[1]) for item in entry[field[0]]]
+        if isinstance(field, tuple) else entry[field]
+        for field in fields)
+
+
+def run(workload, repeat):
+    """Times each variant on the workload
+
+    Returns:
+        list of list of (str, float): The variants of each comparison and
+            their fastest time in seconds, the reference first
+    """
+    def reflective():
+        return [_dict_row(decoding._convert_proto_to_dict(entry),
+                          ROW_FIELDS[data_type])
+                for data_type, data in workload
+                for entry in decoding._parse_proto(
+                    decoding.CONTAINERS[data_type], data).entries]
+
+    def compiled():
+        return [row
+                for data_type, data in workload
+                for row in decoding.iter_rows(
+                    data_type, data, ROW_FIELDS[data_type])]
+
+    containers = [
+        (data_type, decoding._parse_proto(
+            decoding.CONTAINERS[data_type], data))
+        for data_type, data in workload]
+    converters = {
+        data_type: decoding.compile_converter(
+            decoding.CONTAINERS[data_type].DESCRIPTOR.fields_by_name[
+                'entries'].message_type,
+            fields)
+        for data_type, fields in ROW_FIELDS.items()}
+
+    def reflective_conversion():
+        return [_dict_row(decoding._convert_proto_to_dict(entry),
+                          ROW_FIELDS[data_type])
+                for data_type, container in containers
+                for entry in container.entries]
+
+    def compiled_conversion():
+        return [converters[data_type](entry)
+                for data_type, container in containers
+                for entry in container.entries]
+
+    if reflective() != compiled():
+        raise AssertionError('The converters do not match deserialize_data')
+
+    comparisons = [
+        [('reflective', reflective), ('compiled', compiled)],
+        [('reflective conversion', reflective_conversion),
+         ('compiled conversion', compiled_conversion)],
+    ]
+    return [
+        [(name, min(timeit.repeat(func, number=1, repeat=repeat)))
+         for name, func in variants]
+        for variants in comparisons]
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks state data decoding in the subscriber')
+    parser.add_argument(
+        '--containers', type=int, default=20000,
+        help='number of state changes to decode')
+    parser.add_argument(
+        '--entries', type=int, default=1,
+        help='number of entries of each container')
+    parser.add_argument(
+        '--options', type=int, default=5,
+        help='number of voting options of the elections')
+    parser.add_argument(
+        '--repeat', type=int, default=5,
+        help='runs per variant, the fastest is reported')
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    opts = parse_args(args)
+    workload = make_workload(opts.containers, opts.entries, opts.options)
+    comparisons = run(workload, opts.repeat)
+
+    rows = opts.containers * opts.entries
+    print('{} containers, {} entries'.format(opts.containers, rows))
+    for results in comparisons:
+        baseline = results[0][1]
+        for name, seconds in results:
+            print('{:>21}: {:8.1f} ms  {:6.2f} us/entry  x{:.2f}'.format(
+                name,
+                seconds * 1000,
+                seconds * 1e6 / rows,
+                baseline / seconds))
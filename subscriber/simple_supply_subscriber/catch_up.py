@@ -0,0 +1,122 @@
+import logging
+
+import psycopg2
+
+from simple_supply_subscriber.event_handling import apply_block
+from simple_supply_subscriber.event_handling import store_block
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+class CatchUp(object):
+    """Writes the blocks of a subscriber far behind the chain head in
+    batches, until it is close enough to the head to write them one at a
+    time again.
+
+    While catching up, each run of consecutive new blocks is stored with
+    Database.load, in one transaction, without looking up every block for a
+    fork. The indexes the REST API reads with are dropped meanwhile, and
+    built again once the subscriber has caught up. A block that does not
+    follow the last one, as on a fork, is written on its own with
+    apply_block.
+
+    Args:
+        database (Database): The connected database
+        fetch_head (callable): Returns the number of the chain head block
+        distance (int): Number of blocks behind the head from which the
+            subscriber catches up
+        batch_size (int): Number of blocks stored per transaction
+    """
+
+    def __init__(self, database, fetch_head, distance, batch_size):
+        self._database = database
+        self._fetch_head = fetch_head
+        self._distance = distance
+        self._batch_size = batch_size
+        self._head = None
+        self._last_block_num = None
+        self._pending = 0
+        self.done = False
+
+    def write(self, block):
+        """Writes a block, setting done once the blocks should be written
+        with apply_block again
+        """
+        if self._head is None and not self._start(block):
+            self.done = True
+            apply_block(self._database, block)
+            return
+
+        if block.block_num != self._last_block_num + 1:
+            self._flush()
+            self._last_block_num = block.block_num
+            apply_block(self._database, block)
+        else:
+            if self._pending == 0:
+                self._database.begin_load()
+            store_block(self._database, block)
+            self._last_block_num = block.block_num
+            self._pending += 1
+            if self._pending >= self._batch_size \
+                    or block.block_num >= self._head - self._distance:
+                self._flush()
+                self._head = self._fetch_head()
+
+        if block.block_num >= self._head - self._distance:
+            self.finish()
+
+    def finish(self):
+        """Stores the blocks collected so far and builds the indexes again,
+        if catching up had started
+        """
+        if self._head is None or self.done:
+            return
+        self._flush()
+        self.done = True
+
+        LOGGER.info('Caught up at block %s, building indexes',
+                    self._last_block_num)
+        self._database.create_indexes()
+
+    def abort(self):
+        """Builds the indexes again once the blocks can no longer be
+        written, if catching up had started
+        """
+        if self._head is None or self.done:
+            return
+        self.done = True
+
+        LOGGER.info('Stopped catching up at block %s, building indexes',
+                    self._last_block_num)
+        self._database.rollback()
+        self._database.create_indexes()
+
+    def _start(self, block):
+        self._head = self._fetch_head()
+        if block.block_num >= self._head - self._distance:
+            self._head = None
+            # A run that stopped while catching up left the indexes dropped
+            self._database.create_indexes()
+            return False
+
+        last_blocks = self._database.fetch_last_known_blocks(1)
+        self._last_block_num = \
+            last_blocks[0]['block_num'] if last_blocks else -1
+        LOGGER.info('Catching up from block %s to the chain head at %s',
+                    block.block_num, self._head)
+        self._database.drop_lookup_indexes()
+        return True
+
+    def _flush(self):
+        if self._pending == 0:
+            return
+        try:
+            self._database.load()
+            self._database.commit()
+        except psycopg2.DatabaseError:
+            self._database.rollback()
+            raise
+        LOGGER.debug('Stored %s blocks up to block %s',
+                     self._pending, self._last_block_num)
+        self._pending = 0
@@ -1,13 +1,20 @@
+import collections
+import io
 import logging
+import math
 import time
 from logging import Logger
 
 import psycopg2
 from psycopg2.extras import RealDictCursor
+from psycopg2.extras import execute_values
 
 
 LOGGER: Logger = logging.getLogger(__name__)
 
+# End block of the current version of a resource
+MAX_BLOCK_NUMBER = int(math.pow(2, 63)) - 1
+
 
 CREATE_BLOCK_STMTS = """
 CREATE TABLE IF NOT EXISTS blocks (
@@ -101,9 +108,21 @@ CREATE TABLE IF NOT EXISTS elections (
     admin_id                    varchar,
     status                      boolean,
     timestamp                   bigint,
+    voting_option_ids           varchar[],
+    multiple_options_criteria   multiple_options_criteria_type,
+    multiple_options_value_min  integer,
+    multiple_options_value_max  integer,
     start_block_num             bigint,
     end_block_num               bigint
 );
+
+ALTER TABLE elections ADD COLUMN IF NOT EXISTS voting_option_ids varchar[];
+ALTER TABLE elections ADD COLUMN IF NOT EXISTS
+    multiple_options_criteria multiple_options_criteria_type;
+ALTER TABLE elections ADD COLUMN IF NOT EXISTS
+    multiple_options_value_min integer;
+ALTER TABLE elections ADD COLUMN IF NOT EXISTS
+    multiple_options_value_max integer;
 """
 
 CREATE_VOTING_OPTION_STMTS = """
@@ -119,13 +138,15 @@ CREATE TABLE IF NOT EXISTS voting_options (
 );
 """
 
-CREATE_COUNT_VOTE_STMTS = """
-CREATE TABLE IF NOT EXISTS count_votes (
+CREATE_VOTE_TALLY_STMTS = """
+CREATE TABLE IF NOT EXISTS vote_tallies (
     id               bigserial PRIMARY KEY,
-    voting_option_id varchar,
-    name             varchar,
     election_id      varchar,
-    num_votes        smallint
+    shard            integer,
+    voting_option_id varchar,
+    num_votes        bigint,
+    start_block_num  bigint,
+    end_block_num    bigint
 );
 """
 
@@ -162,11 +183,293 @@ CREATE TABLE IF NOT EXISTS votes (
     voter_id         varchar,
     election_id      varchar,
     voting_option_id         varchar,
+    voting_option_ids        varchar[],
     start_block_num  bigint,
     end_block_num    bigint
 );
+
+ALTER TABLE votes ADD COLUMN IF NOT EXISTS voting_option_ids varchar[];
 """
 
+CREATE_BALLOT_INDEX_STMTS = """
+CREATE TABLE IF NOT EXISTS ballot_indexes (
+    id               bigserial PRIMARY KEY,
+    election_id      varchar,
+    voter_id         varchar,
+    vote_id          varchar,
+    start_block_num  bigint,
+    end_block_num    bigint
+);
+"""
+
+CREATE_ELECTION_RESULT_STMTS = """
+CREATE TABLE IF NOT EXISTS election_results (
+    id               bigserial PRIMARY KEY,
+    election_id      varchar,
+    num_votes        bigint,
+    finalized_at     bigint,
+    start_block_num  bigint,
+    end_block_num    bigint
+);
+
+CREATE TABLE IF NOT EXISTS election_result_counts (
+    id               bigserial PRIMARY KEY,
+    election_id      varchar,
+    voting_option_id varchar,
+    num_votes        bigint,
+    start_block_num  bigint,
+    end_block_num    bigint
+);
+"""
+
+# Predicate of the partial indexes on the current version of each resource
+CURRENT_ROWS = 'end_block_num = {}'.format(MAX_BLOCK_NUMBER)
+
+# Name, table, columns and predicate of the indexes of the reporting tables.
+# The REST API looks resources up by their IDs at the latest block, which the
+# composite indexes ending in end_block_num cover, while the subscriber
+# closes the current version of a resource by its key, which the partial
+# indexes on current rows cover.
+INDEXES = [
+    ('elections_election_id', 'elections',
+     ['election_id', 'end_block_num'], None),
+    ('elections_admin_id', 'elections',
+     ['admin_id', 'end_block_num'], None),
+    ('elections_public_end_timestamp', 'elections',
+     ['end_timestamp', 'start_timestamp'],
+     "status = '1' AND results_permission = 'PUBLIC'"),
+    ('elections_current', 'elections',
+     ['election_id'], CURRENT_ROWS),
+
+    ('voting_options_voting_option_id', 'voting_options',
+     ['voting_option_id', 'end_block_num'], None),
+    ('voting_options_election_id', 'voting_options',
+     ['election_id', 'end_block_num'], None),
+    ('voting_options_current', 'voting_options',
+     ['voting_option_id'], CURRENT_ROWS),
+
+    ('voters_voter_id', 'voters',
+     ['voter_id', 'end_block_num'], None),
+    ('voters_public_key', 'voters',
+     ['public_key', 'end_block_num'], None),
+    ('voters_type', 'voters',
+     ['type', 'end_block_num'], None),
+    ('voters_current', 'voters',
+     ['voter_id'], CURRENT_ROWS),
+
+    ('poll_registrations_election_voter', 'poll_registrations',
+     ['election_id', 'voter_id', 'end_block_num'], None),
+    ('poll_registrations_voter_election', 'poll_registrations',
+     ['voter_id', 'election_id', 'end_block_num'], None),
+    ('poll_registrations_current', 'poll_registrations',
+     ['voter_id', 'election_id'], CURRENT_ROWS),
+
+    ('votes_vote_id_timestamp', 'votes',
+     ['vote_id', 'timestamp'], None),
+    ('votes_voter_election_timestamp', 'votes',
+     ['voter_id', 'election_id', 'timestamp'], None),
+    ('votes_election_voter', 'votes',
+     ['election_id', 'voter_id', 'end_block_num'], None),
+    ('votes_timestamp', 'votes',
+     ['timestamp', 'end_block_num'], None),
+    ('votes_current', 'votes',
+     ['vote_id'], CURRENT_ROWS),
+
+    ('vote_tallies_election_id', 'vote_tallies',
+     ['election_id', 'end_block_num'], None),
+    ('vote_tallies_current', 'vote_tallies',
+     ['election_id', 'shard'], CURRENT_ROWS),
+
+    ('ballot_indexes_election_voter', 'ballot_indexes',
+     ['election_id', 'voter_id', 'end_block_num'], None),
+    ('ballot_indexes_current', 'ballot_indexes',
+     ['election_id', 'voter_id'], CURRENT_ROWS),
+
+    ('election_results_current', 'election_results',
+     ['election_id'], CURRENT_ROWS),
+    ('election_result_counts_current', 'election_result_counts',
+     ['election_id'], CURRENT_ROWS),
+]
+
+# Name and type of the columns the subscriber writes to each table, besides
+# the block range of the version
+ELECTION_COLUMNS = [
+    ('election_id', 'varchar'),
+    ('name', 'varchar'),
+    ('description', 'varchar'),
+    ('start_timestamp', 'bigint'),
+    ('end_timestamp', 'bigint'),
+    ('results_permission', 'results_permission_type'),
+    ('can_change_vote', 'boolean'),
+    ('can_show_realtime', 'boolean'),
+    ('admin_id', 'varchar'),
+    ('status', 'boolean'),
+    ('timestamp', 'bigint'),
+    ('voting_option_ids', 'varchar[]'),
+    ('multiple_options_criteria', 'multiple_options_criteria_type'),
+    ('multiple_options_value_min', 'integer'),
+    ('multiple_options_value_max', 'integer'),
+]
+
+# The votes are stored once their voting option indexes are resolved
+VOTE_COLUMNS = [
+    ('vote_id', 'varchar'),
+    ('timestamp', 'bigint'),
+    ('voter_id', 'varchar'),
+    ('election_id', 'varchar'),
+    ('voting_option_id', 'varchar'),
+    ('voting_option_ids', 'varchar[]'),
+    ('voting_option_indexes', 'integer[]'),
+]
+
+VOTING_OPTION_COLUMNS = [
+    ('voting_option_id', 'varchar'),
+    ('name', 'varchar'),
+    ('description', 'varchar'),
+    ('election_id', 'varchar'),
+    ('status', 'boolean'),
+]
+
+POLL_REGISTRATION_COLUMNS = [
+    ('voter_id', 'varchar'),
+    ('name', 'varchar'),
+    ('election_id', 'varchar'),
+    ('status', 'boolean'),
+]
+
+VOTER_COLUMNS = [
+    ('voter_id', 'varchar'),
+    ('public_key', 'varchar'),
+    ('name', 'varchar'),
+    ('created_at', 'bigint'),
+    ('type', 'voter_type'),
+]
+
+VOTE_TALLY_COLUMNS = [
+    ('election_id', 'varchar'),
+    ('shard', 'integer'),
+    ('voting_option_id', 'varchar'),
+    ('num_votes', 'bigint'),
+]
+
+BALLOT_INDEX_COLUMNS = [
+    ('election_id', 'varchar'),
+    ('voter_id', 'varchar'),
+    ('vote_id', 'varchar'),
+]
+
+ELECTION_RESULT_COLUMNS = [
+    ('election_id', 'varchar'),
+    ('num_votes', 'bigint'),
+    ('finalized_at', 'bigint'),
+]
+
+ELECTION_RESULT_COUNT_COLUMNS = [
+    ('election_id', 'varchar'),
+    ('voting_option_id', 'varchar'),
+    ('num_votes', 'bigint'),
+]
+
+# The fields of the rows each insert method takes, in the form
+# decoding.iter_rows gives them. The rows of the tables written as they are
+# read have the fields of their columns.
+ELECTION_FIELDS = [name for name, _ in ELECTION_COLUMNS]
+VOTING_OPTION_FIELDS = [name for name, _ in VOTING_OPTION_COLUMNS]
+POLL_REGISTRATION_FIELDS = [name for name, _ in POLL_REGISTRATION_COLUMNS]
+VOTER_FIELDS = [name for name, _ in VOTER_COLUMNS]
+BALLOT_INDEX_FIELDS = [name for name, _ in BALLOT_INDEX_COLUMNS]
+
+VOTE_FIELDS = [
+    'vote_id',
+    'timestamp',
+    'voter_id',
+    'election_id',
+    'voting_option_id',
+    'voting_option_ids',
+    'voting_option_indexes',
+    'voting_option_index',
+]
+
+VOTE_TALLY_FIELDS = [
+    'election_id',
+    'shard',
+    ('counts', ['voting_option_id', 'num_votes']),
+]
+
+ELECTION_RESULT_FIELDS = [
+    'election_id',
+    'num_votes',
+    'finalized_at',
+    ('counts', ['voting_option_id', 'num_votes']),
+]
+
+# The tables of the blocks stored by load, in the order they are written:
+# the votes read the voting options of the elections stored before them
+LOAD_ORDER = [
+    'blocks',
+    'elections',
+    'voting_options',
+    'poll_registrations',
+    'voters',
+    'votes',
+    'vote_tallies',
+    'ballot_indexes',
+    'election_results',
+    'election_result_counts',
+]
+
+# Stores the versions of the resources of a table written by a run of
+# blocks, from a staging table of the rows and the block that wrote them.
+# Each version lasts until the next block writing the resource, and the
+# current versions are closed at the first block of the run writing them.
+LOAD_VERSIONS_STMT = """
+WITH versions AS (
+   SELECT {keys}, block_num, COALESCE(lead(block_num) OVER (
+      PARTITION BY {keys} ORDER BY block_num), {end}) AS end_block_num
+   FROM (SELECT DISTINCT {keys}, block_num FROM {staging}) written),
+earliest AS (
+   SELECT {keys}, min(block_num) AS block_num
+   FROM {staging} GROUP BY {keys}),
+closed AS (
+   UPDATE {table} SET end_block_num = earliest.block_num
+   FROM earliest
+   WHERE {table}.end_block_num = {end} AND {closed_keys})
+INSERT INTO {table} ({columns}, start_block_num, end_block_num)
+SELECT {row_values}, n.block_num, v.end_block_num
+FROM {staging} n JOIN versions v
+   ON {version_keys} AND n.block_num = v.block_num
+{joins};
+"""
+
+# The votes name their voting options by index in the version of the
+# election at their block, as insert_votes does for the current one
+LOAD_VOTE_VALUES = """n.vote_id, n.timestamp, n.voter_id, n.election_id,
+   CASE WHEN n.voting_option_indexes IS NULL
+        THEN n.voting_option_id
+        WHEN cardinality(n.voting_option_indexes) = 1
+        THEN e.voting_option_ids[n.voting_option_indexes[1] + 1]
+   END,
+   COALESCE(n.voting_option_ids, ARRAY(
+      SELECT e.voting_option_ids[i.voting_option_index + 1]
+      FROM unnest(n.voting_option_indexes) WITH ORDINALITY
+         AS i(voting_option_index, ordinal)
+      ORDER BY i.ordinal))"""
+
+LOAD_VOTE_JOINS = """LEFT JOIN elections e
+   ON e.election_id = n.election_id
+   AND n.block_num >= e.start_block_num
+   AND n.block_num < e.end_block_num"""
+
+# The columns of the votes table the staged votes are stored in
+VOTE_TABLE_COLUMNS = [
+    'vote_id',
+    'timestamp',
+    'voter_id',
+    'election_id',
+    'voting_option_id',
+    'voting_option_ids',
+]
+
 
 class Database(object):
     """Simple object for managing a connection to a postgres database
@@ -174,6 +477,8 @@ class Database(object):
     def __init__(self, dsn):
         self._dsn = dsn
         self._conn = None
+        # The rows of the blocks written since begin_load, by table
+        self._staged = None
 
     def connect(self, retries=5, initial_delay=1, backoff=2):
         """Initializes a connection to the database
@@ -231,9 +536,74 @@ class Database(object):
             LOGGER.debug('Creating table: votes')
             cursor.execute(CREATE_VOTE_STMTS)
 
-            LOGGER.debug('Creating table: count_votes')
-            cursor.execute(CREATE_COUNT_VOTE_STMTS)
+            LOGGER.debug('Creating table: vote_tallies')
+            cursor.execute(CREATE_VOTE_TALLY_STMTS)
+
+            LOGGER.debug('Creating table: ballot_indexes')
+            cursor.execute(CREATE_BALLOT_INDEX_STMTS)
+
+            LOGGER.debug('Creating tables: election_results, '
+                         'election_result_counts')
+            cursor.execute(CREATE_ELECTION_RESULT_STMTS)
+
+        self._conn.commit()
+
+    def create_indexes(self, concurrently=False):
+        """Creates the indexes of INDEXES missing from the database
+
+        Args:
+            concurrently (bool): Whether to build the indexes without locking
+                their tables against writes, so that they can be added to a
+                database the subscriber and the REST API are using. It takes
+                longer, and each index is then committed on its own.
+        """
+        if not concurrently:
+            with self._conn.cursor() as cursor:
+                for name, table, columns, predicate in INDEXES:
+                    LOGGER.debug('Creating index: %s', name)
+                    cursor.execute(_create_index_stmt(
+                        name, table, columns, predicate))
+            self._conn.commit()
+            return
 
+        # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+        self._conn.commit()
+        self._conn.autocommit = True
+        try:
+            with self._conn.cursor() as cursor:
+                for name, table, columns, predicate in INDEXES:
+                    # A concurrent build that failed leaves an invalid
+                    # index behind, which is rebuilt
+                    cursor.execute(
+                        'SELECT indisvalid FROM pg_index '
+                        'WHERE indexrelid = to_regclass(%s)', (name,))
+                    index = cursor.fetchone()
+                    if index is not None and index[0]:
+                        continue
+                    if index is not None:
+                        LOGGER.info('Dropping invalid index: %s', name)
+                        cursor.execute(
+                            'DROP INDEX CONCURRENTLY IF EXISTS {}'.format(
+                                name))
+
+                    LOGGER.info('Creating index concurrently: %s', name)
+                    cursor.execute(_create_index_stmt(
+                        name, table, columns, predicate,
+                        concurrently=True))
+        finally:
+            self._conn.autocommit = False
+
+    def drop_lookup_indexes(self):
+        """Drops the indexes of INDEXES the REST API looks resources up
+        with, to write a long run of blocks faster. The partial indexes on
+        current rows are kept, as storing a version reads them.
+        create_indexes builds the others again.
+        """
+        with self._conn.cursor() as cursor:
+            for name, _, _, predicate in INDEXES:
+                if predicate != CURRENT_ROWS:
+                    LOGGER.debug('Dropping index: %s', name)
+                    cursor.execute('DROP INDEX IF EXISTS {};'.format(name))
         self._conn.commit()
 
     def disconnect(self):
@@ -306,6 +676,38 @@ class Database(object):
                        WHERE end_block_num >= {}
                        """.format(block_num)
 
+        delete_vote_tallies = """
+                       DELETE FROM vote_tallies WHERE start_block_num >= {}
+                       """.format(block_num)
+        update_vote_tallies = """
+                       UPDATE vote_tallies SET end_block_num = null
+                       WHERE end_block_num >= {}
+                       """.format(block_num)
+
+        delete_ballot_indexes = """
+                       DELETE FROM ballot_indexes WHERE start_block_num >= {}
+                       """.format(block_num)
+        update_ballot_indexes = """
+                       UPDATE ballot_indexes SET end_block_num = null
+                       WHERE end_block_num >= {}
+                       """.format(block_num)
+
+        delete_election_results = """
+                       DELETE FROM election_results WHERE start_block_num >= {}
+                       """.format(block_num)
+        update_election_results = """
+                       UPDATE election_results SET end_block_num = null
+                       WHERE end_block_num >= {}
+                       """.format(block_num)
+
+        delete_election_result_counts = """
+                       DELETE FROM election_result_counts WHERE start_block_num >= {}
+                       """.format(block_num)
+        update_election_result_counts = """
+                       UPDATE election_result_counts SET end_block_num = null
+                       WHERE end_block_num >= {}
+                       """.format(block_num)
+
         delete_blocks = """
         DELETE FROM blocks WHERE block_num >= {}
         """.format(block_num)
@@ -321,6 +723,14 @@ class Database(object):
             cursor.execute(update_poll_registrations)
             cursor.execute(delete_votes)
             cursor.execute(update_votes)
+            cursor.execute(delete_vote_tallies)
+            cursor.execute(update_vote_tallies)
+            cursor.execute(delete_ballot_indexes)
+            cursor.execute(update_ballot_indexes)
+            cursor.execute(delete_election_results)
+            cursor.execute(update_election_results)
+            cursor.execute(delete_election_result_counts)
+            cursor.execute(update_election_result_counts)
             cursor.execute(delete_blocks)
 
     def fetch_last_known_blocks(self, count):
@@ -337,7 +747,73 @@ class Database(object):
 
         return blocks
 
+    def begin_load(self):
+        """Collects the blocks and rows given to the insert methods from
+        now on instead of writing them, until load stores them all at once.
+        The blocks must follow each other and the last stored block.
+        """
+        self._staged = collections.OrderedDict()
+
+    def load(self):
+        """Stores the blocks collected since begin_load and stops collecting.
+        The rows of each table are copied into a staging table with COPY,
+        and the versions of all the blocks are then stored with one
+        statement per table. The caller commits.
+        """
+        staged, self._staged = self._staged, None
+        if not staged:
+            return
+
+        with self._conn.cursor() as cursor:
+            for table in LOAD_ORDER:
+                if table not in staged:
+                    continue
+                columns, keys, rows = staged[table]
+                if table == 'blocks':
+                    _copy(cursor, table, columns, rows)
+                    continue
+
+                staging = 'staged_{}'.format(table)
+                cursor.execute(
+                    'CREATE TEMPORARY TABLE {} ({}, block_num bigint);'.format(
+                        staging, ', '.join(
+                            '{} {}'.format(name, data_type)
+                            for name, data_type in columns)))
+                _copy(cursor, staging, columns + [('block_num', 'bigint')],
+                      rows)
+
+                if table == 'votes':
+                    table_columns = ', '.join(VOTE_TABLE_COLUMNS)
+                    row_values = LOAD_VOTE_VALUES
+                    joins = LOAD_VOTE_JOINS
+                else:
+                    table_columns = _column_names(columns)
+                    row_values = ', '.join(
+                        'n.{}'.format(name) for name, _ in columns)
+                    joins = ''
+
+                cursor.execute(LOAD_VERSIONS_STMT.format(
+                    table=table,
+                    staging=staging,
+                    keys=', '.join(keys),
+                    closed_keys=' AND '.join(
+                        '{0}.{1} = earliest.{1}'.format(table, key)
+                        for key in keys),
+                    version_keys=' AND '.join(
+                        'n.{0} = v.{0}'.format(key) for key in keys),
+                    columns=table_columns,
+                    row_values=row_values,
+                    joins=joins,
+                    end=MAX_BLOCK_NUMBER))
+                cursor.execute('DROP TABLE {};'.format(staging))
+
     def insert_block(self, block_dict):
+        if self._staged is not None:
+            self._stage(
+                'blocks', [('block_num', 'bigint'), ('block_id', 'varchar')],
+                [], [(block_dict['block_num'], block_dict['block_id'])], None)
+            return
+
         insert = """
         INSERT INTO blocks (
         block_num,
@@ -350,173 +826,264 @@ class Database(object):
         with self._conn.cursor() as cursor:
             cursor.execute(insert)
 
-    def insert_election(self, election_dict):
-        update_election = """
-           UPDATE elections SET end_block_num = {}
-           WHERE end_block_num = {} AND election_id = '{}'
-           """.format(
-            election_dict['start_block_num'],
-            election_dict['end_block_num'],
-            election_dict['election_id'],)
-
-        insert_election = """
-           INSERT INTO elections (
-           election_id, 
-           name, 
-           description, 
-           start_timestamp, 
-           end_timestamp, 
-           results_permission,
-           can_change_vote, 
-           can_show_realtime,
-           admin_id,
-           status, 
-           timestamp,
-           start_block_num,
-           end_block_num)
-           VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}', '{}');
-           """.format(
-            election_dict['election_id'],
-            election_dict['name'],
-            election_dict['description'],
-            election_dict['start_timestamp'],
-            election_dict['end_timestamp'],
-            election_dict['results_permission'],
-            election_dict['can_change_vote'],
-            election_dict['can_show_realtime'],
-            election_dict['admin_id'],
-            election_dict['status'],
-            election_dict['timestamp'],
-            election_dict['start_block_num'],
-            election_dict['end_block_num'])
-
-        with self._conn.cursor() as cursor:
-            cursor.execute(update_election)
-            cursor.execute(insert_election)
-
-    def insert_vote(self, vote_dict):
-        update_vote = """
-           UPDATE votes SET end_block_num = {}
-           WHERE end_block_num = {} AND vote_id = '{}'
-           """.format(
-            vote_dict['start_block_num'],
-            vote_dict['end_block_num'],
-            vote_dict['vote_id'],)
+    def insert_elections(self, elections, block_num):
+        self._insert_versions(
+            'elections',
+            ELECTION_COLUMNS,
+            ['election_id'],
+            _latest_versions(elections, ELECTION_FIELDS, 'election_id'),
+            block_num)
+
+    def insert_votes(self, votes, block_num):
+        # Votes of family version 0.2 name their voting options by their
+        # index in the election, which Postgres arrays count from 1. A ballot
+        # picking several options leaves voting_option_id null.
+        rows = []
+        for (vote_id, timestamp, voter_id, election_id, voting_option_id,
+             voting_option_ids, voting_option_indexes,
+             voting_option_index) in _latest_versions(
+                 votes, VOTE_FIELDS, 'vote_id'):
+            if voting_option_ids:
+                voting_option_id = None
+                voting_option_indexes = None
+            elif voting_option_id:
+                voting_option_ids = [voting_option_id]
+                voting_option_indexes = None
+            else:
+                voting_option_id = None
+                voting_option_ids = None
+                voting_option_indexes = \
+                    voting_option_indexes or [voting_option_index]
+            rows.append((
+                vote_id,
+                timestamp,
+                voter_id,
+                election_id,
+                voting_option_id,
+                voting_option_ids,
+                voting_option_indexes))
+
+        if self._staged is not None:
+            self._stage('votes', VOTE_COLUMNS, ['vote_id'], rows, block_num)
+            return
 
-        insert_vote = """
+        insert_votes = """
+           WITH new_rows ({columns}) AS (VALUES %s),
+           closed AS (
+              UPDATE votes SET end_block_num = {start}
+              FROM new_rows
+              WHERE votes.end_block_num = {end}
+              AND votes.vote_id = new_rows.vote_id)
            INSERT INTO votes (
-           vote_id,  
+           vote_id,
            timestamp,
            voter_id,
            election_id,
            voting_option_id,
+           voting_option_ids,
            start_block_num,
            end_block_num)
-           VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}');
+           SELECT n.vote_id, n.timestamp, n.voter_id, n.election_id,
+              CASE WHEN n.voting_option_indexes IS NULL
+                   THEN n.voting_option_id
+                   WHEN cardinality(n.voting_option_indexes) = 1
+                   THEN e.voting_option_ids[n.voting_option_indexes[1] + 1]
+              END,
+              COALESCE(n.voting_option_ids, ARRAY(
+                 SELECT e.voting_option_ids[i.voting_option_index + 1]
+                 FROM unnest(n.voting_option_indexes) WITH ORDINALITY
+                    AS i(voting_option_index, ordinal)
+                 ORDER BY i.ordinal)),
+              {start}, {end}
+           FROM new_rows n LEFT JOIN elections e
+              ON e.election_id = n.election_id
+              AND e.end_block_num = {end};
            """.format(
-            vote_dict['vote_id'],
-            vote_dict['timestamp'],
-            vote_dict['voter_id'],
-            vote_dict['election_id'],
-            vote_dict['voting_option_id'],
-            vote_dict['start_block_num'],
-            vote_dict['end_block_num'])
+            columns=_column_names(VOTE_COLUMNS),
+            start=block_num,
+            end=MAX_BLOCK_NUMBER)
+
+        self._execute_values(insert_votes, rows, _template(VOTE_COLUMNS))
+
+    def insert_voting_options(self, voting_options, block_num):
+        self._insert_versions(
+            'voting_options',
+            VOTING_OPTION_COLUMNS,
+            ['voting_option_id'],
+            _latest_versions(
+                voting_options, VOTING_OPTION_FIELDS, 'voting_option_id'),
+            block_num)
+
+    def insert_poll_registrations(self, poll_registrations, block_num):
+        self._insert_versions(
+            'poll_registrations',
+            POLL_REGISTRATION_COLUMNS,
+            ['voter_id', 'election_id'],
+            _latest_versions(poll_registrations, POLL_REGISTRATION_FIELDS,
+                             'voter_id', 'election_id'),
+            block_num)
+
+    def insert_voters(self, voters, block_num):
+        self._insert_versions(
+            'voters',
+            VOTER_COLUMNS,
+            ['voter_id'],
+            _latest_versions(voters, VOTER_FIELDS, 'voter_id'),
+            block_num)
+
+    def insert_vote_tallies(self, vote_tallies, block_num):
+        # Every counter of a shard is a row, and the shard is versioned as
+        # a whole
+        self._insert_versions(
+            'vote_tallies',
+            VOTE_TALLY_COLUMNS,
+            ['election_id', 'shard'],
+            [(election_id, shard, voting_option_id, num_votes)
+             for election_id, shard, counts in _latest_versions(
+                 vote_tallies, VOTE_TALLY_FIELDS, 'election_id', 'shard')
+             for voting_option_id, num_votes in counts],
+            block_num)
+
+    def insert_ballot_indexes(self, ballot_indexes, block_num):
+        self._insert_versions(
+            'ballot_indexes',
+            BALLOT_INDEX_COLUMNS,
+            ['election_id', 'voter_id'],
+            _latest_versions(ballot_indexes, BALLOT_INDEX_FIELDS,
+                             'election_id', 'voter_id'),
+            block_num)
+
+    def insert_election_results(self, election_results, block_num):
+        election_results = _latest_versions(
+            election_results, ELECTION_RESULT_FIELDS, 'election_id')
+        self._insert_versions(
+            'election_results',
+            ELECTION_RESULT_COLUMNS,
+            ['election_id'],
+            [(election_id, num_votes, finalized_at)
+             for election_id, num_votes, finalized_at, _ in election_results],
+            block_num)
+        self._insert_versions(
+            'election_result_counts',
+            ELECTION_RESULT_COUNT_COLUMNS,
+            ['election_id'],
+            [(election_id, voting_option_id, num_votes)
+             for election_id, _, _, counts in election_results
+             for voting_option_id, num_votes in counts],
+            block_num)
+
+    def _insert_versions(self, table, columns, keys, rows, block_num):
+        """Stores the versions of the resources of a table written by a
+        block in a single statement: the current version of each resource
+        is closed at the block, and the new ones are inserted from it on
 
-        with self._conn.cursor() as cursor:
-            cursor.execute(update_vote)
-            cursor.execute(insert_vote)
+        Args:
+            table (str): Name of the table
+            columns (list of (str, str)): Name and type of each column of
+                the rows
+            keys (list of str): The columns identifying a resource
+            rows (list of tuple): The values of the new versions
+            block_num (int): The block that wrote them
+        """
+        if self._staged is not None:
+            self._stage(table, columns, keys, rows, block_num)
+            return
 
-    def insert_voting_option(self, voting_option_dict):
-        update_voting_option = """
-           UPDATE voting_options SET end_block_num = {}
-           WHERE end_block_num = {} AND voting_option_id = '{}'
-           """.format(
-            voting_option_dict['start_block_num'],
-            voting_option_dict['end_block_num'],
-            voting_option_dict['voting_option_id'],)
-
-        insert_voting_option = """
-           INSERT INTO voting_options (
-           voting_option_id, 
-           name, 
-           description, 
-           election_id,
-           status,
-           start_block_num,
-           end_block_num)
-           VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}');
+        insert = """
+           WITH new_rows ({columns}) AS (VALUES %s),
+           closed AS (
+              UPDATE {table} SET end_block_num = {start}
+              FROM new_rows
+              WHERE {table}.end_block_num = {end} AND {keys})
+           INSERT INTO {table} ({columns}, start_block_num, end_block_num)
+           SELECT {columns}, {start}, {end} FROM new_rows;
            """.format(
-            voting_option_dict['voting_option_id'],
-            voting_option_dict['name'],
-            voting_option_dict['description'],
-            voting_option_dict['election_id'],
-            voting_option_dict['status'],
-            voting_option_dict['start_block_num'],
-            voting_option_dict['end_block_num'])
+            table=table,
+            columns=_column_names(columns),
+            keys=' AND '.join(
+                '{0}.{1} = new_rows.{1}'.format(table, key) for key in keys),
+            start=block_num,
+            end=MAX_BLOCK_NUMBER)
+
+        self._execute_values(insert, rows, _template(columns))
+
+    def _stage(self, table, columns, keys, rows, block_num):
+        if table not in self._staged:
+            self._staged[table] = (columns, keys, [])
+        staged_rows = self._staged[table][2]
+        if block_num is None:
+            staged_rows.extend(rows)
+        else:
+            staged_rows.extend(row + (block_num,) for row in rows)
 
+    def _execute_values(self, statement, rows, template):
+        if not rows:
+            return
+        # A single page, so that the block costs one round trip per table
         with self._conn.cursor() as cursor:
-            cursor.execute(update_voting_option)
-            cursor.execute(insert_voting_option)
-
-    def insert_poll_registration(self, poll_registration_dict):
-        update_poll_registration = """
-           UPDATE poll_registrations SET end_block_num = {}
-           WHERE end_block_num = {} AND voter_id = '{}' AND election_id = '{}'
-           """.format(
-            poll_registration_dict['start_block_num'],
-            poll_registration_dict['end_block_num'],
-            poll_registration_dict['voter_id'],
-            poll_registration_dict['election_id'])
-
-        insert_poll_registration = """
-           INSERT INTO poll_registrations (
-           voter_id, 
-           name, 
-           election_id,
-           status,
-           start_block_num,
-           end_block_num)
-           VALUES ('{}', '{}', '{}', '{}',  '{}', '{}');
-           """.format(
-            poll_registration_dict['voter_id'],
-            poll_registration_dict['name'],
-            poll_registration_dict['election_id'],
-            poll_registration_dict['status'],
-            poll_registration_dict['start_block_num'],
-            poll_registration_dict['end_block_num'])
+            execute_values(
+                cursor, statement, rows, template=template,
+                page_size=len(rows))
+
+
+def _create_index_stmt(name, table, columns, predicate,
+                       concurrently=False):
+    return 'CREATE INDEX {}IF NOT EXISTS {} ON {} ({}){};'.format(
+        'CONCURRENTLY ' if concurrently else '',
+        name,
+        table,
+        ', '.join(columns),
+        ' WHERE {}'.format(predicate) if predicate else '')
+
+
+def _copy(cursor, table, columns, rows):
+    data = io.StringIO()
+    for row in rows:
+        data.write('\t'.join(_copy_value(value) for value in row))
+        data.write('\n')
+    data.seek(0)
+    cursor.copy_expert(
+        'COPY {} ({}) FROM STDIN;'.format(table, _column_names(columns)),
+        data)
+
+
+def _copy_value(value):
+    """Formats a value in the text format of COPY"""
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, list):
+        value = '{{{}}}'.format(','.join(
+            'NULL' if item is None else '"{}"'.format(
+                str(item).replace('\\', '\\\\').replace('"', '\\"'))
+            for item in value))
+    return str(value).replace('\\', '\\\\').replace(
+        '\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+def _latest_versions(rows, fields, *keys):
+    """Keeps the last version of the resources written more than once by a
+    block, as a migrated resource is at both its legacy and current address
+
+    Args:
+        rows (iterable of tuple): The rows of the block, with the fields
+        fields (list): The fields of the rows
+        keys (str): The fields identifying a resource
+    """
+    positions = [fields.index(key) for key in keys]
+    latest = collections.OrderedDict()
+    for row in rows:
+        latest[tuple(row[position] for position in positions)] = row
+    return list(latest.values())
 
-        with self._conn.cursor() as cursor:
-            cursor.execute(update_poll_registration)
-            cursor.execute(insert_poll_registration)
 
-    def insert_voter(self, voter_dict):
-        update_voter = """
-           UPDATE voters SET end_block_num = {}
-           WHERE end_block_num = {} AND voter_id = '{}'
-           """.format(
-            voter_dict['start_block_num'],
-            voter_dict['end_block_num'],
-            voter_dict['voter_id'],)
+def _column_names(columns):
+    return ', '.join(name for name, _ in columns)
 
-        insert_voter = """
-           INSERT INTO voters (
-           voter_id,
-           public_key, 
-           name, 
-           created_at,
-           type,
-           start_block_num,
-           end_block_num)
-           VALUES ('{}', '{}', '{}', '{}', '{}', '{}', '{}');
-           """.format(
-            voter_dict['voter_id'],
-            voter_dict['public_key'],
-            voter_dict['name'],
-            voter_dict['created_at'],
-            voter_dict['type'],
-            voter_dict['start_block_num'],
-            voter_dict['end_block_num'])
 
-        with self._conn.cursor() as cursor:
-            cursor.execute(update_voter)
-            cursor.execute(insert_voter)
+def _template(columns):
+    # Typed values, as the rows are read back from a VALUES list and the
+    # enum and array columns have no assignment cast from text
+    return '({})'.format(', '.join(
+        '%s::{}'.format(data_type) for _, data_type in columns))
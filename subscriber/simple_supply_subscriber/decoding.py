@@ -1,17 +1,26 @@
 from simple_supply_addressing.addresser import AddressSpace
 from simple_supply_addressing.addresser import get_address_type
+from simple_supply_addressing.addresser import unpack_id
 from simple_supply_protobuf.election_pb2 import ElectionContainer
 from simple_supply_protobuf.votingOption_pb2 import VotingOptionContainer
 from simple_supply_protobuf.pollRegistration_pb2 import PollRegistrationContainer
 from simple_supply_protobuf.voter_pb2 import VoterContainer
 from simple_supply_protobuf.vote_pb2 import VoteContainer
+from simple_supply_protobuf.voteTally_pb2 import VoteTallyContainer
+from simple_supply_protobuf.ballotIndex_pb2 import BallotIndexContainer
+from simple_supply_protobuf.electionResult_pb2 import ElectionResultContainer
 
 CONTAINERS = {
     AddressSpace.ELECTION: ElectionContainer,
     AddressSpace.VOTING_OPTION: VotingOptionContainer,
     AddressSpace.POLL_REGISTRATION: PollRegistrationContainer,
+    AddressSpace.LEGACY_POLL_REGISTRATION: PollRegistrationContainer,
     AddressSpace.VOTER: VoterContainer,
-    AddressSpace.VOTE: VoteContainer
+    AddressSpace.VOTE: VoteContainer,
+    AddressSpace.LEGACY_VOTE: VoteContainer,
+    AddressSpace.VOTE_TALLY: VoteTallyContainer,
+    AddressSpace.BALLOT_INDEX: BallotIndexContainer,
+    AddressSpace.ELECTION_RESULT: ElectionResultContainer
 }
 
 
@@ -19,6 +28,12 @@ def deserialize_data(address, data):
     """Deserializes state data by type based on the address structure and
     returns it as a dictionary with the associated data type
 
+    Entries written by family version 0.2 are returned like the ones of
+    version 0.1: every binary <name>_uuid field fills <name>_id with its hex
+    form. Their votes leave voting_option_id empty and carry the
+    voting_option_index in the election instead. Votes picking several
+    voting options fill voting_option_ids or voting_option_indexes.
+
     Args:
         address (str): The state address of the container
         data (str): String containing the serialized state data
@@ -37,6 +52,102 @@ def deserialize_data(address, data):
     return data_type, [_convert_proto_to_dict(pb) for pb in entries]
 
 
+def iter_rows(data_type, data, fields):
+    """Deserializes state data of a known type and yields its entries one at
+    a time as tuples of the given fields, in the same form deserialize_data
+    gives them, without building a dictionary per entry
+
+    Args:
+        data_type (AddressSpace): The type of the container
+        data (bytes): The serialized container
+        fields (list): The fields of the tuples, see compile_converter
+    """
+    container = CONTAINERS[data_type]
+    convert = compile_converter(
+        container.DESCRIPTOR.fields_by_name['entries'].message_type, fields)
+    for entry in _parse_proto(container, data).entries:
+        yield convert(entry)
+
+
+def compile_converter(descriptor, fields):
+    """Returns a function turning a message into a tuple of fields, generated
+    once for each message type and list of fields
+
+    A field is either the name of a key deserialize_data gives, or a pair of
+    the name of a repeated message field and the fields of the tuples of its
+    list. A <name>_id read from a message with a <name>_uuid field is the
+    hex form of the binary ID when it is set, and the string ID otherwise.
+
+    Args:
+        descriptor (Descriptor): The descriptor of the message type
+        fields (list): The fields of the tuples
+    """
+    key = (descriptor.full_name, _freeze(fields))
+    try:
+        return _CONVERTERS[key]
+    except KeyError:
+        pass
+
+    namespace = {'unpack_id': unpack_id}
+    values = [_field_source(descriptor, field, namespace) for field in fields]
+    source = 'def convert(pb):\n    return ({},)\n'.format(', '.join(values))
+    exec(compile(  # pylint: disable=exec-used
+        source, '<{} converter>'.format(descriptor.name), 'exec'), namespace)
+
+    _CONVERTERS[key] = namespace['convert']
+    return namespace['convert']
+
+
+# Converters by message type and fields
+_CONVERTERS = {}
+
+
+def _field_source(descriptor, field, namespace):
+    """Returns the expression reading a field of the tuple from the message
+    pb, adding the names it needs to the namespace of the converter
+    """
+    if isinstance(field, tuple):
+        name, sub_fields = field
+        message_field = descriptor.fields_by_name[name]
+        converter_name = '_convert_{}'.format(name)
+        namespace[converter_name] = compile_converter(
+            message_field.message_type, sub_fields)
+        return '[{}(p) for p in pb.{}]'.format(converter_name, name)
+
+    fields = descriptor.fields_by_name
+    if field.endswith('_ids') and field[:-len('_ids')] + '_uuids' in fields:
+        return '[unpack_id(u) for u in pb.{}_uuids]'.format(
+            field[:-len('_ids')])
+
+    if field.endswith('_id') and field[:-len('_id')] + '_uuid' in fields:
+        uuid = 'pb.{}_uuid'.format(field[:-len('_id')])
+        return '(unpack_id({0}) if {0} else pb.{1})'.format(uuid, field)
+
+    try:
+        proto_field = fields[field]
+    except KeyError as err:
+        raise TypeError(
+            '{} has no field {}'.format(descriptor.name, field)) from err
+
+    if proto_field.type == proto_field.TYPE_ENUM:
+        table_name = '_{}_names'.format(field)
+        namespace[table_name] = {
+            value.number: value.name
+            for value in proto_field.enum_type.values}
+        return '{}[pb.{}]'.format(table_name, field)
+
+    if proto_field.label == proto_field.LABEL_REPEATED:
+        return 'list(pb.{})'.format(field)
+
+    return 'pb.{}'.format(field)
+
+
+def _freeze(fields):
+    return tuple(
+        (field[0], _freeze(field[1])) if isinstance(field, tuple) else field
+        for field in fields)
+
+
 def _parse_proto(proto_class, data):
     deserialized = proto_class()
     deserialized.ParseFromString(data)
@@ -56,6 +167,14 @@ def _convert_proto_to_dict(proto):
             else:
                 result[key] = _convert_proto_to_dict(value)
 
+        elif key.endswith('_uuid'):
+            if value:
+                result[key[:-len('_uuid')] + '_id'] = unpack_id(value)
+
+        elif key.endswith('_uuids'):
+            result[key[:-len('_uuids')] + '_ids'] = [
+                unpack_id(uuid) for uuid in value]
+
         elif field.type == field.TYPE_ENUM:
             number = int(value)
             name = field.enum_type.values_by_number.get(number).name
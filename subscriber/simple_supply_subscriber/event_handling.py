@@ -1,32 +1,113 @@
+import collections
+import itertools
 import re
 import logging
-import math
 
 import psycopg2
+from sawtooth_sdk.protobuf.events_pb2 import EventList
 from sawtooth_sdk.protobuf.transaction_receipt_pb2 import StateChangeList
 
 from simple_supply_addressing.addresser import AddressSpace
 from simple_supply_addressing.addresser import NAMESPACE
-from simple_supply_subscriber.decoding import deserialize_data
+from simple_supply_addressing.addresser import get_address_type
+from simple_supply_subscriber import database as db
+from simple_supply_subscriber.decoding import iter_rows
 
-MAX_BLOCK_NUMBER = int(math.pow(2, 63)) - 1
 NAMESPACE_REGEX = re.compile('^{}'.format(NAMESPACE))
 LOGGER = logging.getLogger(__name__)
 
+# The Database method storing the resources of each table, the fields of
+# the rows it takes, and the data types they are read from. Tables are
+# written in this order, so that an election is stored before the votes
+# that refer to its voting options by index. A legacy data type comes first,
+# so that the current version of a migrated resource is the one kept.
+TABLE_INSERTS = [
+    ('insert_elections', db.ELECTION_FIELDS,
+     [AddressSpace.ELECTION]),
+    ('insert_voting_options', db.VOTING_OPTION_FIELDS,
+     [AddressSpace.VOTING_OPTION]),
+    ('insert_poll_registrations', db.POLL_REGISTRATION_FIELDS,
+     [AddressSpace.LEGACY_POLL_REGISTRATION, AddressSpace.POLL_REGISTRATION]),
+    ('insert_voters', db.VOTER_FIELDS,
+     [AddressSpace.VOTER]),
+    ('insert_votes', db.VOTE_FIELDS,
+     [AddressSpace.LEGACY_VOTE, AddressSpace.VOTE]),
+    ('insert_vote_tallies', db.VOTE_TALLY_FIELDS,
+     [AddressSpace.VOTE_TALLY]),
+    ('insert_ballot_indexes', db.BALLOT_INDEX_FIELDS,
+     [AddressSpace.BALLOT_INDEX]),
+    ('insert_election_results', db.ELECTION_RESULT_FIELDS,
+     [AddressSpace.ELECTION_RESULT]),
+]
+
+# The fields of the rows read from each data type
+ROW_FIELDS = {
+    data_type: fields
+    for _, fields, data_types in TABLE_INSERTS
+    for data_type in data_types
+}
+
+
+# A block read from its events: the rows of each insert method of
+# TABLE_INSERTS that has any, in that order
+Block = collections.namedtuple('Block', ['block_num', 'block_id', 'rows'])
+
 
 def get_events_handler(database):
     """Returns a events handler with a reference to a specific Database object.
     The handler takes a list of events and updates the Database appropriately.
     """
-    return lambda events: _handle_events(database, events)
+    return lambda events: apply_block(database, decode_block(events))
+
+
+def decode_event_list(data):
+    """Decodes a serialized EventList of a block. It does not need the
+    database, so that blocks can be decoded in other processes.
+    """
+    event_list = EventList()
+    event_list.ParseFromString(data)
+    return decode_block(event_list.events)
 
 
-def _handle_events(database, events):
+def decode_block(events):
+    """Reads the block number and ID of the events of a block, and the rows
+    of the state changes it made
+    """
     block_num, block_id = _parse_new_block(events)
+
+    # The rows of the block are collected by data type, and every table is
+    # then written with one statement
+    rows = collections.defaultdict(list)
+    for change in _parse_state_changes(events):
+        data_type = get_address_type(change.address)
+        if data_type == AddressSpace.OTHER_FAMILY:
+            continue
+        if data_type not in ROW_FIELDS:
+            LOGGER.warning('Unsupported data type: %s', data_type)
+            continue
+        rows[data_type].append(
+            iter_rows(data_type, change.value, ROW_FIELDS[data_type]))
+
+    table_rows = collections.OrderedDict()
+    for insert, _, data_types in TABLE_INSERTS:
+        if any(rows[data_type] for data_type in data_types):
+            table_rows[insert] = list(itertools.chain.from_iterable(
+                container for data_type in data_types
+                for container in rows[data_type]))
+
+    return Block(block_num, block_id, table_rows)
+
+
+def apply_block(database, block):
+    """Writes a block to the database and commits it, replacing the blocks
+    of another fork from its number on. Blocks must be applied in the order
+    the validator sends them.
+    """
     try:
-        is_duplicate = _resolve_if_forked(database, block_num, block_id)
+        is_duplicate = _resolve_if_forked(
+            database, block.block_num, block.block_id)
         if not is_duplicate:
-            _apply_state_changes(database, events, block_num, block_id)
+            store_block(database, block)
         database.commit()
     except psycopg2.DatabaseError as err:
         LOGGER.exception('Unable to handle event: %s', err)
@@ -61,23 +142,12 @@ def _resolve_if_forked(database, block_num, block_id):
     return False
 
 
-def _apply_state_changes(database, events, block_num, block_id):
-    changes = _parse_state_changes(events)
-    for change in changes:
-        data_type, resources = deserialize_data(change.address, change.value)
-        database.insert_block({'block_num': block_num, 'block_id': block_id})
-        if data_type == AddressSpace.ELECTION:
-            _apply_election_change(database, block_num, resources)
-        elif data_type == AddressSpace.VOTING_OPTION:
-            _apply_voting_option_change(database, block_num, resources)
-        elif data_type == AddressSpace.POLL_REGISTRATION:
-            _apply_poll_registration_change(database, block_num, resources)
-        elif data_type == AddressSpace.VOTER:
-            _apply_voter_change(database, block_num, resources)
-        elif data_type == AddressSpace.VOTE:
-            _apply_vote_change(database, block_num, resources)
-        else:
-            LOGGER.warning('Unsupported data type: %s', data_type)
+def store_block(database, block):
+    """Writes a new block to the database without committing it"""
+    database.insert_block(
+        {'block_num': block.block_num, 'block_id': block.block_id})
+    for insert, rows in block.rows.items():
+        getattr(database, insert)(rows, block.block_num)
 
 
 def _parse_state_changes(events):
@@ -91,38 +161,3 @@ def _parse_state_changes(events):
     state_change_list.ParseFromString(change_data)
     return [c for c in state_change_list.state_changes
             if NAMESPACE_REGEX.match(c.address)]
-
-
-def _apply_election_change(database, block_num, elections):
-    for election in elections:
-        election['start_block_num'] = block_num
-        election['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_election(election)
-
-
-def _apply_voting_option_change(database, block_num, voting_options):
-    for voting_option in voting_options:
-        voting_option['start_block_num'] = block_num
-        voting_option['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_voting_option(voting_option)
-
-
-def _apply_poll_registration_change(database, block_num, poll_books):
-    for pollBook in poll_books:
-        pollBook['start_block_num'] = block_num
-        pollBook['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_poll_registration(pollBook)
-
-
-def _apply_voter_change(database, block_num, voters):
-    for voter in voters:
-        voter['start_block_num'] = block_num
-        voter['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_voter(voter)
-
-
-def _apply_vote_change(database, block_num, votes):
-    for vote in votes:
-        vote['start_block_num'] = block_num
-        vote['end_block_num'] = MAX_BLOCK_NUMBER
-        database.insert_vote(vote)
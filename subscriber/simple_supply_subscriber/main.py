@@ -2,9 +2,10 @@ import argparse
 import sys
 import logging
 
+from simple_supply_subscriber.catch_up import CatchUp
 from simple_supply_subscriber.database import Database
+from simple_supply_subscriber.pipeline import BlockPipeline
 from simple_supply_subscriber.subscriber import Subscriber
-from simple_supply_subscriber.event_handling import get_events_handler
 
 
 KNOWN_COUNT = 15
@@ -44,9 +45,14 @@ def parse_args(args):
         default=0,
         help='Increase output sent to stderr')
 
-    subparsers.add_parser(
+    init_parser = subparsers.add_parser(
         'init',
         parents=[database_parser])
+    init_parser.add_argument(
+        '--concurrently',
+        action='store_true',
+        help='Add missing indexes without locking the tables against writes, '
+             'to upgrade a database in use')
 
     subscribe_parser = subparsers.add_parser(
         'subscribe',
@@ -55,6 +61,31 @@ def parse_args(args):
         '-C', '--connect',
         help='The url of the validator to subscribe to',
         default='tcp://localhost:4004')
+    subscribe_parser.add_argument(
+        '--decode-workers',
+        type=int,
+        help='Number of processes decoding blocks while the previous '
+             'ones are written. With 0, blocks are decoded on the thread '
+             'writing them.',
+        default=2)
+    subscribe_parser.add_argument(
+        '--queue-size',
+        type=int,
+        help='Number of received blocks waiting to be written before the '
+             'subscriber stops receiving',
+        default=64)
+    subscribe_parser.add_argument(
+        '--catch-up-distance',
+        type=int,
+        help='Number of blocks behind the chain head from which blocks are '
+             'stored in batches until the subscriber catches up. With 0, '
+             'blocks are always stored one at a time.',
+        default=1000)
+    subscribe_parser.add_argument(
+        '--catch-up-batch',
+        type=int,
+        help='Number of blocks stored per transaction while catching up',
+        default=500)
 
     return parser.parse_args(args)
 
@@ -81,9 +112,23 @@ def do_subscribe(opts):
             opts.db_port)
 
         database = Database(dsn)
+        pipeline = BlockPipeline(
+            database, opts.decode_workers, opts.queue_size)
+        # The decoding processes are forked before any connection is open
+        pipeline.start()
         database.connect()
         subscriber = Subscriber(opts.connect)
-        subscriber.add_handler(get_events_handler(database))
+        subscriber.add_raw_handler(pipeline.handle)
+        if opts.catch_up_distance > 0:
+            pipeline.set_catch_up(CatchUp(
+                database,
+                subscriber.fetch_head_block_num,
+                opts.catch_up_distance,
+                opts.catch_up_batch))
+        else:
+            # A previous run may have stopped while catching up, with the
+            # indexes dropped
+            database.create_indexes()
         known_blocks = database.fetch_last_known_blocks(KNOWN_COUNT)
         known_ids = [block['block_id'] for block in known_blocks]
         subscriber.start(known_ids=known_ids)
@@ -97,6 +142,7 @@ def do_subscribe(opts):
 
     finally:
         try:
+            pipeline.stop()
             database.disconnect()
             subscriber.stop()
         except UnboundLocalError:
@@ -117,6 +163,7 @@ def do_init(opts):
         database = Database(dsn)
         database.connect()
         database.create_tables()
+        database.create_indexes(concurrently=opts.concurrently)
 
     except Exception as err:  # pylint: disable=broad-except
         LOGGER.exception('Unable to initialize subscriber database: %s', err)
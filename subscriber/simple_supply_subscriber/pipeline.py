@@ -0,0 +1,139 @@
+import logging
+import multiprocessing
+import queue
+import signal
+import threading
+
+from simple_supply_subscriber.event_handling import apply_block
+from simple_supply_subscriber.event_handling import decode_event_list
+
+
+LOGGER = logging.getLogger(__name__)
+
+# Seconds the receiving thread waits for room in the queue before checking
+# the writer again
+PUT_INTERVAL = 1
+
+
+class BlockPipeline(object):
+    """Handles the blocks the Subscriber receives in three overlapping
+    stages: the Subscriber thread receives them, a pool of processes decodes
+    them, and a writer thread stores them in the database.
+
+    The blocks are queued in the order they are received, and the writer
+    takes each decoded block in that order, so they are written one at a
+    time in chain order and forks are resolved as they would be without the
+    pipeline. Only the writer uses the database once the pipeline starts.
+    The queue is bounded, so a slow database holds back the receiving
+    thread instead of buffering the chain in memory.
+
+    Args:
+        database (Database): The connected database
+        workers (int): Number of decoding processes. With none, the writer
+            decodes each block before writing it.
+        queue_size (int): Number of blocks received and not yet written
+            that are kept before receiving waits
+    """
+
+    def __init__(self, database, workers=2, queue_size=64):
+        self._database = database
+        self._workers = workers
+        self._blocks = queue.Queue(maxsize=queue_size)
+        self._pool = None
+        self._writer = None
+        self._error = None
+        self._catch_up = None
+
+    def start(self):
+        """Starts the decoding processes and the writer. The processes are
+        forked here, so this should be called before connecting to the
+        validator.
+        """
+        if self._workers > 0:
+            self._pool = multiprocessing.Pool(
+                self._workers, initializer=_init_decoder)
+        self._writer = threading.Thread(
+            target=self._write, name='subscriber-writer', daemon=True)
+        self._writer.start()
+
+    def set_catch_up(self, catch_up):
+        """Has the blocks written by a CatchUp until it is done. Must be
+        called before the first block is handled.
+        """
+        self._catch_up = catch_up
+
+    def handle(self, data):
+        """Queues the serialized EventList of a block, waiting while the
+        queue is full. Raises the error that stopped the writer, if any.
+        """
+        if self._pool is not None:
+            block = self._pool.apply_async(decode_event_list, (data,))
+        else:
+            block = data
+        self._put(block)
+
+    def stop(self):
+        """Writes the blocks already queued, then stops the writer and the
+        decoding processes
+        """
+        if self._writer is not None and self._writer.is_alive():
+            try:
+                self._put(None)
+            except RuntimeError:
+                pass
+            self._writer.join()
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+
+    def _put(self, block):
+        while True:
+            if self._error is not None:
+                raise RuntimeError(
+                    'Subscriber writer failed: {}'.format(self._error))
+            try:
+                self._blocks.put(block, timeout=PUT_INTERVAL)
+                return
+            except queue.Full:
+                continue
+
+    def _write(self):
+        try:
+            while True:
+                block = self._blocks.get()
+                if block is None:
+                    break
+                if self._pool is not None:
+                    block = block.get()
+                else:
+                    block = decode_event_list(block)
+
+                if self._catch_up is None:
+                    apply_block(self._database, block)
+                    continue
+                self._catch_up.write(block)
+                if self._catch_up.done:
+                    self._catch_up = None
+
+            if self._catch_up is not None:
+                self._catch_up.finish()
+        except Exception as err:  # pylint: disable=broad-except
+            LOGGER.exception('Unable to write blocks: %s', err)
+            self._error = err
+            self._abort_catch_up()
+
+    def _abort_catch_up(self):
+        # The REST API needs the indexes dropped while catching up, even
+        # when the subscriber stops before it has caught up
+        if self._catch_up is None:
+            return
+        try:
+            self._catch_up.abort()
+        except Exception:  # pylint: disable=broad-except
+            LOGGER.exception('Unable to build the indexes again')
+
+
+def _init_decoder():
+    # An interrupt stops the subscriber, which terminates the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
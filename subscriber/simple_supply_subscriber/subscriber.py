@@ -1,5 +1,8 @@
 import logging
 
+from sawtooth_sdk.protobuf.block_pb2 import BlockHeader
+from sawtooth_sdk.protobuf.client_block_pb2 import ClientBlockListRequest
+from sawtooth_sdk.protobuf.client_block_pb2 import ClientBlockListResponse
 from sawtooth_sdk.protobuf.client_event_pb2 import ClientEventsSubscribeRequest
 from sawtooth_sdk.protobuf.client_event_pb2\
     import ClientEventsSubscribeResponse
@@ -10,6 +13,8 @@ from sawtooth_sdk.protobuf.client_event_pb2\
 from sawtooth_sdk.protobuf.events_pb2 import EventList
 from sawtooth_sdk.protobuf.events_pb2 import EventSubscription
 from sawtooth_sdk.protobuf.events_pb2 import EventFilter
+from sawtooth_sdk.protobuf.client_list_control_pb2 \
+    import ClientPagingControls
 from sawtooth_sdk.protobuf.validator_pb2 import Message
 from sawtooth_sdk.messaging.stream import Stream
 
@@ -29,6 +34,7 @@ class Subscriber(object):
         LOGGER.info('Connecting to validator: %s', validator_url)
         self._stream = Stream(validator_url)
         self._event_handlers = []
+        self._raw_handlers = []
         self._is_active = False
 
     def add_handler(self, handler):
@@ -37,10 +43,17 @@ class Subscriber(object):
         """
         self._event_handlers.append(handler)
 
+    def add_raw_handler(self, handler):
+        """Adds a handler which will be passed the serialized EventList of
+        each block, to parse it elsewhere than on the receiving thread.
+        """
+        self._raw_handlers.append(handler)
+
     def clear_handlers(self):
         """Clears any delta handlers.
         """
         self._event_handlers = []
+        self._raw_handlers = []
 
     def start(self, known_ids=None):
         """Subscribes to state delta events, and then waits to receive deltas.
@@ -85,11 +98,36 @@ class Subscriber(object):
         LOGGER.debug('Successfully subscribed to state delta events')
         while self._is_active:
             message_future = self._stream.receive()
+            content = message_future.result().content
+
+            for handler in self._raw_handlers:
+                handler(content)
+
+            if self._event_handlers:
+                event_list = EventList()
+                event_list.ParseFromString(content)
+                for handler in self._event_handlers:
+                    handler(event_list.events)
+
+    def fetch_head_block_num(self):
+        """Returns the number of the block at the head of the chain
+        """
+        request = ClientBlockListRequest(
+            paging=ClientPagingControls(limit=1))
+        response_future = self._stream.send(
+            Message.CLIENT_BLOCK_LIST_REQUEST,
+            request.SerializeToString())
+        response = ClientBlockListResponse()
+        response.ParseFromString(response_future.result().content)
+
+        if response.status != ClientBlockListResponse.OK:
+            raise RuntimeError(
+                'Block list request failed with status: {}'.format(
+                    ClientBlockListResponse.Status.Name(response.status)))
 
-            event_list = EventList()
-            event_list.ParseFromString(message_future.result().content)
-            for handler in self._event_handlers:
-                handler(event_list.events)
+        header = BlockHeader()
+        header.ParseFromString(response.blocks[0].header)
+        return header.block_num
 
     def stop(self):
         """Stops the Subscriber, unsubscribing from state delta events and
@@ -0,0 +1,254 @@
+"""Stateless checks of BEV payloads, shared by the REST API and the
+transaction processor.
+
+The REST API runs them before signing a transaction, so that a request the
+processor would reject never reaches the validator, and the processor runs
+the same code before applying a transaction. Everything that depends on
+state (whether the election exists, is open, or the voter is registered)
+is still only checked by the processor.
+"""
+import datetime
+import time
+
+from simple_supply_addressing import addresser
+
+from simple_supply_protobuf import election_pb2
+from simple_supply_protobuf import payload_pb2
+
+
+# Seconds a transaction timestamp may be ahead of the local clock
+SYNC_TOLERANCE = 60 * 5
+
+# Length of the hex form of a compressed secp256k1 public key
+PUBLIC_KEY_LENGTH = 66
+
+# The field of the data oneof that carries each action, which is the action
+# name in lower case
+DATA_FIELDS = {
+    action.number: action.name.lower()
+    for action in
+    payload_pb2.BevPayload.DESCRIPTOR.enum_types_by_name['Action'].values
+    if action.name.lower() in
+    payload_pb2.BevPayload.DESCRIPTOR.fields_by_name
+}
+
+
+class ValidationError(ValueError):
+    """Raised when a payload can never be applied, whatever the state"""
+
+
+def validate_payload(payload, family_version, now=None):
+    """Checks the shape of a payload and the ranges of its fields
+
+    Args:
+        payload (payload_pb2.BevPayload): The parsed payload
+        family_version (str): The family version the transaction is sent
+            with
+        now (int): Unix UTC timestamp to compare the payload timestamp
+            with, the local clock by default
+
+    Raises:
+        ValidationError: If the payload is invalid
+    """
+    validate_timestamp(payload.timestamp, now)
+
+    try:
+        validate_data = _VALIDATORS[payload.action]
+    except KeyError as err:
+        raise ValidationError('Unhandled action') from err
+
+    field = payload.WhichOneof('data')
+    if field is None or field != DATA_FIELDS.get(payload.action):
+        raise ValidationError('Action does not match payload data')
+
+    validate_data(
+        getattr(payload, field),
+        family_version != addresser.LEGACY_FAMILY_VERSION)
+
+
+def validate_timestamp(timestamp, now=None):
+    """Validates that the client submitted timestamp for a transaction is not
+    greater than current time, within a tolerance defined by SYNC_TOLERANCE
+
+    NOTE: Timestamp validation can be challenging since the machines that are
+    submitting and validating transactions may have different system times
+    """
+    if now is None:
+        dts = datetime.datetime.utcnow()
+        now = round(time.mktime(dts.timetuple()) + dts.microsecond / 1e6)
+    if (timestamp - now) > SYNC_TOLERANCE:
+        raise ValidationError(
+            'Timestamp must be less than local time.'
+            ' Expected {0} in ({1}-{2}, {1}+{2})'.format(
+                timestamp, now, SYNC_TOLERANCE))
+
+
+def _validate_election(data, _compact):
+    _require(data, 'election_id')
+    _validate_enum(data, 'results_permission')
+    _validate_enum(data, 'multiple_options_criteria')
+
+    if data.start_timestamp > data.end_timestamp:
+        raise ValidationError('Election with the election id {} ends before '
+                              'it starts'.format(data.election_id))
+
+    criteria = data.multiple_options_criteria
+    if criteria in (election_pb2.Election.AT_LEAST,
+                    election_pb2.Election.EQUAL_TO,
+                    election_pb2.Election.BETWEEN) \
+            and data.multiple_options_value_min < 1:
+        raise ValidationError('Multiple options criteria {} needs a '
+                              'minimum of at least 1'.format(criteria))
+    if criteria in (election_pb2.Election.AT_MOST,
+                    election_pb2.Election.BETWEEN) \
+            and data.multiple_options_value_max < \
+            max(data.multiple_options_value_min, 1):
+        raise ValidationError('Multiple options criteria {} needs a '
+                              'maximum of at least the minimum and '
+                              '1'.format(criteria))
+
+
+def _validate_create_voting_option(data, compact):
+    _validate_voting_option(data, compact)
+    # The election of version 0.2 indexes the option by its binary ID
+    if compact:
+        _validate_hex_id(data.voting_option_id)
+
+
+def _validate_voting_option(data, _compact):
+    _require(data, 'voting_option_id', 'election_id')
+
+
+def _validate_poll_registration(data, _compact):
+    _require(data, 'voter_id', 'election_id')
+
+
+def _validate_election_bundle(data, compact):
+    election = data.election
+    _validate_election(election, compact)
+
+    for voting_option in data.voting_options:
+        _validate_create_voting_option(voting_option, compact)
+        if voting_option.election_id != election.election_id:
+            raise ValidationError('Voting option {} does not belong to '
+                                  'the election {}'.format(
+                                      voting_option.voting_option_id,
+                                      election.election_id))
+
+    for poll_registration in data.poll_registrations:
+        _validate_poll_registration(poll_registration, compact)
+        if poll_registration.election_id != election.election_id:
+            raise ValidationError('Poll registration of {} does not '
+                                  'belong to the election {}'.format(
+                                      poll_registration.voter_id,
+                                      election.election_id))
+
+
+def _validate_bulk_poll_registrations(data, compact):
+    for poll_registration in data.poll_registrations:
+        _validate_poll_registration(poll_registration, compact)
+
+
+def _validate_voter(data, _compact):
+    _require(data, 'voter_id', 'public_key')
+    _validate_enum(data, 'type')
+
+    try:
+        bytes.fromhex(data.public_key)
+    except ValueError as err:
+        raise ValidationError('{} is not a hex public key'.format(
+            data.public_key)) from err
+    if len(data.public_key) != PUBLIC_KEY_LENGTH:
+        raise ValidationError('Public key {} is not {} characters '
+                              'long'.format(data.public_key,
+                                            PUBLIC_KEY_LENGTH))
+
+
+def _validate_create_vote(data, compact):
+    _require(data, 'voter_id')
+    _validate_vote(data, compact)
+
+
+def _validate_vote(data, compact):
+    if compact:
+        for field in ('vote_uuid', 'election_uuid'):
+            if len(getattr(data, field)) != addresser.ID_LENGTH:
+                raise ValidationError(
+                    'Ballots of family version {} need {}-byte vote and '
+                    'election IDs'.format(addresser.FAMILY_VERSION,
+                                          addresser.ID_LENGTH))
+        choices = list(data.voting_option_indexes)
+    else:
+        _require(data, 'vote_id', 'election_id')
+        choices = list(data.voting_option_ids) or [data.voting_option_id]
+        if not all(choices):
+            raise ValidationError('Ballot picks a voting option without '
+                                  'an ID')
+
+    if len(set(choices)) != len(choices):
+        raise ValidationError('Ballot picks the same voting option more '
+                              'than once')
+
+
+def _validate_finalize_election(data, _compact):
+    _require(data, 'election_id')
+
+
+def _validate_count_legacy_ballots(data, _compact):
+    _require(data, 'election_id', 'ballots')
+
+    voter_ids = set()
+    for ballot in data.ballots:
+        _require(ballot, 'vote_id', 'voter_id')
+        if ballot.voter_id in voter_ids:
+            raise ValidationError('Voter {} has more than one ballot in the '
+                                  'election {}'.format(ballot.voter_id,
+                                                       data.election_id))
+        voter_ids.add(ballot.voter_id)
+
+
+def _require(data, *fields):
+    for field in fields:
+        if not getattr(data, field):
+            raise ValidationError('{} requires a {}'.format(
+                data.DESCRIPTOR.name, field))
+
+
+def _validate_enum(data, field):
+    value = getattr(data, field)
+    enum_type = data.DESCRIPTOR.fields_by_name[field].enum_type
+    if value not in enum_type.values_by_number:
+        raise ValidationError('{} is not a valid {}'.format(
+            value, enum_type.name))
+
+
+def _validate_hex_id(identifier):
+    try:
+        addresser.pack_id(identifier)
+    except ValueError as err:
+        raise ValidationError('{} is not a {}-byte hex ID'.format(
+            identifier, addresser.ID_LENGTH)) from err
+
+
+# The checks of the data of each action the processor handles
+_VALIDATORS = {
+    payload_pb2.BevPayload.CREATE_ELECTION: _validate_election,
+    payload_pb2.BevPayload.CREATE_VOTING_OPTION:
+        _validate_create_voting_option,
+    payload_pb2.BevPayload.CREATE_POLL_REGISTRATION:
+        _validate_poll_registration,
+    payload_pb2.BevPayload.CREATE_VOTER: _validate_voter,
+    payload_pb2.BevPayload.CREATE_VOTE: _validate_create_vote,
+    payload_pb2.BevPayload.UPDATE_VOTE: _validate_vote,
+    payload_pb2.BevPayload.UPDATE_ELECTION: _validate_election,
+    payload_pb2.BevPayload.UPDATE_VOTER: _validate_voter,
+    payload_pb2.BevPayload.UPDATE_VOTING_OPTION: _validate_voting_option,
+    payload_pb2.BevPayload.UPDATE_POLL_REGISTRATION:
+        _validate_poll_registration,
+    payload_pb2.BevPayload.CREATE_ELECTION_BUNDLE: _validate_election_bundle,
+    payload_pb2.BevPayload.BULK_CREATE_POLL_REGISTRATIONS:
+        _validate_bulk_poll_registrations,
+    payload_pb2.BevPayload.FINALIZE_ELECTION: _validate_finalize_election,
+    payload_pb2.BevPayload.COUNT_LEGACY_BALLOTS:
+        _validate_count_legacy_ballots,
+}